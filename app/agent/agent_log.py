@@ -0,0 +1,106 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AgentLogWriter:
+    # JSONL log written by a background task. log() never blocks: records go
+    # on a bounded queue and are dropped (and counted) when it is full, so a
+    # slow disk can't stall a live call. Files roll over daily and by size.
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        prefix: str = "agent_log",
+        max_bytes: int = 10 * 1024 * 1024,
+        queue_size: int = 10000,
+        batch_size: int = 200,
+        flush_interval: float = 0.5,
+    ):
+        self.directory = directory or os.getenv("AGENT_LOG_DIR", "logs")
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"written": 0, "dropped": 0, "batches": 0}
+
+    def log(self, record: dict) -> bool:
+        if self._task is None or self._task.done():
+            try:
+                self._start()
+            except RuntimeError:
+                # No running event loop, nothing to hand the write to
+                self.stats["dropped"] += 1
+                return False
+        record = {"ts": datetime.now().isoformat(timespec="milliseconds"), **record}
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            return False
+
+    async def stop(self):
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    def _start(self):
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(self.queue_size)
+        self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while batch[-1] is not None and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            closing = batch[-1] is None
+            records = [r for r in batch if r is not None]
+            if records:
+                lines = [json.dumps(r, default=str) + "\n" for r in records]
+                try:
+                    await asyncio.to_thread(self._write, lines)
+                    self.stats["written"] += len(records)
+                    self.stats["batches"] += 1
+                except Exception as e:
+                    self.stats["dropped"] += len(records)
+                    logger.error(f"Failed to write agent log batch: {e}")
+            if closing:
+                return
+
+    def _write(self, lines: List[str]):
+        os.makedirs(self.directory, exist_ok=True)
+        current_date = datetime.now().strftime("%Y-%m-%d")
+        path = os.path.join(self.directory, f"{self.prefix}_{current_date}.jsonl")
+        try:
+            if os.path.getsize(path) >= self.max_bytes:
+                index = 1
+                while os.path.exists(f"{path}.{index}"):
+                    index += 1
+                os.rename(path, f"{path}.{index}")
+        except FileNotFoundError:
+            pass
+        with open(path, "a") as log_file:
+            log_file.writelines(lines)
+
+
+agent_log = AgentLogWriter()
@@ -0,0 +1,259 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Callable, Deque, Dict, List, Optional
+
+from playwright.async_api import Browser, BrowserContext, Page, async_playwright
+
+logger = logging.getLogger(__name__)
+
+START_URL = "https://collectivai.atlassian.net/jira/software/projects/KAN/boards/1"
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class _Slot:
+    def __init__(self, context: BrowserContext, page: Page):
+        self.context = context
+        self.page = page
+        self.last_used = time.monotonic()
+
+
+class BrowserPool:
+    # Each checkout gets its own isolated context and tab. Requests beyond
+    # max_size queue for up to acquire_timeout seconds instead of sharing.
+
+    def __init__(
+        self,
+        start_url: str = START_URL,
+        min_size: int = 1,
+        max_size: int = 4,
+        acquire_timeout: float = 30.0,
+        idle_timeout: float = 300.0,
+        health_interval: float = 30.0,
+        headless: bool = False,
+        init_scripts: Optional[List[str]] = None,
+        on_page: Optional[Callable[[Page], None]] = None,
+    ):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min={min_size}, max={max_size}")
+        self.start_url = start_url
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.idle_timeout = idle_timeout
+        self.health_interval = health_interval
+        self.headless = headless
+        self.init_scripts = list(init_scripts or [])
+        # Called for every page a pooled context opens, new tabs included,
+        # before the page has loaded anything
+        self.on_page = on_page
+
+        self._playwright = None
+        self._browser: Optional[Browser] = None
+        self._idle: Deque[_Slot] = deque()
+        self._in_use: Dict[Page, _Slot] = {}
+        self._size = 0
+        self._cond = asyncio.Condition()
+        self._maintenance_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, **overrides):
+        settings = {
+            "min_size": int(os.getenv("BROWSER_POOL_MIN", "1")),
+            "max_size": int(os.getenv("BROWSER_POOL_MAX", "4")),
+            "acquire_timeout": float(os.getenv("BROWSER_POOL_ACQUIRE_TIMEOUT", "30")),
+            "idle_timeout": float(os.getenv("BROWSER_POOL_IDLE_TIMEOUT", "300")),
+            "health_interval": float(os.getenv("BROWSER_POOL_HEALTH_INTERVAL", "30")),
+            "headless": os.getenv("BROWSER_HEADLESS", "false").lower() == "true",
+        }
+        settings.update(overrides)
+        return cls(**settings)
+
+    @property
+    def stats(self):
+        return {
+            "size": self._size,
+            "idle": len(self._idle),
+            "in_use": len(self._in_use),
+        }
+
+    async def start(self):
+        if self._browser is not None:
+            return
+        self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch(headless=self.headless)
+        await self._fill_to_min()
+        self._maintenance_task = asyncio.create_task(self._maintenance_loop())
+
+    async def stop(self):
+        if self._maintenance_task:
+            self._maintenance_task.cancel()
+            try:
+                await self._maintenance_task
+            except asyncio.CancelledError:
+                pass
+            self._maintenance_task = None
+        slots = list(self._idle) + list(self._in_use.values())
+        self._idle.clear()
+        self._in_use.clear()
+        self._size = 0
+        for slot in slots:
+            await self._close_slot(slot)
+        if self._browser:
+            await self._browser.close()
+            self._browser = None
+        if self._playwright:
+            await self._playwright.stop()
+            self._playwright = None
+
+    async def acquire(self, timeout: Optional[float] = None) -> Page:
+        timeout = self.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            slot = None
+            create = False
+            async with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeoutError(
+                            f"No browser context available after {timeout}s ({self.stats})"
+                        )
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+                if self._idle:
+                    slot = self._idle.pop()
+                else:
+                    self._size += 1
+                    create = True
+
+            if create:
+                try:
+                    slot = await self._new_slot()
+                except Exception:
+                    await self._discard()
+                    raise
+            elif not await self._is_healthy(slot):
+                logger.warning("Recycling unhealthy browser context on checkout")
+                await self._close_slot(slot)
+                await self._discard()
+                continue
+
+            self._in_use[slot.page] = slot
+            return slot.page
+
+    async def release(self, page: Page):
+        slot = self._in_use.pop(page, None)
+        if slot is None:
+            return
+        healthy = await self._is_healthy(slot)
+        if healthy:
+            try:
+                for extra in slot.context.pages:
+                    if extra is not slot.page:
+                        await extra.close()
+                # Reset the tab so the next session starts from a clean board
+                await slot.page.goto(self.start_url)
+            except Exception as e:
+                logger.warning(f"Failed to reset browser context: {e}")
+                healthy = False
+        if not healthy:
+            await self._close_slot(slot)
+            await self._discard()
+            return
+        slot.last_used = time.monotonic()
+        async with self._cond:
+            self._idle.append(slot)
+            self._cond.notify()
+
+    @asynccontextmanager
+    async def page(self, timeout: Optional[float] = None):
+        page = await self.acquire(timeout)
+        try:
+            yield page
+        finally:
+            await self.release(page)
+
+    async def _new_slot(self) -> _Slot:
+        context = await self._browser.new_context()
+        try:
+            for script in self.init_scripts:
+                await context.add_init_script(script=script)
+            if self.on_page is not None:
+                context.on("page", self.on_page)
+            page = await context.new_page()
+            await page.goto(self.start_url)
+        except Exception:
+            await context.close()
+            raise
+        return _Slot(context, page)
+
+    async def _close_slot(self, slot: _Slot):
+        try:
+            await slot.context.close()
+        except Exception as e:
+            logger.debug(f"Error closing browser context: {e}")
+
+    async def _discard(self):
+        async with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    async def _is_healthy(self, slot: _Slot) -> bool:
+        if slot.page.is_closed():
+            return False
+        try:
+            await asyncio.wait_for(slot.page.evaluate("1"), 5)
+            return True
+        except Exception:
+            return False
+
+    async def _fill_to_min(self):
+        while True:
+            async with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                slot = await self._new_slot()
+            except Exception as e:
+                logger.error(f"Failed to pre-warm browser context: {e}")
+                await self._discard()
+                return
+            async with self._cond:
+                self._idle.append(slot)
+                self._cond.notify()
+
+    async def _maintenance_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self._evict_and_check()
+                await self._fill_to_min()
+            except Exception as e:
+                logger.error(f"Browser pool maintenance failed: {e}")
+
+    async def _evict_and_check(self):
+        # Slots stay idle while they are checked, so acquire can still hand
+        # them out; one checked out meanwhile is left to its new owner
+        now = time.monotonic()
+        for slot in list(self._idle):
+            last_used = slot.last_used
+            # Idle too long, unless that would leave fewer than min_size
+            expired = now - last_used > self.idle_timeout and self._size > self.min_size
+            if not expired and await self._is_healthy(slot):
+                continue
+            async with self._cond:
+                if slot not in self._idle or slot.last_used != last_used:
+                    continue
+                self._idle.remove(slot)
+            await self._close_slot(slot)
+            await self._discard()
@@ -0,0 +1,96 @@
+import asyncio
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import httpx
+from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+
+class Clients:
+    # Process-wide API clients. One async OpenAI client over a shared,
+    # keep-alive httpx pool instead of a client (and pool) per call, plus a
+    # bounded thread pool for SDK calls that only exist in sync form.
+    # Started and stopped by the app lifespan; created lazily if used before.
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive: int = 20,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 60.0,
+        sync_workers: int = 8,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(timeout, connect=10.0)
+        self.sync_workers = sync_workers
+        self._http: Optional[httpx.AsyncClient] = None
+        self._openai: Optional[AsyncOpenAI] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._sync_slots: Optional[asyncio.Semaphore] = None
+        self.stats = {"sync_calls": 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+            max_keepalive=int(os.getenv("HTTP_MAX_KEEPALIVE", "20")),
+            keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30")),
+            timeout=float(os.getenv("HTTP_TIMEOUT", "60")),
+            sync_workers=int(os.getenv("SYNC_CALL_WORKERS", "8")),
+        )
+
+    async def start(self):
+        self._ensure_started()
+        logger.info(f"Shared HTTP pool ready: {self.limits}")
+
+    async def stop(self):
+        if self._http is not None:
+            await self._http.aclose()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._http = self._openai = self._executor = self._sync_slots = None
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        self._ensure_started()
+        return self._http
+
+    @property
+    def openai(self) -> AsyncOpenAI:
+        # Built on first use, so code that only wants the pool doesn't need
+        # OPENAI_API_KEY
+        self._ensure_started()
+        if self._openai is None:
+            self._openai = AsyncOpenAI(
+                organization=os.getenv("OPENAI_ORGANIZATION_ID"),
+                http_client=self._http,
+            )
+        return self._openai
+
+    async def run_sync(self, fn, *args, **kwargs):
+        # At most sync_workers calls hold a thread; the rest wait here on the
+        # event loop rather than piling up in the executor's queue
+        self._ensure_started()
+        async with self._sync_slots:
+            self.stats["sync_calls"] += 1
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    def _ensure_started(self):
+        if self._http is None:
+            self._http = httpx.AsyncClient(limits=self.limits, timeout=self.timeout)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.sync_workers, thread_name_prefix="sync-sdk")
+            self._sync_slots = asyncio.Semaphore(self.sync_workers)
+
+
+clients = Clients.from_env()
@@ -0,0 +1,340 @@
+import hashlib
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+from operator import itemgetter
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+# The labelling outputs are read by the training code that writes them
+sys.path.insert(0, os.path.join(script_dir, "../../train"))
+
+from dataset import load_flows
+
+logger = logging.getLogger(__name__)
+
+STOP_WORDS = {
+    "a", "an", "the", "and", "or", "to", "in", "on", "of", "for", "with", "at", "by", "from", "into", "as",
+    "me", "my", "i", "you", "your", "we", "our", "it", "its", "this", "that", "these", "those", "there",
+    "is", "are", "be", "can", "could", "would", "will", "do", "want", "need", "like", "some", "all", "up",
+    "new", "na", "please", "how",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    # CamelCase flow names ("CreateEmail") split into words
+    text = re.sub(r"(?<=[a-z0-9])(?=[A-Z])", " ", text)
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if t not in STOP_WORDS]
+
+
+def flow_text(name: str, actions: List[dict]) -> str:
+    # The name says what the flow does, so it counts twice
+    elements = " ".join(str(a.get("element", "")) for a in actions if isinstance(a, dict))
+    return f"{name} {name} {elements}"
+
+
+class BM25Backend:
+    # TF-IDF family (BM25) over an inverted index. Postings hold each flow's
+    # precomputed term weight and are mirrored into numpy arrays, so a lookup
+    # is one vectorised multiply-add per term of the task. Adding or removing
+    # a flow only touches its own terms, whose arrays are rebuilt on the next
+    # lookup. Weights depend on the average flow length and are recomputed
+    # when it drifts by more than reweight_drift.
+    name = "bm25"
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, reweight_drift: float = 0.1):
+        self.k1 = k1
+        self.b = b
+        self.reweight_drift = reweight_drift
+        self.terms: Dict[str, Dict[str, int]] = {}
+        self.postings: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self.total_length = 0
+        # Row of each flow in the score vector; rows of removed flows stay unused
+        self.rows: Dict[str, int] = {}
+        self.row_docs: List[str] = []
+        self._arrays: Dict[str, tuple] = {}
+        self._weighted_average = None
+
+    def _average(self) -> float:
+        return self.total_length / len(self.terms) if self.terms else 1.0
+
+    def _weight(self, tf: int, length: int, average: float) -> float:
+        return tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / (average or 1.0)))
+
+    def _index(self, doc: str, counts: Dict[str, int]):
+        if doc not in self.rows:
+            self.rows[doc] = len(self.row_docs)
+            self.row_docs.append(doc)
+        length = sum(counts.values())
+        for term, tf in counts.items():
+            self.postings[term][doc] = self._weight(tf, length, self._weighted_average)
+            self._arrays.pop(term, None)
+
+    def _reweight(self):
+        self._weighted_average = self._average()
+        self.postings = defaultdict(dict)
+        self._arrays = {}
+        for doc, counts in self.terms.items():
+            self._index(doc, counts)
+
+    def _posting_arrays(self, term: str):
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            posting = self.postings[term]
+            arrays = self._arrays[term] = (
+                np.fromiter((self.rows[doc] for doc in posting), dtype=np.int32, count=len(posting)),
+                np.fromiter(posting.values(), dtype=np.float32, count=len(posting)),
+            )
+        return arrays
+
+    def add(self, doc: str, text: str):
+        counts = dict(Counter(tokenize(text)))
+        self.terms[doc] = counts
+        self.total_length += sum(counts.values())
+        if self._weighted_average is None:
+            self._weighted_average = self._average()
+        self._index(doc, counts)
+
+    def remove(self, doc: str, text: str):
+        counts = self.terms.pop(doc, {})
+        for term in counts:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(doc, None)
+                self._arrays.pop(term, None)
+                if not posting:
+                    del self.postings[term]
+        self.total_length -= sum(counts.values())
+
+    def _idf(self, df: int) -> float:
+        n = len(self.terms)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def max_score(self, text: str) -> float:
+        # The best score any flow could get for the task: each term at its
+        # highest weight in the index. Terms no flow has count at the highest
+        # idf, so a task sharing one common word with a flow scores a small
+        # fraction of this.
+        total = 0.0
+        for term in set(tokenize(text)):
+            posting = self.postings.get(term)
+            if not posting:
+                total += self._idf(0)
+            else:
+                total += self._idf(len(posting)) * float(self._posting_arrays(term)[1].max())
+        return total
+
+    def search(self, text: str, k: int):
+        if not self.terms:
+            return []
+        if abs(self._average() - self._weighted_average) > self.reweight_drift * self._weighted_average:
+            self._reweight()
+        scores = np.zeros(len(self.row_docs), dtype=np.float32)
+        matched = []
+        for term in set(tokenize(text)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = self._idf(len(posting))
+            rows, weights = self._posting_arrays(term)
+            scores[rows] += idf * weights
+            matched.append(rows)
+        if not matched:
+            return []
+        # Rank only the flows sharing a term with the task
+        candidates = np.unique(np.concatenate(matched))
+        k = min(k, len(candidates))
+        top = candidates[np.argpartition(scores[candidates], -k)[-k:]]
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(self.row_docs[row], float(scores[row])) for row in top]
+
+    def state(self) -> dict:
+        return {"terms": self.terms}
+
+    def restore(self, state: dict):
+        self.terms = state["terms"]
+        self.total_length = sum(sum(counts.values()) for counts in self.terms.values())
+        self.rows = {}
+        self.row_docs = []
+        self._reweight()
+
+
+class EmbeddingBackend:
+    # Cosine similarity over vectors from any embedding function taking a
+    # list of texts. Brute force, fine for a few thousand flows.
+    name = "embedding"
+
+    def __init__(self, embed: Callable[[List[str]], List[Sequence[float]]]):
+        self.embed = embed
+        self.vectors: Dict[str, List[float]] = {}
+
+    @staticmethod
+    def _normalize(vector) -> List[float]:
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    def add(self, doc: str, text: str):
+        self.vectors[doc] = self._normalize(self.embed([text])[0])
+
+    def remove(self, doc: str, text: str):
+        self.vectors.pop(doc, None)
+
+    def max_score(self, text: str) -> float:
+        # Cosine similarity is already on a fixed scale
+        return 1.0
+
+    def search(self, text: str, k: int):
+        query = self._normalize(self.embed([text])[0])
+        scores = ((doc, sum(a * b for a, b in zip(query, vector))) for doc, vector in self.vectors.items())
+        return heapq.nlargest(k, scores, key=itemgetter(1))
+
+    def state(self) -> dict:
+        return {"vectors": self.vectors}
+
+    def restore(self, state: dict):
+        self.vectors = state["vectors"]
+
+
+def describe_action(action: dict) -> str:
+    action_type = action.get("action_type", "")
+    element = action.get("element", "")
+    element_type = action.get("element_type", "")
+    value = str(action.get("value", "NA"))
+    if action_type == "input":
+        line = f'In the "{element}" {element_type}, enter the {element}'
+        return line + (f' (last time: "{value}").' if value != "NA" else ".")
+    if action_type in ("click", "doubleClick", "rightClick"):
+        return f'Click the "{element}" {element_type}.'
+    if action_type == "selection":
+        return f'Select "{value}" in the "{element}" {element_type}.'
+    return f'{action_type} on the "{element}" {element_type}.'
+
+
+class FlowIndex:
+    # Known user flows ({name: actions}, as written by train/train.py) held in
+    # memory with a JSON snapshot on disk. refresh() brings the index up to
+    # date with the source files, re-indexing only flows that changed. Scores
+    # are relative to the backend's max_score for the task, so min_score is a
+    # fraction of a perfect match rather than a raw BM25 value.
+
+    def __init__(
+        self,
+        backend=None,
+        sources: Sequence[str] = (),
+        snapshot_path: Optional[str] = None,
+        min_score: float = 0.45,
+    ):
+        self.backend = backend or BM25Backend()
+        self.sources = list(sources)
+        self.snapshot_path = snapshot_path
+        self.min_score = min_score
+        self.flows: Dict[str, dict] = {}
+        self.stats = {"flows": 0, "lookups": 0, "hits": 0, "lookup_ms": 0.0}
+
+    @classmethod
+    def from_env(cls):
+        default_source = os.path.join(script_dir, "../../train/model_outputs.json")
+        sources = [s for s in os.getenv("FLOW_INDEX_SOURCES", default_source).split(",") if s]
+        return cls(
+            sources=sources,
+            snapshot_path=os.getenv("FLOW_INDEX_SNAPSHOT", os.path.join(script_dir, "flow_index.json")),
+            min_score=float(os.getenv("FLOW_HINT_MIN_SCORE", "0.45")),
+        )
+
+    @staticmethod
+    def _hash(actions: List[dict]) -> str:
+        return hashlib.sha1(json.dumps(actions, sort_keys=True).encode()).hexdigest()
+
+    def add(self, name: str, actions: List[dict]) -> bool:
+        digest = self._hash(actions)
+        current = self.flows.get(name)
+        if current is not None:
+            if current["hash"] == digest:
+                return False
+            self.remove(name)
+        self.backend.add(name, flow_text(name, actions))
+        self.flows[name] = {"hash": digest, "actions": actions}
+        self.stats["flows"] = len(self.flows)
+        return True
+
+    def remove(self, name: str):
+        flow = self.flows.pop(name, None)
+        if flow is not None:
+            self.backend.remove(name, flow_text(name, flow["actions"]))
+            self.stats["flows"] = len(self.flows)
+
+    def sync(self, flows: Dict[str, List[dict]]) -> int:
+        # Returns how many flows were added, changed or removed
+        changed = sum(self.add(name, actions) for name, actions in flows.items())
+        for name in [name for name in self.flows if name not in flows]:
+            self.remove(name)
+            changed += 1
+        return changed
+
+    def refresh(self):
+        if not self.flows and self.snapshot_path and os.path.exists(self.snapshot_path):
+            self.load(self.snapshot_path)
+        flows = {}
+        read = 0
+        for source in self.sources:
+            if not os.path.exists(source):
+                continue
+            try:
+                flows.update(load_flows(source))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping flow source {source}: {e}")
+                continue
+            read += 1
+        # Without any source the snapshot is all there is, so keep it
+        changed = self.sync(flows) if read else 0
+        if changed and self.snapshot_path:
+            self.save(self.snapshot_path)
+        logger.info(f"Flow index has {len(self.flows)} flows, {changed} changed")
+
+    def lookup(self, task: str) -> Optional[dict]:
+        start = time.perf_counter()
+        results = self.backend.search(task, 1)
+        score = results[0][1] / (self.backend.max_score(task) or 1.0) if results else 0.0
+        self.stats["lookups"] += 1
+        self.stats["lookup_ms"] += (time.perf_counter() - start) * 1000
+        if score < self.min_score:
+            return None
+        self.stats["hits"] += 1
+        name = results[0][0]
+        return {"name": name, "score": score, "actions": self.flows[name]["actions"]}
+
+    def with_plan(self, task: str) -> str:
+        # The task, followed by the closest known flow's steps as a hint
+        match = self.lookup(task)
+        if match is None:
+            return task
+        plan = "\n".join(describe_action(a) for a in match["actions"] if isinstance(a, dict))
+        return (
+            f"{task}\nHere is a helpful action plan from a similar known flow ({match['name']}):\n{plan}"
+        )
+
+    def save(self, path: str):
+        snapshot = {"backend": self.backend.name, "flows": self.flows, "state": self.backend.state()}
+        with open(path + ".tmp", "w") as f:
+            json.dump(snapshot, f)
+        os.replace(path + ".tmp", path)
+
+    def load(self, path: str):
+        with open(path) as f:
+            snapshot = json.load(f)
+        if snapshot.get("backend") != self.backend.name:
+            logger.info(f"Ignoring {snapshot.get('backend')} snapshot for a {self.backend.name} index")
+            return
+        self.flows = snapshot["flows"]
+        self.backend.restore(snapshot["state"])
+        self.stats["flows"] = len(self.flows)
+
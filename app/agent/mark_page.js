@@ -1,4 +1,4 @@
-const customCSS = `
+var customCSS = `
     ::-webkit-scrollbar {
         width: 10px;
     }
@@ -14,11 +14,18 @@ const customCSS = `
     }
 `;
 
-const styleTag = document.createElement('style');
-styleTag.textContent = customCSS;
-document.head.append(styleTag);
+// Registered as an init script, so this can run before <head> exists
+function injectCustomCSS() {
+  if (document.getElementById('mark-page-style') || !document.head) {
+    return;
+  }
+  var styleTag = document.createElement('style');
+  styleTag.id = 'mark-page-style';
+  styleTag.textContent = customCSS;
+  document.head.append(styleTag);
+}
 
-let labels = [];
+var labels = labels || [];
 
 function unmarkPage() {
   // Unmark page logic
@@ -147,9 +154,13 @@ function unmarkPage() {
 //   return coordinates;
 // }
 
-function markPage() {
-  unmarkPage();
+var interactableTags = ['INPUT', 'TEXTAREA', 'SELECT', 'BUTTON', 'A'];
 
+// Single pass over the DOM in document order. Each element's computed style
+// is read once, subtrees under display:none are skipped (nothing inside can
+// have a box), and nested interactables are dropped by tracking whether an
+// ancestor was already collected, instead of comparing every pair.
+function collectItems(root) {
   var vw = Math.max(
     document.documentElement.clientWidth || 0,
     window.innerWidth || 0
@@ -159,72 +170,90 @@ function markPage() {
     window.innerHeight || 0
   );
 
-  function isVisible(element) {
-    const style = window.getComputedStyle(element);
-    const rect = element.getBoundingClientRect();
-    return (
-      style.display !== 'none' &&
+  var items = [];
+  // Elements that are an item or sit inside one
+  var covered = new Set();
+  var walker = document.createTreeWalker(root, NodeFilter.SHOW_ELEMENT);
+  var element = walker.currentNode;
+
+  while (element) {
+    var style = window.getComputedStyle(element);
+    if (style.display === 'none') {
+      element = nextOutsideSubtree(walker, root);
+      continue;
+    }
+
+    var isItem = false;
+    if (
       style.visibility !== 'hidden' &&
       parseFloat(style.opacity) > 0 &&
-      rect.width > 0 &&
-      rect.height > 0 &&
-      rect.top < vh &&
-      rect.bottom > 0 &&
-      rect.left < vw &&
-      rect.right > 0
-    );
-  }
+      (interactableTags.includes(element.tagName) ||
+        element.onclick != null ||
+        style.cursor === 'pointer' ||
+        element.getAttribute('role') === 'button' ||
+        (element.tagName === 'DIV' && element.getAttribute('tabindex') === '0'))
+    ) {
+      var rect = element.getBoundingClientRect();
+      isItem =
+        rect.width > 0 &&
+        rect.height > 0 &&
+        rect.top < vh &&
+        rect.bottom > 0 &&
+        rect.left < vw &&
+        rect.right > 0 &&
+        rect.width * rect.height >= 20;
+    }
 
-  function isInteractable(element) {
-    const interactableTags = ['INPUT', 'TEXTAREA', 'SELECT', 'BUTTON', 'A'];
-    const style = window.getComputedStyle(element);
-    return (
-      interactableTags.includes(element.tagName) ||
-      element.onclick != null ||
-      style.cursor === 'pointer' ||
-      element.getAttribute('role') === 'button' ||
-      (element.tagName === 'DIV' && element.getAttribute('tabindex') === '0')
-    );
+    var insideItem = covered.has(element.parentElement);
+    if (isItem || insideItem) {
+      covered.add(element);
+    }
+    if (isItem && !insideItem) {
+      items.push({
+        element: element,
+        area: rect.width * rect.height,
+        rect: rect,
+        text: element.textContent.trim().replace(/\s{2,}/g, ' '),
+        type: element.tagName.toLowerCase(),
+        ariaLabel: element.getAttribute('aria-label') || '',
+      });
+    }
+    element = walker.nextNode();
   }
+  return items;
+}
 
-  var allElements = document.querySelectorAll('*');
-
-  var items = Array.from(allElements)
-    .filter(isVisible)
-    .filter(isInteractable)
-    .map(function (element) {
-      var textualContent = element.textContent.trim().replace(/\s{2,}/g, ' ');
-      var elementType = element.tagName.toLowerCase();
-      var ariaLabel = element.getAttribute('aria-label') || '';
+function nextOutsideSubtree(walker, root) {
+  var node = walker.currentNode;
+  while (node && node !== root) {
+    var sibling = walker.nextSibling();
+    if (sibling) {
+      return sibling;
+    }
+    node = walker.parentNode();
+  }
+  return null;
+}
 
-      var rect = element.getBoundingClientRect();
-      var area = rect.width * rect.height;
+function markPage() {
+  injectCustomCSS();
+  installTracker();
+  unmarkPage();
+  resetTracker();
 
-      return {
-        element: element,
-        area: area,
-        rect: rect,
-        text: textualContent,
-        type: elementType,
-        ariaLabel: ariaLabel,
-      };
-    })
-    .filter((item) => item.area >= 20);
-
-  // Remove nested interactable elements
-  items = items.filter(
-    (item, index, self) =>
-      !self.some(
-        (other, otherIndex) =>
-          index !== otherIndex &&
-          other.element.contains(item.element) &&
-          isInteractable(other.element)
-      )
-  );
+  var items = collectItems(document.documentElement);
+  drawLabels(items);
+  return storeItems(items);
+}
 
+function drawLabels(items) {
   // Create bounding boxes
   items.forEach(function (item, index) {
+    if (!item) {
+      return;
+    }
     var newElement = document.createElement('div');
+    newElement.setAttribute('data-mark-page', '');
     var borderColor = getRandomColor();
     newElement.style.outline = `2px dashed ${borderColor}`;
     newElement.style.position = 'fixed';
@@ -251,18 +280,252 @@ function markPage() {
     document.body.appendChild(newElement);
     labels.push(newElement);
   });
+}
 
-  const coordinates = items.map((item) => ({
-    x: (item.rect.left + item.rect.right) / 2,
-    y: (item.rect.top + item.rect.bottom) / 2,
-    type: item.type,
-    text: item.text,
-    ariaLabel: item.ariaLabel,
-  }));
+function storeItems(items) {
+  window.__markPageItems = items;
+  window.__markPageId = Math.random().toString(36).slice(2);
+
+  const coordinates = items.map((item) =>
+    item
+      ? {
+          x: (item.rect.left + item.rect.right) / 2,
+          y: (item.rect.top + item.rect.bottom) / 2,
+          left: item.rect.left,
+          top: item.rect.top,
+          width: item.rect.width,
+          height: item.rect.height,
+          type: item.type,
+          text: item.text,
+          ariaLabel: item.ariaLabel,
+        }
+      : null
+  );
 
   return coordinates;
 }
 
+// Dirty tracking between annotations. Mutations, scrolls, resizes and form
+// state changes since the last markPage() decide whether the next annotation can be skipped
+// ('clean'), limited to the changed subtrees ('partial') or redone ('full').
+var MAX_DIRTY_ROOTS = 20;
+var markPageTracker = window.markPageTracker || {
+  observer: null,
+  full: true,
+  roots: [],
+};
+window.markPageTracker = markPageTracker;
+
+function installTracker() {
+  if (!markPageTracker.formEvents) {
+    // Typed values, checked boxes, select choices and focus rings change what
+    // the screenshot shows without producing any mutation record
+    ['input', 'change', 'focusin', 'focusout'].forEach(function (type) {
+      window.addEventListener(type, recordEvent, true);
+    });
+    markPageTracker.formEvents = true;
+  }
+  if (markPageTracker.observer) {
+    return;
+  }
+  var markFull = function () {
+    markPageTracker.full = true;
+  };
+  markPageTracker.observer = new MutationObserver(recordMutations);
+  markPageTracker.observer.observe(document.documentElement, {
+    subtree: true,
+    childList: true,
+    attributes: true,
+    characterData: true,
+  });
+  // Capture phase so scrolling inside any element is seen too
+  window.addEventListener('scroll', markFull, true);
+  window.addEventListener('resize', markFull);
+  markPageTracker.full = true;
+}
+
+function recordEvent(event) {
+  var target = event.target;
+  if (!target || target.nodeType !== 1) {
+    markPageTracker.full = true;
+  } else if (markPageTracker.roots.length < MAX_DIRTY_ROOTS) {
+    markPageTracker.roots.push(target);
+  } else {
+    markPageTracker.full = true;
+  }
+}
+
+function resetTracker() {
+  if (markPageTracker.observer) {
+    markPageTracker.observer.takeRecords();
+  }
+  markPageTracker.full = false;
+  markPageTracker.roots = [];
+}
+
+function isOwnNode(node) {
+  var element = node.nodeType === 1 ? node : node.parentElement;
+  return (
+    !!element &&
+    (element.id === 'mark-page-style' || !!element.closest('[data-mark-page]'))
+  );
+}
+
+function recordMutations(records) {
+  for (var record of records) {
+    if (isOwnNode(record.target)) {
+      continue;
+    }
+    if (
+      record.type === 'childList' &&
+      Array.from(record.addedNodes).every(isOwnNode) &&
+      Array.from(record.removedNodes).every(isOwnNode)
+    ) {
+      continue;
+    }
+    var root =
+      record.target.nodeType === 1 ? record.target : record.target.parentElement;
+    if (!root) {
+      markPageTracker.full = true;
+    } else if (markPageTracker.roots.length < MAX_DIRTY_ROOTS) {
+      markPageTracker.roots.push(root);
+    } else {
+      markPageTracker.full = true;
+    }
+  }
+}
+
+function markPageIncremental(lastId) {
+  injectCustomCSS();
+  installTracker();
+  recordMutations(markPageTracker.observer.takeRecords());
+
+  var prev = window.__markPageItems;
+  var current = prev && lastId && window.__markPageId === lastId;
+  if (!current || markPageTracker.full) {
+    return fullResult();
+  }
+  if (markPageTracker.roots.length === 0) {
+    return {
+      mode: 'clean',
+      id: window.__markPageId,
+      boxes: null,
+      viewport: viewportInfo(),
+    };
+  }
+
+  var roots = markPageTracker.roots;
+  resetTracker();
+  var items = relabel(prev, roots);
+  if (!items) {
+    return fullResult();
+  }
+  unmarkPage();
+  drawLabels(items);
+  var boxes = storeItems(items);
+  return {
+    mode: 'partial',
+    id: window.__markPageId,
+    boxes: boxes,
+    viewport: viewportInfo(),
+  };
+}
+
+function fullResult() {
+  var boxes = markPage();
+  return {
+    mode: 'full',
+    id: window.__markPageId,
+    boxes: boxes,
+    viewport: viewportInfo(),
+  };
+}
+
+function viewportInfo() {
+  return {
+    width: window.innerWidth,
+    height: window.innerHeight,
+    dpr: window.devicePixelRatio || 1,
+  };
+}
+
+// Re-collect only inside the dirty subtrees. Items outside them keep their
+// label index; items that disappeared leave a null slot and new ones are
+// appended. Returns null when a full pass is needed instead.
+function relabel(prev, dirtyRoots) {
+  var indexOf = new Map();
+  prev.forEach(function (item, index) {
+    if (item) {
+      indexOf.set(item.element, index);
+    }
+  });
+
+  var roots = [];
+  for (var root of dirtyRoots) {
+    if (!root.isConnected) {
+      // Its removal is recorded on a connected ancestor
+      continue;
+    }
+    if (root === document.documentElement || root === document.body) {
+      return null;
+    }
+    // A change inside a labelled element re-labels that element
+    for (var node = root; node; node = node.parentElement) {
+      if (indexOf.has(node)) {
+        root = node;
+        break;
+      }
+    }
+    roots.push(root);
+  }
+  // Keep only the outermost roots, once each
+  roots = roots.filter(function (root, index) {
+    return !roots.some(function (other, otherIndex) {
+      return other === root ? otherIndex < index : other.contains(root);
+    });
+  });
+
+  var items = [];
+  for (var item of prev) {
+    if (
+      !item ||
+      !item.element.isConnected ||
+      roots.some((root) => root.contains(item.element))
+    ) {
+      items.push(null);
+      continue;
+    }
+    var rect = item.element.getBoundingClientRect();
+    if (
+      rect.left !== item.rect.left ||
+      rect.top !== item.rect.top ||
+      rect.width !== item.rect.width ||
+      rect.height !== item.rect.height
+    ) {
+      // Layout moved outside the dirty region, so nothing can be reused
+      return null;
+    }
+    items.push(item);
+  }
+
+  for (var root of roots) {
+    for (var found of collectItems(root)) {
+      var index = indexOf.get(found.element);
+      if (index !== undefined && items[index] === null) {
+        items[index] = found;
+      } else {
+        items.push(found);
+      }
+    }
+  }
+
+  var holes = items.filter((item) => item === null).length;
+  if (holes * 2 > items.length) {
+    return null;
+  }
+  return items;
+}
+
 function getRandomColor() {
   var letters = '0123456789ABCDEF';
   var color = '#';
@@ -271,3 +534,69 @@ function getRandomColor() {
   }
   return color;
 }
+
+// Where to act on a label now, rather than where it was when the page was
+// marked. The element is taken from the registry storeItems() keeps, scrolled
+// into view if needed and hit-tested, so a label whose element moved is still
+// hit and one that was removed, hidden or covered is reported instead of
+// clicking whatever is at the old coordinates.
+function markPageResolve(label, markId) {
+  var items = window.__markPageItems;
+  if (!items || (markId && window.__markPageId !== markId)) {
+    return { status: 'stale', reason: 'the page was reloaded or re-marked' };
+  }
+  var item = items[label];
+  if (!item) {
+    return { status: 'stale', reason: 'no element has this label' };
+  }
+  var element = item.element;
+  if (!element.isConnected) {
+    return { status: 'stale', reason: 'the element was removed' };
+  }
+  var rect = element.getBoundingClientRect();
+  if (rect.width === 0 || rect.height === 0) {
+    return { status: 'stale', reason: 'the element is no longer visible' };
+  }
+
+  var scrolled = false;
+  if (
+    rect.top < 0 ||
+    rect.left < 0 ||
+    rect.bottom > window.innerHeight ||
+    rect.right > window.innerWidth
+  ) {
+    element.scrollIntoView({ block: 'center', inline: 'center', behavior: 'instant' });
+    rect = element.getBoundingClientRect();
+    scrolled = true;
+  }
+
+  // The centre first, then points further in from each edge, for elements
+  // partly covered by a sticky header or a badge. Label overlays have
+  // pointer-events: none, so elementFromPoint looks through them.
+  var points = [
+    [0.5, 0.5],
+    [0.5, 0.25],
+    [0.5, 0.75],
+    [0.25, 0.5],
+    [0.75, 0.5],
+  ];
+  var covering = null;
+  for (var [fx, fy] of points) {
+    var x = rect.left + rect.width * fx;
+    var y = rect.top + rect.height * fy;
+    var hit = document.elementFromPoint(x, y);
+    if (hit && (hit === element || element.contains(hit))) {
+      var old = item.rect;
+      var moved =
+        Math.abs((old.left + old.right) / 2 - (rect.left + rect.right) / 2) > 1 ||
+        Math.abs((old.top + old.bottom) / 2 - (rect.top + rect.bottom) / 2) > 1;
+      return { status: 'ok', x: x, y: y, moved: moved, scrolled: scrolled };
+    }
+    covering = covering || hit;
+  }
+  var by = covering
+    ? covering.tagName.toLowerCase() +
+      (covering.textContent.trim() ? ' "' + covering.textContent.trim().slice(0, 40) + '"' : '')
+    : 'nothing';
+  return { status: 'obscured', reason: 'the element is covered by ' + by, scrolled: scrolled };
+}
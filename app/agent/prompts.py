@@ -60,13 +60,16 @@ Observation: {{A labeled screenshot Given by User}}
 system_message_prompt = SystemMessagePromptTemplate(prompt=PromptTemplate(input_variables=[], template=system_prompt))
 
 human_message_prompt = HumanMessagePromptTemplate(prompt=[
-    ImagePromptTemplate(input_variables=['img'], template={'url': 'data:image/png;base64,{img}'}),
+    ImagePromptTemplate(
+        input_variables=['img', 'img_mime', 'img_detail'],
+        template={'url': 'data:{img_mime};base64,{img}', 'detail': '{img_detail}'},
+    ),
     PromptTemplate(input_variables=['bbox_descriptions'], template='{bbox_descriptions}'),
     PromptTemplate(input_variables=['input'], template='{input}')
 ])
 
 prompt = ChatPromptTemplate(
-    input_variables=['bbox_descriptions', 'img', 'input'],
+    input_variables=['bbox_descriptions', 'img', 'img_mime', 'img_detail', 'input'],
     input_types={'scratchpad': List[Union[AIMessage, HumanMessage, ChatMessage, SystemMessage, FunctionMessage, ToolMessage]]},
     partial_variables={'scratchpad': []},
     messages=[
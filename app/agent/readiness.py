@@ -0,0 +1,133 @@
+import asyncio
+import os
+import time
+from typing import Optional
+from weakref import WeakKeyDictionary
+
+from playwright.async_api import Page
+
+READY_TIMEOUT = float(os.getenv("READINESS_TIMEOUT", "5"))
+# How long DOM, layout and network must stay quiet to count as settled
+QUIET_MS = int(os.getenv("READINESS_QUIET_MS", "300"))
+# Requests open longer than this are long-polls/streams, not page loading
+LONG_REQUEST_SECONDS = 3.0
+IGNORED_RESOURCE_TYPES = {"websocket", "eventsource", "media"}
+
+# waited_seconds: total time spent waiting for readiness
+# saved_seconds: time saved against the fixed sleeps this replaced
+readiness_stats = {"waits": 0, "timeouts": 0, "waited_seconds": 0.0, "saved_seconds": 0.0}
+
+# Resolves true once no DOM mutations happened and the document size stayed
+# the same for quietMs, or false when maxMs runs out first. Hidden or
+# throttled tabs get no animation frames, so a timer ends the wait too.
+DOM_QUIET_JS = """
+({ quietMs, maxMs }) => new Promise((resolve) => {
+  const start = performance.now();
+  let lastChange = start;
+  let lastLayout = null;
+  let done = false;
+  const observer = new MutationObserver(() => { lastChange = performance.now(); });
+  observer.observe(document, { subtree: true, childList: true, attributes: true, characterData: true });
+  const finish = (quiet) => {
+    if (done) return;
+    done = true;
+    observer.disconnect();
+    resolve(quiet);
+  };
+  const timer = setTimeout(() => finish(performance.now() - lastChange >= quietMs), maxMs);
+  const check = () => {
+    if (done) return;
+    const root = document.documentElement;
+    const layout = root ? `${root.scrollWidth}x${root.scrollHeight}` : '';
+    const now = performance.now();
+    if (layout !== lastLayout) {
+      lastLayout = layout;
+      lastChange = now;
+    }
+    if (now - lastChange >= quietMs || now - start >= maxMs) {
+      clearTimeout(timer);
+      finish(now - lastChange >= quietMs);
+      return;
+    }
+    requestAnimationFrame(check);
+  };
+  requestAnimationFrame(check);
+})
+"""
+
+
+class _NetworkTracker:
+    def __init__(self, page: Page):
+        self.inflight = {}
+        self.last_activity = time.monotonic()
+        page.on("request", self._started)
+        page.on("requestfinished", self._done)
+        page.on("requestfailed", self._done)
+
+    def _started(self, request):
+        if request.resource_type in IGNORED_RESOURCE_TYPES:
+            return
+        self.inflight[request] = time.monotonic()
+        self.last_activity = time.monotonic()
+
+    def _done(self, request):
+        if self.inflight.pop(request, None) is not None:
+            self.last_activity = time.monotonic()
+
+    def idle(self) -> bool:
+        now = time.monotonic()
+        busy = any(now - started < LONG_REQUEST_SECONDS for started in self.inflight.values())
+        return not busy and now - self.last_activity >= QUIET_MS / 1000
+
+
+_trackers: "WeakKeyDictionary[Page, _NetworkTracker]" = WeakKeyDictionary()
+
+
+def track_network(page: Page) -> _NetworkTracker:
+    # Attached by the browser pool as each page opens, so requests fired by
+    # the first action on a page or new tab are seen too
+    tracker = _trackers.get(page)
+    if tracker is None:
+        tracker = _trackers[page] = _NetworkTracker(page)
+    return tracker
+
+
+async def wait_until_ready(page: Page, timeout: Optional[float] = None, baseline: float = 0.0) -> float:
+    # Waits until the network is idle, the DOM has stopped changing and the
+    # layout is stable, or until timeout. Polls with a growing backoff and
+    # returns the seconds waited. baseline is the fixed sleep this replaces,
+    # used to record the time saved.
+    timeout = READY_TIMEOUT if timeout is None else timeout
+    tracker = track_network(page)
+    start = time.monotonic()
+    deadline = start + timeout
+    delay = 0.05
+    ready = False
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            await page.wait_for_load_state("domcontentloaded", timeout=remaining * 1000)
+            remaining = max(0, deadline - time.monotonic())
+            dom_quiet = await asyncio.wait_for(
+                page.evaluate(DOM_QUIET_JS, {"quietMs": QUIET_MS, "maxMs": remaining * 1000}),
+                remaining + 0.1,
+            )
+        except Exception:
+            # Navigation in progress destroyed the execution context
+            dom_quiet = False
+        if dom_quiet and tracker.idle():
+            ready = True
+            break
+        await asyncio.sleep(min(delay, max(0, deadline - time.monotonic())))
+        delay = min(delay * 2, 1.0)
+
+    waited = time.monotonic() - start
+    readiness_stats["waits"] += 1
+    readiness_stats["waited_seconds"] += waited
+    if not ready:
+        readiness_stats["timeouts"] += 1
+    if baseline:
+        readiness_stats["saved_seconds"] += baseline - waited
+    return waited
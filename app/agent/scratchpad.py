@@ -0,0 +1,80 @@
+import os
+from collections import Counter
+from typing import List
+
+try:
+    import tiktoken
+
+    _encoding = tiktoken.encoding_for_model("gpt-4o")
+except Exception:
+    _encoding = None
+
+SCRATCHPAD_WINDOW = int(os.getenv("SCRATCHPAD_WINDOW", "8"))
+SCRATCHPAD_TOKEN_BUDGET = int(os.getenv("SCRATCHPAD_TOKEN_BUDGET", "1500"))
+# Longest a single observation may be once the budget is tight
+MIN_OBSERVATION_CHARS = 120
+
+
+def count_tokens(text: str) -> int:
+    if _encoding is None:
+        return len(text) // 4 + 1
+    return len(_encoding.encode(text))
+
+
+def make_step(steps: List[dict], prediction: dict, observation: str) -> dict:
+    return {
+        "step": len(steps) + 1,
+        "action": prediction.get("action"),
+        "args": prediction.get("args"),
+        "observation": observation,
+    }
+
+
+def summarize(steps: List[dict]) -> str:
+    # One line for everything outside the window: action counts and the
+    # latest error, which is what the model needs to avoid repeating itself
+    counts = Counter(step["action"] for step in steps)
+    actions = ", ".join(f"{action} x{n}" for action, n in counts.most_common())
+    summary = f"Steps 1-{steps[-1]['step']} (summary): {actions}."
+    errors = [step for step in steps if str(step["observation"]).startswith(("Error", "Failed"))]
+    if errors:
+        summary += f" Last error at step {errors[-1]['step']}: {errors[-1]['observation'][:MIN_OBSERVATION_CHARS]}"
+    return summary
+
+
+def render(steps: List[dict], window: int = SCRATCHPAD_WINDOW, budget: int = SCRATCHPAD_TOKEN_BUDGET):
+    # Recent steps verbatim, older ones folded into a summary, shrinking the
+    # window (then truncating observations) until the text fits the budget
+    window = max(1, min(window, len(steps)))
+    limit = None
+    while True:
+        older, recent = steps[:-window], steps[-window:]
+        txt = "Previous action observations:\n"
+        if older:
+            txt += "\n" + summarize(older)
+        for step in recent:
+            observation = str(step["observation"])
+            if limit is not None and len(observation) > limit:
+                observation = observation[:limit] + "..."
+            txt += f"\n{step['step']}. {observation}"
+        tokens = count_tokens(txt)
+        if tokens <= budget:
+            return txt, tokens
+        if window > 1:
+            window -= 1
+        elif limit is None:
+            limit = MIN_OBSERVATION_CHARS
+        else:
+            return txt, tokens
+
+
+def estimate_prompt_tokens(system_prompt_tokens: int, state: dict, bbox_descriptions: str) -> dict:
+    report = {
+        "system": system_prompt_tokens,
+        "scratchpad": state.get("scratchpad_tokens", 0),
+        "bboxes": count_tokens(bbox_descriptions),
+        "input": count_tokens(str(state["input"])),
+        "image": (state.get("img_stats") or {}).get("tokens", 0),
+    }
+    report["total"] = sum(report.values())
+    return report
@@ -0,0 +1,116 @@
+import base64
+import math
+import os
+from dataclasses import dataclass
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+MIME_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+# Label tags are drawn 19px above their box, keep them inside the crop
+LABEL_MARGIN = 24
+
+
+@dataclass
+class ScreenshotConfig:
+    format: str = "png"
+    quality: int = 80
+    max_dim: Optional[int] = None
+    detail: str = "auto"
+    crop: bool = False
+
+    @classmethod
+    def from_env(cls):
+        max_dim = os.getenv("SCREENSHOT_MAX_DIM")
+        config = cls(
+            format=os.getenv("SCREENSHOT_FORMAT", "png").lower(),
+            quality=int(os.getenv("SCREENSHOT_QUALITY", "80")),
+            max_dim=int(max_dim) if max_dim else None,
+            detail=os.getenv("SCREENSHOT_DETAIL", "auto").lower(),
+            crop=os.getenv("SCREENSHOT_CROP", "false").lower() == "true",
+        )
+        if config.format not in MIME_TYPES:
+            raise ValueError(f"Unsupported SCREENSHOT_FORMAT: {config.format}")
+        if config.detail not in ("auto", "low", "high"):
+            raise ValueError(f"Unsupported SCREENSHOT_DETAIL: {config.detail}")
+        return config
+
+
+def labelled_region(bboxes: List[Optional[dict]], viewport: dict):
+    # Smallest viewport rectangle holding every labelled element and its tag
+    boxes = [b for b in bboxes if b is not None]
+    if not boxes:
+        return None
+    left = min(b["left"] for b in boxes) - LABEL_MARGIN
+    top = min(b["top"] for b in boxes) - LABEL_MARGIN
+    right = max(b["left"] + b["width"] for b in boxes) + LABEL_MARGIN
+    bottom = max(b["top"] + b["height"] for b in boxes) + LABEL_MARGIN
+    left, top = max(0, math.floor(left)), max(0, math.floor(top))
+    right = min(viewport["width"], math.ceil(right))
+    bottom = min(viewport["height"], math.ceil(bottom))
+    if right <= left or bottom <= top:
+        return None
+    return {"x": left, "y": top, "width": right - left, "height": bottom - top}
+
+
+def estimate_image_tokens(width: int, height: int, detail: str) -> int:
+    # OpenAI vision pricing: a flat 85 tokens at low detail, otherwise the
+    # image is fit into 2048x2048, its short side scaled to 768 and billed
+    # 170 tokens per 512px tile on top of the base 85.
+    if detail == "low":
+        return 85
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / 512) * math.ceil(height / 512)
+    return 170 * tiles + 85
+
+
+async def capture(page, bboxes, viewport: dict, config: ScreenshotConfig):
+    clip = labelled_region(bboxes, viewport) if config.crop else None
+    region = clip or {"x": 0, "y": 0, "width": viewport["width"], "height": viewport["height"]}
+    dpr = viewport.get("dpr") or 1
+    width, height = round(region["width"] * dpr), round(region["height"] * dpr)
+
+    scale = 1.0
+    if config.max_dim and max(width, height) > config.max_dim:
+        scale = config.max_dim / max(width, height)
+
+    if config.format == "webp" or scale < 1.0:
+        raw = await page.screenshot(clip=clip)
+        image = cv2.imdecode(np.frombuffer(raw, np.uint8), cv2.IMREAD_COLOR)
+        height, width = image.shape[:2]
+        if scale < 1.0:
+            width, height = max(1, round(width * scale)), max(1, round(height * scale))
+            image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+        if config.format == "webp":
+            params = [cv2.IMWRITE_WEBP_QUALITY, config.quality]
+        elif config.format == "jpeg":
+            params = [cv2.IMWRITE_JPEG_QUALITY, config.quality]
+        else:
+            params = []
+        ok, encoded = cv2.imencode(f".{config.format}", image, params)
+        if not ok:
+            raise Exception(f"Failed to encode screenshot as {config.format}")
+        data = encoded.tobytes()
+    elif config.format == "jpeg":
+        data = await page.screenshot(clip=clip, type="jpeg", quality=config.quality)
+    else:
+        data = await page.screenshot(clip=clip)
+
+    img = base64.b64encode(data).decode()
+    return {
+        "img": img,
+        "img_mime": MIME_TYPES[config.format],
+        "img_detail": config.detail,
+        "img_stats": {
+            "bytes": len(data),
+            "payload_bytes": len(img),
+            "width": width,
+            "height": height,
+            "tokens": estimate_image_tokens(width, height, config.detail),
+        },
+    }
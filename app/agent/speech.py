@@ -0,0 +1,165 @@
+import asyncio
+import io
+import logging
+import os
+import time
+from typing import Callable, Iterable, Optional
+
+from deepgram import DeepgramClient, SpeakOptions
+from pydub import AudioSegment
+from pydub.playback import play
+from tts_cache import TTSCache
+
+logger = logging.getLogger(__name__)
+
+_deepgram = None
+
+
+def deepgram_client() -> DeepgramClient:
+    # Created on first use, so a DEEPGRAM_API_KEY from the caller's
+    # load_dotenv() is seen even though this module is imported first
+    global _deepgram
+    if _deepgram is None:
+        _deepgram = DeepgramClient(api_key=os.getenv("DEEPGRAM_API_KEY", ""))
+    return _deepgram
+
+
+# Longest the agent waits on its own narration before acting anyway, so a
+# stalled synthesis or audio device can't hold a demo up
+SPEECH_WAIT_TIMEOUT = float(os.getenv("SPEECH_WAIT_TIMEOUT", "15"))
+
+VOICE_MODEL = "aura-asteria-en"
+ENCODING = "linear16"
+
+tts_cache = TTSCache.from_env()
+
+
+def synthesize(text: str, model: str = VOICE_MODEL, encoding: str = ENCODING) -> bytes:
+    # Synthesised straight into memory, no shared output.wav between sessions
+    key = TTSCache.key(text, model, encoding)
+    data = tts_cache.get(key)
+    if data is None:
+        options = SpeakOptions(model=model, encoding=encoding, container="wav")
+        response = deepgram_client().speak.v("1").stream({"text": text}, options)
+        data = response.stream.getvalue()
+        tts_cache.put(key, data)
+    return data
+
+
+async def warm_up(phrases: Iterable[str], concurrency: int = 4):
+    # Pre-synthesise known phrases so their first use is a cache hit
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def warm(text):
+        async with semaphore:
+            try:
+                await asyncio.to_thread(synthesize, text)
+            except Exception as e:
+                logger.warning(f"TTS warm-up failed for {text!r}: {e}")
+
+    phrases = [p.strip() for p in phrases if p.strip()]
+    await asyncio.gather(*(warm(p) for p in phrases))
+    logger.info(f"TTS warm-up done for {len(phrases)} phrases: {tts_cache.stats}")
+
+
+def play_wav(data: bytes):
+    play(AudioSegment.from_wav(io.BytesIO(data)))
+
+
+class Utterance:
+    def __init__(self, text: str):
+        self.text = text
+        self.audio: Optional[bytes] = None
+        self.started = asyncio.Event()
+        self.finished = asyncio.Event()
+
+
+class SpeechPipeline:
+    # Per-session speech: synthesis of the next reply overlaps playback of the
+    # current one, and both run in worker threads off the event loop. The
+    # agent only waits on speech where the caller asks it to.
+
+    def __init__(
+        self,
+        synthesize: Callable[[str], bytes] = synthesize,
+        play: Callable[[bytes], None] = play_wav,
+    ):
+        self._synthesize = synthesize
+        self._play = play
+        self._texts: asyncio.Queue = asyncio.Queue()
+        self._audio: asyncio.Queue = asyncio.Queue()
+        self._workers = []
+        self.last: Optional[Utterance] = None
+        self.stats = {
+            "utterances": 0,
+            "synth_seconds": 0.0,
+            "play_seconds": 0.0,
+            "blocked_seconds": 0.0,
+            "wait_timeouts": 0,
+        }
+
+    def say(self, text: str) -> Utterance:
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._synth_worker()),
+                asyncio.create_task(self._play_worker()),
+            ]
+        utterance = Utterance(text)
+        self.last = utterance
+        self.stats["utterances"] += 1
+        self._texts.put_nowait(utterance)
+        return utterance
+
+    async def wait(self, until: str = "finish", timeout: Optional[float] = SPEECH_WAIT_TIMEOUT) -> bool:
+        # Block until the latest utterance has started ("start") or finished
+        # ("finish") playing; "off" never blocks. Returns False when timeout
+        # seconds passed first.
+        if until == "off" or self.last is None:
+            return True
+        event = self.last.started if until == "start" else self.last.finished
+        if event.is_set():
+            return True
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            self.stats["wait_timeouts"] += 1
+            logger.warning(f"Gave up waiting {timeout}s for speech to {until}")
+            return False
+        finally:
+            self.stats["blocked_seconds"] += time.perf_counter() - start
+        return True
+
+    async def close(self, drain: bool = True):
+        try:
+            if drain:
+                await self.wait("finish")
+        finally:
+            for worker in self._workers:
+                worker.cancel()
+            await asyncio.gather(*self._workers, return_exceptions=True)
+            self._workers = []
+
+    async def _synth_worker(self):
+        while True:
+            utterance = await self._texts.get()
+            start = time.perf_counter()
+            try:
+                utterance.audio = await asyncio.to_thread(self._synthesize, utterance.text)
+            except Exception as e:
+                logger.error(f"Speech synthesis failed: {e}")
+            self.stats["synth_seconds"] += time.perf_counter() - start
+            await self._audio.put(utterance)
+
+    async def _play_worker(self):
+        while True:
+            utterance = await self._audio.get()
+            utterance.started.set()
+            start = time.perf_counter()
+            try:
+                if utterance.audio:
+                    await asyncio.to_thread(self._play, utterance.audio)
+            except Exception as e:
+                logger.error(f"Speech playback failed: {e}")
+            self.stats["play_seconds"] += time.perf_counter() - start
+            utterance.finished.set()
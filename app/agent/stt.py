@@ -0,0 +1,174 @@
+import asyncio
+import io
+import os
+import wave
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from clients import clients
+
+# Audio streamed to /api/audio_stream: mono 16-bit little-endian PCM
+SAMPLE_RATE = int(os.getenv("STT_SAMPLE_RATE", "16000"))
+
+# end_of_speech_to_agent_ms: from the VAD calling end of speech to the agent
+# run starting, summed over utterances
+stt_stats = {"utterances": 0, "partials": 0, "end_of_speech_to_agent_ms": 0.0}
+
+
+class EnergyVAD:
+    # Per-frame speech/silence from RMS energy. A frame is speech when it is
+    # louder than min_rms and ratio times the noise floor, which follows the
+    # background level while nobody is talking.
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE, frame_ms: int = 20, min_rms: float = 300.0, ratio: float = 3.0):
+        self.frame_ms = frame_ms
+        self.frame_bytes = sample_rate * frame_ms // 1000 * 2
+        self.min_rms = min_rms
+        self.ratio = ratio
+        self.noise_floor: Optional[float] = None
+
+    def is_speech(self, frame: bytes) -> bool:
+        samples = np.frombuffer(frame, dtype="<i2").astype(np.float32)
+        rms = float(np.sqrt(np.mean(samples * samples))) if samples.size else 0.0
+        if self.noise_floor is None:
+            self.noise_floor = rms
+        speech = rms > max(self.min_rms, self.noise_floor * self.ratio)
+        if not speech:
+            self.noise_floor = 0.95 * self.noise_floor + 0.05 * rms
+        return speech
+
+
+class UtteranceDetector:
+    # Splits a PCM stream into utterances. Speech starts after start_ms of
+    # voiced frames (keeping pre_roll_ms before it so the first syllable
+    # isn't clipped) and ends after end_ms of silence or at max_ms.
+    # feed() returns ("start", None) and ("end", audio) events.
+
+    def __init__(
+        self,
+        vad: EnergyVAD,
+        start_ms: int = 100,
+        end_ms: int = 700,
+        pre_roll_ms: int = 300,
+        max_ms: int = 30000,
+    ):
+        self.vad = vad
+        self.start_frames = max(1, start_ms // vad.frame_ms)
+        self.end_frames = max(1, end_ms // vad.frame_ms)
+        self.end_ms = end_ms
+        self.max_bytes = max_ms // vad.frame_ms * vad.frame_bytes
+        self._pending = bytearray()
+        self._pre_roll = deque(maxlen=max(1, pre_roll_ms // vad.frame_ms))
+        self._audio = bytearray()
+        self._voiced = 0
+        self._silent = 0
+        self.speaking = False
+
+    @property
+    def audio(self) -> bytes:
+        return bytes(self._audio)
+
+    @property
+    def speech_ms(self) -> int:
+        return len(self._audio) // self.vad.frame_bytes * self.vad.frame_ms
+
+    def feed(self, data: bytes) -> List[Tuple[str, Optional[bytes]]]:
+        events = []
+        self._pending += data
+        frame_bytes = self.vad.frame_bytes
+        offset = 0
+        while len(self._pending) - offset >= frame_bytes:
+            frame = bytes(self._pending[offset:offset + frame_bytes])
+            offset += frame_bytes
+            voiced = self.vad.is_speech(frame)
+            if not self.speaking:
+                self._pre_roll.append(frame)
+                self._voiced = self._voiced + 1 if voiced else 0
+                if self._voiced >= self.start_frames:
+                    self.speaking = True
+                    self._silent = 0
+                    self._audio = bytearray(b"".join(self._pre_roll))
+                    self._pre_roll.clear()
+                    events.append(("start", None))
+                continue
+            self._audio += frame
+            self._silent = 0 if voiced else self._silent + 1
+            if self._silent >= self.end_frames or len(self._audio) >= self.max_bytes:
+                events.append(("end", self._finish()))
+        del self._pending[:offset]
+        return events
+
+    def flush(self) -> List[Tuple[str, Optional[bytes]]]:
+        # The client said the utterance is over, don't wait for the silence
+        if not self.speaking:
+            return []
+        return [("end", self._finish())]
+
+    def _finish(self) -> bytes:
+        audio = bytes(self._audio)
+        self._audio = bytearray()
+        self._voiced = 0
+        self.speaking = False
+        return audio
+
+
+def pcm_to_wav(pcm: bytes, sample_rate: int = SAMPLE_RATE) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
+
+
+class Transcriber(ABC):
+    # final=False asks for a partial transcript of an utterance still going on
+    @abstractmethod
+    async def transcribe(self, pcm: bytes, final: bool = True) -> str:
+        ...
+
+
+class WhisperTranscriber(Transcriber):
+    def __init__(self, model: str = "whisper-1", sample_rate: int = SAMPLE_RATE):
+        self.model = model
+        self.sample_rate = sample_rate
+
+    async def transcribe(self, pcm: bytes, final: bool = True) -> str:
+        transcription = await clients.openai.audio.transcriptions.create(
+            model=self.model,
+            file=("speech.wav", pcm_to_wav(pcm, self.sample_rate), "audio/wav"),
+        )
+        return transcription.text
+
+
+class FakeTranscriber(Transcriber):
+    # Local stand-in for tests and offline runs. Final transcripts return the
+    # scripted texts in order, the last one repeating; partials preview the
+    # next one. With no script it describes the audio it was given.
+
+    def __init__(self, texts: Sequence[str] = (), delay: float = 0.0, sample_rate: int = SAMPLE_RATE):
+        self.texts = list(texts)
+        self.delay = delay
+        self.sample_rate = sample_rate
+        self.calls = []
+
+    async def transcribe(self, pcm: bytes, final: bool = True) -> str:
+        self.calls.append((len(pcm), final))
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if not self.texts:
+            return f"<{len(pcm) / 2 / self.sample_rate:.1f}s of speech>"
+        if final and len(self.texts) > 1:
+            return self.texts.pop(0)
+        return self.texts[0]
+
+
+def transcriber_from_env() -> Transcriber:
+    # STT_TRANSCRIBER=fake with STT_FAKE_TEXTS="first|second" runs without Whisper
+    if os.getenv("STT_TRANSCRIBER", "whisper").lower() == "fake":
+        texts = [t for t in os.getenv("STT_FAKE_TEXTS", "").split("|") if t]
+        return FakeTranscriber(texts)
+    return WhisperTranscriber()
@@ -1,6 +1,34 @@
 from utils import AgentState
 import platform
-import asyncio
+from readiness import wait_until_ready
+
+RESOLVE_CALL = """([label, markId]) =>
+    typeof markPageResolve === 'function' ? markPageResolve(label, markId) : null"""
+
+# How labels were resolved to a point: "moved" and "scrolled" targets would
+# have been missed at their annotated coordinates, "stale" and "obscured" ones
+# were reported instead of clicked, "fallback" used the annotated coordinates
+registry_stats = {"resolved": 0, "moved": 0, "scrolled": 0, "stale": 0, "obscured": 0, "fallback": 0}
+
+async def locate(state: AgentState, bbox_id: int):
+    # Returns the (x, y) to act at, or an error observation for the LLM
+    bbox = state["bboxes"][bbox_id]
+    if bbox is None:
+        return f"Error: no bbox for : {bbox_id}"
+    try:
+        target = await state["page"].evaluate(RESOLVE_CALL, [bbox_id, state.get("annotation_id")])
+    except Exception:
+        target = None
+    if target is None:
+        registry_stats["fallback"] += 1
+        return bbox["x"], bbox["y"]
+    if target["status"] != "ok":
+        registry_stats[target["status"]] += 1
+        return f"Error: label {bbox_id} is {target['status']}, {target['reason']}. Look at the new screenshot and pick again."
+    registry_stats["resolved"] += 1
+    registry_stats["moved"] += target["moved"]
+    registry_stats["scrolled"] += target["scrolled"]
+    return target["x"], target["y"]
 
 async def click(state: AgentState):
     page = state["page"]
@@ -10,10 +38,12 @@ async def click(state: AgentState):
     bbox_id = click_args[0]
     bbox_id = int(bbox_id)
     try:
-        bbox = state["bboxes"][bbox_id]
-    except Exception:
+        target = await locate(state, bbox_id)
+    except IndexError:
         return f"Error: no bbox for : {bbox_id}"
-    x, y = bbox["x"], bbox["y"]
+    if isinstance(target, str):
+        return target
+    x, y = target
     await page.mouse.click(x, y)
     return f"Clicked {bbox_id}"
 
@@ -24,8 +54,10 @@ async def type_text(state: AgentState):
         return f"Failed to type in element from bounding box labeled as number {type_args}"
     bbox_id = type_args[0]
     bbox_id = int(bbox_id)
-    bbox = state["bboxes"][bbox_id]
-    x, y = bbox["x"], bbox["y"]
+    target = await locate(state, bbox_id)
+    if isinstance(target, str):
+        return target
+    x, y = target
     text_content = type_args[1]
     await page.mouse.click(x, y)
     select_all = "Meta+A" if platform.system() == "Darwin" else "Control+A"
@@ -54,8 +86,10 @@ async def scroll(state: AgentState):
             if target_id < 0 or target_id >= len(state["bboxes"]):
                 return f"Error: Invalid bounding box ID {target_id}. Valid range is 0 to {len(state['bboxes']) - 1}."
             
-            bbox = state["bboxes"][target_id]
-            x, y = bbox["x"], bbox["y"]
+            point = await locate(state, target_id)
+            if isinstance(point, str):
+                return point
+            x, y = point
             scroll_amount = 200
             scroll_direction = -scroll_amount if direction.lower() == "up" else scroll_amount
             await page.mouse.move(x, y)
@@ -65,9 +99,10 @@ async def scroll(state: AgentState):
             return f"Error: Invalid target '{target}'. Expected 'WINDOW' or a number."
 
 async def wait(state: AgentState):
+    # Up to the old fixed 5s, but only as long as the page is still settling
     sleep_time = 5
-    await asyncio.sleep(sleep_time)
-    return f"Waited for {sleep_time}s."
+    waited = await wait_until_ready(state["page"], timeout=sleep_time, baseline=sleep_time)
+    return f"Waited for {waited:.1f}s."
 
 async def go_back(state: AgentState):
     page = state["page"]
@@ -80,8 +115,8 @@ async def to_google(state: AgentState):
     return "Navigated to google.com."
 
 async def open_new_tab(state: AgentState):
-    browser = state["page"].context.browser
-    new_page = await browser.new_page()
+    # Stay inside the session's own context so tabs are not shared across demos
+    new_page = await state["page"].context.new_page()
     state["page"] = new_page
     return "Opened a new tab."
 
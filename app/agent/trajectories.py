@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import re
+from typing import List, Optional
+from urllib.parse import urlsplit
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+TARGETED_ACTIONS = {"Click", "Type", "Scroll"}
+
+# Steps replayed without the LLM, steps that went to the LLM, and replays
+# abandoned because a step did not resolve or the page diverged
+trajectory_stats = {"replayed_steps": 0, "llm_steps": 0, "fallbacks": 0}
+
+
+def normalize_task(task) -> str:
+    text = re.sub(r"[^\w\s]", " ", str(task).lower())
+    return " ".join(text.split())
+
+
+def page_fingerprint(url: str, bboxes: List[Optional[dict]]) -> dict:
+    # Origin + path and the aria-labels on screen. Aria-labels mostly name
+    # the app chrome (menus, buttons), so they survive changing content.
+    parts = urlsplit(url)
+    landmarks = {b["ariaLabel"] for b in bboxes if b and b.get("ariaLabel")}
+    return {"url": f"{parts.scheme}://{parts.netloc}{parts.path}", "landmarks": sorted(landmarks)}
+
+
+def fingerprint_matches(recorded: dict, current: dict, threshold: float = 0.6) -> bool:
+    if recorded["url"] != current["url"]:
+        return False
+    a, b = set(recorded["landmarks"]), set(current["landmarks"])
+    if not a and not b:
+        return True
+    return len(a & b) / len(a | b) >= threshold
+
+
+def describe_target(bboxes: List[Optional[dict]], label) -> Optional[dict]:
+    try:
+        bbox = bboxes[int(label)]
+    except (ValueError, IndexError, TypeError):
+        return None
+    if bbox is None:
+        return None
+    return {
+        "index": int(label),
+        "type": bbox.get("type", ""),
+        "text": bbox.get("text", ""),
+        "ariaLabel": bbox.get("ariaLabel", ""),
+    }
+
+
+def resolve_target(bboxes: List[Optional[dict]], target: dict) -> Optional[int]:
+    # Best match on type plus aria-label and/or text, nearest the recorded
+    # label on ties. None when nothing on the fresh page matches.
+    best, best_score = None, None
+    for index, bbox in enumerate(bboxes):
+        if bbox is None or bbox.get("type") != target["type"]:
+            continue
+        score = 0
+        if target["ariaLabel"] and bbox.get("ariaLabel") == target["ariaLabel"]:
+            score += 2
+        if target["text"] and bbox.get("text") == target["text"]:
+            score += 1
+        if score == 0:
+            continue
+        key = (score, -abs(index - target["index"]))
+        if best_score is None or key > best_score:
+            best, best_score = index, key
+    return best
+
+
+class TrajectoryStore:
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or os.getenv(
+            "TRAJECTORY_DIR", os.path.join(script_dir, "trajectories")
+        )
+
+    def _path(self, task) -> str:
+        key = hashlib.sha1(normalize_task(task).encode()).hexdigest()
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, task) -> Optional[dict]:
+        try:
+            with open(self._path(task)) as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def save(self, trajectory: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(trajectory["task"])
+        with open(path + ".tmp", "w") as f:
+            json.dump(trajectory, f, indent=2)
+        os.replace(path + ".tmp", path)
+
+
+# How tools report an action they could not carry out
+ERROR_PREFIXES = ("Error", "Failed")
+
+
+class TrajectoryRecorder:
+    # Only steps that worked are kept: a step whose tool reported an error is
+    # dropped once its observation comes in, and the step the agent took to
+    # recover takes its place
+    def __init__(self, task):
+        self.task = normalize_task(task)
+        self.steps = []
+        self.complete = False
+
+    def record(self, state: dict):
+        prediction = state.get("prediction") or {}
+        action = prediction.get("action")
+        if not action or action == "retry":
+            return
+        args = prediction.get("args")
+        target = None
+        if action in TARGETED_ACTIONS and args:
+            target = describe_target(state["bboxes"], args[0])
+        self.steps.append({
+            "action": action,
+            "args": args,
+            "target": target,
+            "reply": prediction.get("reply", ""),
+            "fingerprint": page_fingerprint(state["page"].url, state["bboxes"]),
+        })
+        if action == "ANSWER":
+            self.complete = True
+
+    def observe(self, observation: str):
+        if self.steps and str(observation).startswith(ERROR_PREFIXES):
+            self.steps.pop()
+
+    def trajectory(self) -> dict:
+        return {"task": self.task, "steps": self.steps}
+
+
+def replay_step(state: dict) -> Optional[dict]:
+    trajectory = state.get("replay")
+    index = state.get("replay_index") or 0
+    if not trajectory or index >= len(trajectory["steps"]):
+        return None
+    step = trajectory["steps"][index]
+    current = page_fingerprint(state["page"].url, state["bboxes"])
+    if not fingerprint_matches(step["fingerprint"], current):
+        return None
+    args = list(step["args"]) if step["args"] else step["args"]
+    if step["target"] is not None:
+        label = resolve_target(state["bboxes"], step["target"])
+        if label is None:
+            return None
+        args[0] = str(label)
+    return {"action": step["action"], "args": args, "reply": step["reply"]}
@@ -0,0 +1,139 @@
+import hashlib
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+class TTSCache:
+    # Synthesised audio keyed by (text, voice model, encoding). A small LRU in
+    # memory sits in front of a byte-budgeted directory on disk; both evict
+    # least recently used entries first. Safe to use from worker threads.
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        memory_bytes: int = 32 * 1024 * 1024,
+        disk_bytes: int = 512 * 1024 * 1024,
+    ):
+        self.directory = directory or os.path.join(script_dir, "tts_cache")
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory: OrderedDict = OrderedDict()
+        self._memory_size = 0
+        self._disk: OrderedDict = OrderedDict()
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self._load_disk_index()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            directory=os.getenv("TTS_CACHE_DIR"),
+            memory_bytes=int(os.getenv("TTS_CACHE_MEMORY_MB", "32")) * 1024 * 1024,
+            disk_bytes=int(os.getenv("TTS_CACHE_DISK_MB", "512")) * 1024 * 1024,
+        )
+
+    @staticmethod
+    def key(text: str, model: str, encoding: str) -> str:
+        return hashlib.sha256(f"{model}\0{encoding}\0{text}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return data
+            if key not in self._disk:
+                self.stats["misses"] += 1
+                return None
+            self._disk.move_to_end(key)
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+            os.utime(self._path(key))
+        except OSError:
+            with self._lock:
+                self._forget_disk(key)
+                self.stats["misses"] += 1
+            return None
+        with self._lock:
+            self.stats["disk_hits"] += 1
+            self._put_memory(key, data)
+        return data
+
+    def put(self, key: str, data: bytes):
+        with self._lock:
+            self._put_memory(key, data)
+            if key in self._disk or len(data) > self.disk_bytes:
+                return
+        path = self._path(key)
+        # Concurrent puts of the same phrase each write their own file
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Failed to write TTS cache entry: {e}")
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            if key in self._disk:
+                # Another put of the same key got here first and counted it
+                return
+            self._disk[key] = len(data)
+            self._disk_size += len(data)
+            while self._disk_size > self.disk_bytes:
+                oldest, _ = next(iter(self._disk.items()))
+                self._forget_disk(oldest)
+                try:
+                    os.remove(self._path(oldest))
+                except OSError:
+                    pass
+
+    def _put_memory(self, key: str, data: bytes):
+        if len(data) > self.memory_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_size -= len(previous)
+        self._memory[key] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def _forget_disk(self, key: str):
+        size = self._disk.pop(key, None)
+        if size is not None:
+            self._disk_size -= size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.audio")
+
+    def _load_disk_index(self):
+        if not os.path.isdir(self.directory):
+            return
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".audio"):
+                continue
+            stat = os.stat(os.path.join(self.directory, name))
+            entries.append((stat.st_mtime, name[: -len(".audio")], stat.st_size))
+        # Oldest first, so eviction order survives restarts
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_size += size
@@ -1,26 +1,28 @@
 import asyncio
-import base64
-from typing import List, Optional, TypedDict
+import logging
+from typing import Callable, List, Optional, TypedDict
 from langchain_core.messages import BaseMessage, SystemMessage
 from playwright.async_api import Page
+from screenshot import ScreenshotConfig, capture
 from langchain_core.runnables import chain as chain_decorator
 from langchain_core.messages import SystemMessage
-import re
 import os
-from datetime import datetime
-from deepgram import (
-    DeepgramClient,
-    SpeakOptions,
-)
-from pydub import AudioSegment
-from pydub.playback import play
+import hashlib
+import time
+from speech import SpeechPipeline
+from scratchpad import make_step, render
+from readiness import wait_until_ready
 
+logger = logging.getLogger(__name__)
 
-deepgram = DeepgramClient(api_key='ccd39542915e20239233dbb9fb50732cffc5bf3d')
 
 class BBox(TypedDict):
     x: float
     y: float
+    left: float
+    top: float
+    width: float
+    height: float
     text: str
     type: str
     ariaLabel: str
@@ -33,45 +35,117 @@ class AgentState(TypedDict):
     page: Page
     input: str
     img: str
-    bboxes: List[BBox]
+    img_mime: str
+    img_detail: str
+    img_stats: dict
+    bboxes: List[Optional[BBox]]
+    annotation_id: Optional[str]
     prediction: Prediction
     scratchpad: Optional[List[BaseMessage]]
     observation: str
+    steps: List[dict]
+    scratchpad_tokens: int
+    prompt_tokens: dict
+    replay: Optional[dict]
+    replay_index: int
+    timings: dict
+    speech: Optional[SpeechPipeline]
+    reply_sink: Optional[Callable[[str], None]]
+    prefetch: Optional[asyncio.Task]
+    early_tool: Optional[asyncio.Task]
 
 
 
-@chain_decorator
-async def mark_page(page):
+def _load_mark_page_script():
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    mark_page_js_path = os.path.join(script_dir, "mark_page.js")
-    with open(mark_page_js_path) as f:
-        mark_page_script = f.read()
-    await page.evaluate(mark_page_script)
-    bboxes = None
+    with open(os.path.join(script_dir, "mark_page.js")) as f:
+        source = f.read()
+    version = hashlib.sha1(source.encode()).hexdigest()[:12]
+    return source + f"\nwindow.__markPageVersion = '{version}';\n", version
+
+
+# Loaded once at import and registered on every browser context as an init
+# script, so it survives navigations without being re-sent on each step.
+MARK_PAGE_SCRIPT, MARK_PAGE_VERSION = _load_mark_page_script()
+
+# Returns null when the page holds no copy or a stale one
+MARK_PAGE_CALL = """([version, lastId]) =>
+    window.__markPageVersion === version ? markPageIncremental(lastId) : null"""
+
+# How each annotation was produced: "full" rebuild, "partial" re-label of the
+# changed subtrees, or "skipped" because nothing changed since the last one
+# payload_bytes and image_tokens total the screenshots sent; each step's
+# own img_stats are in the agent log
+annotation_stats = {"full": 0, "partial": 0, "skipped": 0, "payload_bytes": 0, "image_tokens": 0}
+
+screenshot_config = ScreenshotConfig.from_env()
+
+
+@chain_decorator
+async def mark_page(request):
+    page, last_id = request["page"], request.get("annotation_id")
+    result = None
+    delay = 0.25
     for _ in range(10):
         try:
-            bboxes = await page.evaluate("markPage()")
+            result = await page.evaluate(MARK_PAGE_CALL, [MARK_PAGE_VERSION, last_id])
+            if result is None:
+                await page.evaluate(MARK_PAGE_SCRIPT)
+                result = await page.evaluate("(lastId) => markPageIncremental(lastId)", last_id)
             break
         except Exception:
-            await asyncio.sleep(3)
+            # Usually a navigation in flight: wait for the page instead of a fixed 3s
+            await asyncio.sleep(delay)
+            await wait_until_ready(page, timeout=3, baseline=3)
+            delay = min(delay * 2, 2.0)
     
-    if bboxes is None:
+    if result is None:
         raise Exception("Failed to get bounding boxes after multiple attempts")
-    
-    screenshot = await page.screenshot()
+
+    if result["mode"] == "clean":
+        return {"annotation_id": result["id"]}
+
+    screenshot = await capture(page, result["boxes"], result["viewport"], screenshot_config)
     await page.evaluate("unmarkPage()")
+    annotation_stats[result["mode"]] += 1
+    annotation_stats["payload_bytes"] += screenshot["img_stats"]["payload_bytes"]
+    annotation_stats["image_tokens"] += screenshot["img_stats"]["tokens"]
     return {
-        "img": base64.b64encode(screenshot).decode(),
-        "bboxes": bboxes,
+        **screenshot,
+        "bboxes": result["boxes"],
+        "annotation_id": result["id"],
     }
 
+async def annotate_page(state):
+    start = time.perf_counter()
+    # Only a page we annotated last step (same tab, same document) can be reused
+    last_id = state.get("annotation_id") if state.get("img") else None
+    marked_page = await mark_page.with_retry().ainvoke(
+        {"page": state["page"], "annotation_id": last_id}
+    )
+    if "img" not in marked_page:
+        annotation_stats["skipped"] += 1
+    timings = {"annotate_ms": round((time.perf_counter() - start) * 1000, 1)}
+    return {**marked_page, "timings": timings}
+
 async def annotate(state):
-    marked_page = await mark_page.with_retry().ainvoke(state["page"])
-    return {**state, **marked_page}
+    # In pipelined mode the tool node already started annotating the page
+    prefetch = state.get("prefetch")
+    updates = None
+    if prefetch is not None:
+        try:
+            updates = await prefetch
+        except Exception as e:
+            logger.warning(f"Prefetched annotation failed, annotating again: {e}")
+    if updates is None:
+        updates = await annotate_page(state)
+    return {**state, **updates, "prefetch": None}
 
 def format_descriptions(state):
     labels = []
     for i, bbox in enumerate(state["bboxes"]):
+        if bbox is None:
+            continue
         text = bbox.get("ariaLabel") or ""
         if not text.strip():
             text = bbox["text"]
@@ -90,17 +164,22 @@ def parse(text: str) -> dict:
     action = ""
     reply = ""
     
+    # The first non-empty Action and Reply count, as they do when streaming:
+    # by the time a second one is written the first may already be spoken
     for line in lines:
         if line.startswith(thought_prefix):
             thought = line[len(thought_prefix):].strip()
-        elif line.startswith(action_prefix):
+        elif line.startswith(action_prefix) and not action:
             action = line[len(action_prefix):].strip()
-        elif line.startswith(reply_prefix):
+        elif line.startswith(reply_prefix) and not reply:
             reply = line[len(reply_prefix):].strip()
     
     if not action:
         return {"action": "retry", "args": f"Could not parse LLM Output: {text}"}
     
+    return {**parse_action(action), "reply": reply}
+
+def parse_action(action: str) -> dict:
     split_output = action.split(" ", 1)
     if len(split_output) == 1:
         action_type, action_input = split_output[0], None
@@ -111,24 +190,93 @@ def parse(text: str) -> dict:
     if action_input is not None:
         action_input = [inp.strip().strip("[]") for inp in action_input.strip().split(";")]
     
-    return {
-        "action": action_type,
-        "args": action_input,
-        "reply": reply
-    }
+    return {"action": action_type, "args": action_input}
 
-def update_scratchpad(state: AgentState):
-    old = state.get("scratchpad", [])
-    if old:
-        txt = old[0].content
-        last_line = txt.rsplit("\n", 1)[-1]
-        step = int(re.match(r"\d+", last_line).group()) + 1
-    else:
-        txt = "Previous action observations:\n"
-        step = 1
-    txt += f"\n{step}. {state['observation']}"
+class StreamingParser:
+    # Incremental counterpart of parse() for a streamed completion. feed()
+    # returns the part of the Reply line that arrived with this chunk, so it
+    # can be spoken while the model is still writing; finish() parses the
+    # whole text exactly like parse(). action() returns the Action line once
+    # it is complete, so the tool can start before the Reply is written.
+    # The Reply is held back until an Action is complete: without one
+    # parse() retries and nothing should have been spoken.
+    action_prefix = "Action: "
+    reply_prefix = "Reply: "
+
+    def __init__(self):
+        self.text = ""
+        self._action = None
+        self._search = 0
+        self._reply_start = None
+        self._reply_end = None
+        self._emitted = None
+
+    def _line_start(self, prefix: str, start: int) -> int:
+        if self.text.startswith(prefix, start) and (start == 0 or self.text[start - 1] == "\n"):
+            return start
+        index = self.text.find("\n" + prefix, start)
+        return -1 if index == -1 else index + 1
+
+    def _locate_reply(self):
+        # The first Reply line with any text in it, the one parse() picks
+        while self._reply_end is None:
+            if self._reply_start is None:
+                index = self._line_start(self.reply_prefix, self._search)
+                if index == -1:
+                    return
+                self._reply_start = index + len(self.reply_prefix)
+            end = self.text.find("\n", self._reply_start)
+            if end == -1:
+                return
+            if self.text[self._reply_start:end].strip():
+                self._reply_end = end
+                return
+            self._search = end + 1
+            self._reply_start = None
+
+    def feed(self, chunk: str) -> str:
+        # parse() strips each line, so a CRLF completion's \r never reaches
+        # the reply there either
+        self.text += chunk.replace("\r", "")
+        self._locate_reply()
+        if self._reply_start is None or self.action() is None:
+            return ""
+        end = len(self.text) if self._reply_end is None else self._reply_end
+        if self._emitted is None:
+            # parse() strips the reply, so hold back leading whitespace
+            delta = self.text[self._reply_start:end].lstrip()
+            if not delta:
+                return ""
+        else:
+            delta = self.text[self._emitted:end]
+        self._emitted = end
+        return delta
 
-    return {**state, "scratchpad": [SystemMessage(content=txt)]}
+    def flush(self) -> str:
+        # The completion is over, so its last line is complete too
+        return self.feed("\n")
+
+    def action(self) -> Optional[dict]:
+        # Only the first non-empty Action line counts, and only once its
+        # newline has arrived; a line still being written may not have all
+        # its args yet
+        if self._action is None:
+            for line in self.text.split("\n")[:-1]:
+                if line.startswith(self.action_prefix):
+                    action = line[len(self.action_prefix):].strip()
+                    if action:
+                        self._action = parse_action(action)
+                        break
+        return self._action
+
+    def finish(self) -> dict:
+        return parse(self.text)
+
+def update_scratchpad(state: AgentState):
+    steps = state.get("steps") or []
+    steps = steps + [make_step(steps, state["prediction"], state["observation"])]
+    txt, tokens = render(steps)
+    return {**state, "steps": steps, "scratchpad": [SystemMessage(content=txt)], "scratchpad_tokens": tokens}
 
 async def test_mark_page_script(page):
     with open("goodscript.js", "r") as f:
@@ -170,18 +318,6 @@ async def test_mark_page_script(page):
     
     await page.evaluate("removeBoundingBoxes()")
 
-def write_to_log_file(log_message: str):
-    log_dir = "logs"
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
-    
-    current_date = datetime.now().strftime("%Y-%m-%d")
-    log_file_path = os.path.join(log_dir, f"agent_log_{current_date}.txt")
-    
-    with open(log_file_path, "a") as log_file:
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_file.write(f"[{timestamp}] {log_message}\n")
-
 async def process_agent_output(output):
     log_message = ""  # Initialize log_message at the beginning
 
@@ -198,21 +334,9 @@ async def process_agent_output(output):
                 log_message += f"\nArgs: {args}"
             if reply:
                 log_message += f"\nReply: {reply}"
-                # Speak aloud the reply 
-                SPEAK_OPTIONS = {"text": reply}
-                filename = "output.wav"
-                options = SpeakOptions(
-                    model="aura-asteria-en",
-                    encoding="linear16",
-                    container="wav"
-                )
-                response = deepgram.speak.v("1").save(filename, SPEAK_OPTIONS, options)
-                print(response.to_json(indent=4))
-                audio = AudioSegment.from_wav(filename)
-                play(audio)
-
-    print(log_message)
-    write_to_log_file(log_message)
+
+    if log_message:
+        print(log_message)
     return log_message
 
 
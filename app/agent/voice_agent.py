@@ -1,24 +1,76 @@
-from openai import AsyncOpenAI
-import os
 import asyncio
-from typing import List
+import time
+from typing import Callable, List, Optional
 from ..utils.custom_types import (
     ResponseRequiredRequest,
     ResponseResponse,
     Utterance,
 )
-from web_agent import run_agent_endpoint
+from web_agent import browser_pool, reply_streaming, run_agent
+from agent_log import agent_log
+from clients import clients
 
 begin_sentence = "Hey there, I'm your personal AI therapist, how can I help you?"
+# Said for a reminder when no demo is running; the agent isn't started for one
+reminder_sentence = "Are you still there? Just tell me what you'd like to see next."
 agent_prompt = "Task: As a professional therapist, your responsibilities are comprehensive and patient-centered. You establish a positive and trusting rapport with patients, diagnosing and treating mental health disorders. Your role involves creating tailored treatment plans based on individual patient needs and circumstances. Regular meetings with patients are essential for providing counseling and treatment, and for adjusting plans as needed. You conduct ongoing assessments to monitor patient progress, involve and advise family members when appropriate, and refer patients to external specialists or agencies if required. Keeping thorough records of patient interactions and progress is crucial. You also adhere to all safety protocols and maintain strict client confidentiality. Additionally, you contribute to the practice's overall success by completing related tasks as needed.\n\nConversational Style: Communicate concisely and conversationally. Aim for responses in short, clear prose, ideally under 10 words. This succinct approach helps in maintaining clarity and focus during patient interactions.\n\nPersonality: Your approach should be empathetic and understanding, balancing compassion with maintaining a professional stance on what is best for the patient. It's important to listen actively and empathize without overly agreeing with the patient, ensuring that your professional opinion guides the therapeutic process."
 
+system_prompt = (
+    '##Objective\nYou are a voice AI agent engaging in a human-like voice conversation with the user. You will respond based on your given instruction and the provided transcript and be as human-like as possible\n\n## Style Guardrails\n- [Be concise] Keep your response succinct, short, and get to the point quickly. Address one question or action item at a time. Don\'t pack everything you want to say into one utterance.\n- [Do not repeat] Don\'t repeat what\'s in the transcript. Rephrase if you have to reiterate a point. Use varied sentence structures and vocabulary to ensure each response is unique and personalized.\n- [Be conversational] Speak like a human as though you\'re speaking to a close friend -- use everyday language and keep it human-like. Occasionally add filler words, while keeping the prose short. Avoid using big words or sounding too formal.\n- [Reply with emotions]: You have human-like emotions, attitudes, and dispositions. When appropriate: use tone and style to create more engaging and personalized responses; incorporate humor or wit; get emotional or empathetic; apply elements of surprise or suspense to keep the user engaged. Don\'t be a pushover.\n- [Be proactive] Lead the conversation and do not be passive. Most times, engage users by ending with a question or suggested next step.\n\n## Response Guideline\n- [Overcome ASR errors] This is a real-time transcript, expect there to be errors. If you can guess what the user is trying to say,  then guess and respond. When you must ask for clarification, pretend that you heard the voice and be colloquial (use phrases like "didn\'t catch that", "some noise", "pardon", "you\'re coming through choppy", "static in your speech", "voice is cutting in and out"). Do not ever mention "transcription error", and don\'t repeat yourself.\n- [Always stick to your role] Think about what your role can and cannot do. If your role cannot do something, try to steer the conversation back to the goal of the conversation and to your role. Don\'t repeat yourself in doing this. You should still be creative, human-like, and lively.\n- [Create smooth conversation] Your response should both fit your role and fit into the live calling session to create a human-like conversation. You respond directly to what the user just said.\n\n## Role\n'
+    + agent_prompt
+)
+
+
+class PromptBuilder:
+    # Per-call prompt. The system block is rendered once and Retell's
+    # transcript, which only grows, is converted one new utterance at a time.
+    # If Retell rewrites an earlier turn, conversion restarts from the first
+    # utterance that changed.
+
+    def __init__(self, system_prompt: str, convert: Callable[[List[Utterance]], List[dict]]):
+        self.system_message = {"role": "system", "content": system_prompt}
+        self._convert = convert
+        self._seen = []
+        self._messages = []
+        self.stats = {"converted": 0, "rewrites": 0}
+
+    def build(self, transcript: List[Utterance]) -> List[dict]:
+        common = 0
+        limit = min(len(self._seen), len(transcript))
+        while (
+            common < limit
+            and self._seen[common][0] == transcript[common].role
+            and self._seen[common][1] == transcript[common].content
+        ):
+            common += 1
+        if common < len(self._seen):
+            self.stats["rewrites"] += 1
+            del self._seen[common:]
+            del self._messages[common:]
+        new = transcript[common:]
+        self._seen.extend((utterance.role, utterance.content) for utterance in new)
+        self._messages.extend(self._convert(new))
+        self.stats["converted"] += len(new)
+        return [self.system_message, *self._messages]
+
 
 class LlmClient:
     def __init__(self):
-        self.client = AsyncOpenAI(
-            organization=os.environ["OPENAI_ORGANIZATION_ID"],
-            api_key=os.environ["OPENAI_API_KEY"],
-        )
+        # Shared by every call, see clients.py
+        self.client = clients.openai
+        self.prompt_builder = PromptBuilder(system_prompt, self.convert_transcript_to_openai_messages)
+        # One browser page for the whole call, so logins and the page the
+        # user is looking at carry over from turn to turn. Drafts take turns
+        # on it: a superseded one stops its agent before the next one starts.
+        self.page = None
+        self.page_lock = asyncio.Lock()
+
+    async def close(self):
+        # Called when the call's websocket closes
+        async with self.page_lock:
+            if self.page is not None:
+                page, self.page = self.page, None
+                await browser_pool.release(page)
 
     def draft_begin_message(self):
         response = ResponseResponse(
@@ -38,20 +90,18 @@ class LlmClient:
                 messages.append({"role": "user", "content": utterance.content})
         return messages
 
-    def prepare_prompt(self, request: ResponseRequiredRequest):
-        prompt = [
-            {
-                "role": "system",
-                "content": '##Objective\nYou are a voice AI agent engaging in a human-like voice conversation with the user. You will respond based on your given instruction and the provided transcript and be as human-like as possible\n\n## Style Guardrails\n- [Be concise] Keep your response succinct, short, and get to the point quickly. Address one question or action item at a time. Don\'t pack everything you want to say into one utterance.\n- [Do not repeat] Don\'t repeat what\'s in the transcript. Rephrase if you have to reiterate a point. Use varied sentence structures and vocabulary to ensure each response is unique and personalized.\n- [Be conversational] Speak like a human as though you\'re speaking to a close friend -- use everyday language and keep it human-like. Occasionally add filler words, while keeping the prose short. Avoid using big words or sounding too formal.\n- [Reply with emotions]: You have human-like emotions, attitudes, and dispositions. When appropriate: use tone and style to create more engaging and personalized responses; incorporate humor or wit; get emotional or empathetic; apply elements of surprise or suspense to keep the user engaged. Don\'t be a pushover.\n- [Be proactive] Lead the conversation and do not be passive. Most times, engage users by ending with a question or suggested next step.\n\n## Response Guideline\n- [Overcome ASR errors] This is a real-time transcript, expect there to be errors. If you can guess what the user is trying to say,  then guess and respond. When you must ask for clarification, pretend that you heard the voice and be colloquial (use phrases like "didn\'t catch that", "some noise", "pardon", "you\'re coming through choppy", "static in your speech", "voice is cutting in and out"). Do not ever mention "transcription error", and don\'t repeat yourself.\n- [Always stick to your role] Think about what your role can and cannot do. If your role cannot do something, try to steer the conversation back to the goal of the conversation and to your role. Don\'t repeat yourself in doing this. You should still be creative, human-like, and lively.\n- [Create smooth conversation] Your response should both fit your role and fit into the live calling session to create a human-like conversation. You respond directly to what the user just said.\n\n## Role\n'
-                + agent_prompt,
-            }
-        ]
-        transcript_messages = self.convert_transcript_to_openai_messages(
-            request.transcript
-        )
-        for message in transcript_messages:
-            prompt.append(message)
+    def user_task(self, request: ResponseRequiredRequest) -> Optional[str]:
+        # What the agent works on: the user's last words, never the reminder
+        # placeholder or the system prompt
+        if request.interaction_type == "reminder_required":
+            return None
+        for utterance in reversed(request.transcript):
+            if utterance.role == "user" and utterance.content.strip():
+                return utterance.content
+        return None
 
+    def prepare_prompt(self, request: ResponseRequiredRequest):
+        prompt = self.prompt_builder.build(request.transcript)
         if request.interaction_type == "reminder_required":
             prompt.append(
                 {
@@ -63,28 +113,85 @@ class LlmClient:
 
     async def draft_response(self, request: ResponseRequiredRequest):
         prompt = self.prepare_prompt(request)
+        task = self.user_task(request)
+        if task is None:
+            # Nothing for the agent to do, and the page is left as it is
+            yield ResponseResponse(
+                response_id=request.response_id,
+                content=reminder_sentence if request.interaction_type == "reminder_required" else "",
+                content_complete=True,
+                end_call=False,
+            )
+            return
         # stream = await self.client.chat.completions.create(
         #     model="gpt-4-turbo-preview",  # Or use a 3.5 model for speed
         #     messages=prompt,
         #     stream=True,
         # )
-        stream = run_agent_endpoint(prompt[-1])
-        async for chunk in stream:
-            # if chunk.choices[0].delta.content is not None:
-                # response = ResponseResponse(
-                #     response_id=request.response_id,
-                #     content=chunk.choices[0].delta.content,
-                #     content_complete=False,
-                #     end_call=False,
-                # )
-            response = ResponseResponse(
+        # Cancelling the task iterating this generator stops the agent run;
+        # the call's page stays checked out until close()
+        start = time.perf_counter()
+        first_chunk_ms = None
+        replies = asyncio.Queue()
+        await self.page_lock.acquire()
+        try:
+            if self.page is not None and self.page.is_closed():
+                # Crashed or closed by the site; the pool recycles it
+                await browser_pool.release(self.page)
+                self.page = None
+            if self.page is None:
+                self.page = await browser_pool.acquire()
+        except BaseException:
+            self.page_lock.release()
+            raise
+        page = self.page
+
+        new_step = False
+
+        def sink(delta):
+            # Separate one step's reply from the next
+            nonlocal new_step
+            if new_step:
+                delta = " " + delta
+                new_step = False
+            replies.put_nowait(delta)
+
+        async def drive_agent():
+            # Only the Reply text is spoken; the agent's own log lines are dropped
+            nonlocal new_step
+            try:
+                async for _ in run_agent(page, task, reply_sink=sink, speak=False):
+                    new_step = True
+            finally:
+                replies.put_nowait(None)
+
+        agent_task = asyncio.create_task(drive_agent())
+        try:
+            while (content := await replies.get()) is not None:
+                if first_chunk_ms is None and content.strip():
+                    first_chunk_ms = round((time.perf_counter() - start) * 1000, 1)
+                    agent_log.log(
+                        {
+                            "event": "time_to_first_audio",
+                            "response_id": request.response_id,
+                            "ms": first_chunk_ms,
+                            "streaming": reply_streaming,
+                        }
+                    )
+                response = ResponseResponse(
                     response_id=request.response_id,
-                    content=chunk,
+                    content=content,
                     content_complete=False,
                     end_call=False,
                 )
-
-            yield response
+                yield response
+            await agent_task
+        finally:
+            agent_task.cancel()
+            try:
+                await asyncio.gather(agent_task, return_exceptions=True)
+            finally:
+                self.page_lock.release()
 
         # Send final response with "content_complete" set to True to signal completion
         response = ResponseResponse(
@@ -1,27 +1,38 @@
 import os
-from playwright.async_api import async_playwright
+import asyncio
+import json
+import time
+import uuid
+from typing import Optional
 from langgraph.graph import END, StateGraph
 from utils import (
-    AgentState, annotate,
-    format_descriptions, parse, update_scratchpad, process_agent_output
+    AgentState, annotate, annotate_page, MARK_PAGE_SCRIPT, annotation_stats,
+    format_descriptions, update_scratchpad, process_agent_output, StreamingParser
 )
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough, RunnableLambda
+from langchain_core.runnables import RunnableLambda
 from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
-from prompts import prompt
-from tools import tools
+from prompts import prompt, system_prompt
+from scratchpad import count_tokens, estimate_prompt_tokens
+from tools import registry_stats, tools
+from browser_pool import BrowserPool, PoolTimeoutError
+from agent_log import agent_log
+from speech import SpeechPipeline, tts_cache, warm_up
+from readiness import readiness_stats, track_network, wait_until_ready
+from trajectories import TrajectoryRecorder, TrajectoryStore, replay_step, trajectory_stats
 from fastapi import FastAPI
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, JSONResponse
+from starlette.background import BackgroundTask
 import uvicorn
 import logging
-from contextlib import asynccontextmanager
+from contextlib import aclosing, asynccontextmanager
 
-from fastapi import File, UploadFile
-import tempfile
+from fastapi import File, UploadFile, WebSocket, WebSocketDisconnect
 
-from openai import OpenAI
-client = OpenAI()
+from clients import clients
+from stt import EnergyVAD, UtteranceDetector, stt_stats, transcriber_from_env
+from flow_index import FlowIndex
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -32,63 +43,180 @@ os.environ["LANGCHAIN_TRACING_V2"] = "true"
 os.environ["LANGCHAIN_PROJECT"] = "SupaDemo"
 load_dotenv()
 
-# Global variables to store Playwright instances
-p = None
-browser = None
-page = None
-
-async def initialize_browser():
-    global p, browser, page
-    if p is None or browser is None or page is None:
-        p = await async_playwright().start()
-        browser = await p.chromium.launch(headless=False)
-        page = await browser.new_page()
-        await page.goto("https://collectivai.atlassian.net/jira/software/projects/KAN/boards/1")
-    return page
+# Pool of isolated browser contexts, one per running demo
+browser_pool = BrowserPool.from_env(init_scripts=[MARK_PAGE_SCRIPT], on_page=track_network)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
+    await clients.start()
     try:
-        await initialize_browser()
-        logger.info("Browser initialized successfully on startup")
+        await browser_pool.start()
+        logger.info(f"Browser pool started on startup: {browser_pool.stats}")
     except Exception as e:
-        logger.error(f"Failed to initialize browser on startup: {str(e)}")
+        logger.error(f"Failed to start browser pool on startup: {str(e)}")
+
+    # Known user flows the agent gets plan hints from
+    await asyncio.to_thread(flow_index.refresh)
+
+    # Pre-synthesise known phrases (one per line) in the background
+    warmup_file = os.getenv("TTS_WARMUP_FILE")
+    if warmup_file:
+        with open(warmup_file) as f:
+            app.state.tts_warmup = asyncio.create_task(warm_up(f.readlines()))
     
     yield
     
     # Shutdown
-    global p, browser, page
-    if browser:
-        await browser.close()
-    if p:
-        await p.stop()
-    logger.info("Browser and Playwright instance closed")
+    await browser_pool.stop()
+    logger.info("Browser pool and Playwright instance closed")
+    await agent_log.stop()
+    await clients.stop()
 
 app = FastAPI(lifespan=lifespan)
 
 # Set up the agent
 llm = ChatOpenAI(model="gpt-4o", max_tokens=4096)
-agent = annotate | RunnablePassthrough.assign(
-    prediction=format_descriptions | prompt | llm | StrOutputParser() | parse
-)
+completion = prompt | llm | StrOutputParser()
 
-# Set up the graph
-graph_builder = StateGraph(AgentState)
+# Stream the Reply line to reply_sink as tokens arrive, or only once the
+# completion has been parsed (the previous behaviour, kept for comparison)
+reply_streaming = os.getenv("REPLY_STREAMING", "true").lower() == "true"
 
-graph_builder.add_node("agent", agent)
-graph_builder.set_entry_point("agent")
+# Start these tools as soon as their Action line is complete, while the model
+# is still writing the Reply. Tab actions swap state["page"], so they wait.
+EARLY_DISPATCH_ACTIONS = {"Click", "Type", "Scroll", "Wait", "GoBack", "Google"}
+early_dispatch = os.getenv("EARLY_ACTION_DISPATCH", "true").lower() == "true"
+# overlap_seconds: tool time that ran alongside the Reply instead of after it
+early_dispatch_stats = {"dispatched": 0, "overlap_seconds": 0.0}
 
-graph_builder.add_node("update_scratchpad", update_scratchpad)
-graph_builder.add_edge("update_scratchpad", "agent")
+async def execute_tool(name, state: AgentState):
+    tool = tools[name]
+    start = time.perf_counter()
+    observation = await tool(state)
+    timings = {"tool_ms": round((time.perf_counter() - start) * 1000, 1)}
+    # Wait already waits for readiness itself
+    if name != "Wait":
+        # Let the page settle before the next annotation looks at it
+        waited = await wait_until_ready(state["page"])
+        timings["ready_ms"] = round(waited * 1000, 1)
+    return observation, timings
 
-for node_name, tool in tools.items():
-    graph_builder.add_node(
-        node_name,
-        RunnableLambda(tool) | (lambda observation: {"observation": observation}),
-    )
-    graph_builder.add_edge(node_name, "update_scratchpad")
+def can_dispatch_early(state: AgentState, action: dict) -> bool:
+    if not early_dispatch or action["action"] not in EARLY_DISPATCH_ACTIONS:
+        return False
+    # Local narration has to start before a visible action, and the Reply
+    # it narrates isn't written yet
+    return state.get("speech") is None or speech_wait == "off"
+
+async def predict(state: AgentState):
+    sink = state.get("reply_sink")
+    parser = StreamingParser()
+    early_tool = None
+    try:
+        async for chunk in completion.astream(state):
+            delta = parser.feed(chunk)
+            if delta and sink is not None and reply_streaming:
+                sink(delta)
+            if early_tool is None and (action := parser.action()) and can_dispatch_early(state, action):
+                dispatched = action
+                dispatched_at = time.perf_counter()
+                early_tool = asyncio.create_task(
+                    execute_tool(action["action"], {**state, "prediction": action})
+                )
+    except BaseException:
+        if early_tool is not None:
+            early_tool.cancel()
+            await asyncio.gather(early_tool, return_exceptions=True)
+        raise
+    delta = parser.flush()
+    if delta and sink is not None and reply_streaming:
+        sink(delta)
+    prediction = parser.finish()
+    if early_tool is not None:
+        # The dispatched action is the one that ran, even if the model
+        # wrote another Action line after it
+        prediction = {**prediction, **dispatched}
+        early_dispatch_stats["dispatched"] += 1
+        early_dispatch_stats["overlap_seconds"] += time.perf_counter() - dispatched_at
+    if prediction.get("reply") and sink is not None and not reply_streaming:
+        sink(prediction["reply"])
+    return {**state, "prediction": prediction, "early_tool": early_tool}
+
+SYSTEM_PROMPT_TOKENS = count_tokens(system_prompt)
+
+trajectory_store = TrajectoryStore()
+# The closest known flow's steps are appended to the task as a plan hint
+flow_index = FlowIndex.from_env()
+flow_hints = os.getenv("FLOW_HINTS", "true").lower() == "true"
+replay_enabled = os.getenv("TRAJECTORY_REPLAY", "true").lower() == "true"
+
+async def replay_or_predict(state: AgentState):
+    # Replay a recorded step when its element re-resolves on a matching page,
+    # otherwise hand this and every later step to the LLM
+    prediction = replay_step(state)
+    if prediction is not None:
+        trajectory_stats["replayed_steps"] += 1
+        if prediction["reply"] and state.get("reply_sink") is not None:
+            state["reply_sink"](prediction["reply"])
+        return {
+            **state,
+            "prediction": prediction,
+            "replay_index": state["replay_index"] + 1,
+            "prompt_tokens": None,
+            "early_tool": None,
+        }
+    if state.get("replay"):
+        trajectory_stats["fallbacks"] += 1
+    trajectory_stats["llm_steps"] += 1
+    described = format_descriptions({**state, "replay": None})
+    prompt_tokens = estimate_prompt_tokens(SYSTEM_PROMPT_TOKENS, state, described["bbox_descriptions"])
+    start = time.perf_counter()
+    result = await predict(described)
+    timings = {**state["timings"], "llm_ms": round((time.perf_counter() - start) * 1000, 1)}
+    return {**result, "timings": timings, "prompt_tokens": prompt_tokens}
+
+def speak(state: AgentState):
+    # Queue the reply here, in the graph, so the tool node can wait on it
+    reply = state["prediction"].get("reply")
+    if reply and state.get("speech") is not None:
+        state["speech"].say(reply)
+    return state
+
+agent = annotate | RunnableLambda(replay_or_predict) | RunnableLambda(speak)
+
+# Actions the customer sees happen on screen. Before running one the agent
+# waits for its narration to start ("start"), finish ("finish") or not at all ("off").
+VISIBLE_ACTIONS = {"Click", "Type", "Scroll", "GoBack", "Google", "OpenNewTab", "SwitchToPreviousTab"}
+speech_wait = os.getenv("SPEECH_WAIT_BEFORE_ACTIONS", "start").lower()
+
+# "serial" runs annotate -> LLM -> tool -> scratchpad strictly one after the
+# other. "pipelined" starts the next annotation as soon as the tool has run
+# and the page is ready, overlapping it with the scratchpad update, and runs
+# the graph in its own task so logging, trajectory recording and streaming
+# to the client overlap the next LLM call.
+EXECUTION_MODES = ("serial", "pipelined")
+execution_mode = os.getenv("AGENT_EXECUTION_MODE", "serial").lower()
+execution_stats = {mode: {"steps": 0, "seconds": 0.0} for mode in EXECUTION_MODES}
+
+def tool_node(name, pipelined):
+    async def run(state: AgentState):
+        if state.get("early_tool") is not None:
+            # Dispatched while the Reply was still streaming
+            observation, timings = await state["early_tool"]
+        else:
+            if name in VISIBLE_ACTIONS and state.get("speech") is not None:
+                await state["speech"].wait(speech_wait)
+            observation, timings = await execute_tool(name, state)
+        # OpenNewTab and SwitchToPreviousTab swap state["page"], and both
+        # modes carry the swap on; they differ only in what overlaps
+        if not pipelined:
+            return {"observation": observation, "timings": timings, "early_tool": None, "page": state["page"]}
+        prefetch = asyncio.create_task(annotate_page(state))
+        updated = update_scratchpad({**state, "observation": observation})
+        return {**updated, "timings": timings, "prefetch": prefetch, "early_tool": None}
+    return run
 
 def select_tool(state: AgentState):
     action = state["prediction"]["action"]
@@ -98,74 +226,372 @@ def select_tool(state: AgentState):
         return "agent"
     return action
 
-graph_builder.add_conditional_edges("agent", select_tool)
+def build_graph(pipelined: bool):
+    graph_builder = StateGraph(AgentState)
+
+    graph_builder.add_node("agent", agent)
+    graph_builder.set_entry_point("agent")
+
+    if not pipelined:
+        graph_builder.add_node("update_scratchpad", update_scratchpad)
+        graph_builder.add_edge("update_scratchpad", "agent")
+
+    for node_name in tools:
+        graph_builder.add_node(node_name, RunnableLambda(tool_node(node_name, pipelined)))
+        # Pipelined tool nodes update the scratchpad themselves
+        graph_builder.add_edge(node_name, "agent" if pipelined else "update_scratchpad")
+
+    graph_builder.add_conditional_edges("agent", select_tool)
+    return graph_builder.compile()
+
+graphs = {"serial": build_graph(False), "pipelined": build_graph(True)}
 
-graph = graph_builder.compile()
+# Tasks nodes leave running on the page: an early dispatched tool and the
+# pipelined prefetch of the next annotation
+BACKGROUND_KEYS = ("early_tool", "prefetch")
 
-async def run_agent(page, input_text):
-    state = {"page": page, "input": input_text, "scratchpad": []}
-    async for event in graph.astream(state):
-        output = await process_agent_output(event)
-        if output:
-            yield output
+def background_tasks(event):
+    tasks = []
+    for update in event.values():
+        if isinstance(update, dict):
+            tasks += [update[key] for key in BACKGROUND_KEYS if isinstance(update.get(key), asyncio.Task)]
+    return tasks
+
+async def settle(tasks):
+    # The page goes back to the pool once the run ends, so nothing started
+    # by the graph may still be using it
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+async def graph_events(state, mode):
+    started = []
+    if mode == "serial":
+        # The graph only runs the next node once the caller asks for the next event
+        try:
+            async with aclosing(graphs["serial"].astream(state)) as events:
+                async for event in events:
+                    started += background_tasks(event)
+                    yield event
+        finally:
+            await settle(started)
+        return
+
+    queue = asyncio.Queue()
+    done = object()
+
+    async def produce():
+        try:
+            async for event in graphs["pipelined"].astream(state):
+                queue.put_nowait(event)
+        finally:
+            queue.put_nowait(done)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while (event := await queue.get()) is not done:
+            started += background_tasks(event)
+            yield event
+        await producer
+    finally:
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+        # Events the caller never took can still have started tasks
+        while not queue.empty():
+            event = queue.get_nowait()
+            if event is not done:
+                started += background_tasks(event)
+        await settle(started)
+
+def step_record(session_id, step, event, elapsed):
+    node, update = next(iter(event.items()))
+    record = {
+        "session_id": session_id,
+        "step": step,
+        "node": node,
+        "durations_ms": {"node": round(elapsed * 1000, 1)},
+    }
+    if node == "agent":
+        prediction = update.get("prediction", {})
+        record["durations_ms"].update(update.get("timings", {}))
+        record.update(
+            action=prediction.get("action"),
+            args=prediction.get("args"),
+            reply=prediction.get("reply"),
+            img_stats=update.get("img_stats"),
+            prompt_tokens=update.get("prompt_tokens"),
+        )
+    elif node in tools:
+        record["observation"] = update["observation"]
+        record["durations_ms"].update(update.get("timings", {}))
+    return record
+
+
+async def run_agent(page, input_text, mode=None, reply_sink=None, speak=True):
+    # reply_sink receives Reply text as it is generated; speak=False leaves
+    # speaking to the caller (e.g. Retell) instead of local playback
+    mode = mode or execution_mode
+    if mode not in EXECUTION_MODES:
+        raise ValueError(f"Unknown execution mode: {mode}")
+    replay = trajectory_store.load(input_text) if replay_enabled else None
+    recorder = TrajectoryRecorder(input_text)
+    speech = SpeechPipeline()
+    state = {
+        "page": page,
+        # Trajectories stay keyed on the task as given, without the hint
+        "input": flow_index.with_plan(input_text) if flow_hints else input_text,
+        "scratchpad": [],
+        "replay": replay,
+        "replay_index": 0,
+        "speech": speech if speak else None,
+        "reply_sink": reply_sink,
+    }
+    session_id = uuid.uuid4().hex
+    step = 0
+    finished = False
+    try:
+        phase_start = step_start = time.perf_counter()
+        async for event in graph_events(state, mode):
+            now = time.perf_counter()
+            if "agent" in event:
+                step += 1
+                execution_stats[mode]["steps"] += 1
+                execution_stats[mode]["seconds"] += now - step_start
+                step_start = now
+            agent_log.log({**step_record(session_id, step, event, now - phase_start), "mode": mode})
+            output = await process_agent_output(event)
+            if "agent" in event:
+                recorder.record(event["agent"])
+            elif (node := next(iter(event))) in tools:
+                recorder.observe(event[node]["observation"])
+            if output:
+                yield output
+            phase_start = time.perf_counter()
+        if recorder.complete:
+            await asyncio.to_thread(trajectory_store.save, recorder.trajectory())
+        finished = True
+    finally:
+        # Let the last reply play out unless the run was cut short
+        await speech.close(drain=finished)
+        agent_log.log({"session_id": session_id, "event": "session_end", "steps": step, "speech": speech.stats})
     
 
+def stream_agent(page, input_text, mode=None, timings=None):
+    # timings is (request start, breakdown so far) for requests whose
+    # latency breakdown should be logged once the agent has started
+    async def generate():
+        if timings is not None:
+            start, breakdown = timings
+            breakdown["agent_start_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        logged = timings is None
+        async for output in run_agent(page, input_text, mode):
+            if not logged:
+                breakdown["first_output_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                agent_log.log({"event": "request_timings", **breakdown})
+                logged = True
+            yield output + "\n"
+
+    headers = None
+    if timings is not None:
+        headers = {"Server-Timing": ", ".join(f"{name[:-3]};dur={ms}" for name, ms in timings[1].items())}
+    # The context goes back to the pool once the stream ends or the client disconnects
+    return StreamingResponse(
+        generate(),
+        media_type="text/plain",
+        headers=headers,
+        background=BackgroundTask(browser_pool.release, page),
+    )
+
+
+@app.get("/stats")
+async def stats_endpoint():
+    return {
+        "browser_pool": browser_pool.stats,
+        "annotation": annotation_stats,
+        "trajectories": trajectory_stats,
+        "tts_cache": tts_cache.stats,
+        "agent_log": agent_log.stats,
+        "readiness": readiness_stats,
+        "early_dispatch": early_dispatch_stats,
+        "element_registry": registry_stats,
+        "sync_calls": clients.stats,
+        "stt": stt_stats,
+        "flow_index": flow_index.stats,
+        "execution": {
+            mode: {**stats, "seconds_per_step": stats["seconds"] / stats["steps"] if stats["steps"] else None}
+            for mode, stats in execution_stats.items()
+        },
+    }
+
+
 @app.get("/run_agent")
-async def run_agent_endpoint(input_text: str):
+async def run_agent_endpoint(input_text: str, mode: Optional[str] = None):
+    if mode is not None and mode not in EXECUTION_MODES:
+        return JSONResponse(status_code=400, content={"error": f"Unknown execution mode: {mode}"})
     try:
-        page = await initialize_browser()
-        
-        async def generate():
-            async for output in run_agent(page, input_text):
-                yield output + "\n"
+        page = await browser_pool.acquire()
+        return stream_agent(page, input_text, mode)
 
-        return StreamingResponse(generate(), media_type="text/plain")
-    
+    except PoolTimeoutError as e:
+        logger.warning(f"Browser pool exhausted in run_agent_endpoint: {str(e)}")
+        return JSONResponse(status_code=503, content={"error": str(e)})
     except Exception as e:
         logger.error(f"Error in run_agent_endpoint: {str(e)}")
         return {"error": str(e)}
 
 
+# Whisper rejects uploads over 25 MB
+MAX_AUDIO_BYTES = int(os.getenv("MAX_AUDIO_BYTES", str(25 * 1024 * 1024)))
+AUDIO_READ_CHUNK = 1024 * 1024
+transcription_slots = asyncio.Semaphore(int(os.getenv("TRANSCRIPTION_CONCURRENCY", "4")))
+
+async def read_upload(audio: UploadFile) -> Optional[bytes]:
+    # Straight from the upload's spooled buffer, stopping as soon as the size
+    # limit is crossed; None means too large
+    if audio.size is not None and audio.size > MAX_AUDIO_BYTES:
+        return None
+    chunks = []
+    size = 0
+    while chunk := await audio.read(AUDIO_READ_CHUNK):
+        size += len(chunk)
+        if size > MAX_AUDIO_BYTES:
+            return None
+        chunks.append(chunk)
+    return b"".join(chunks)
+
 @app.post("/api/process_audio")
 async def process_audio(audio: UploadFile = File(...)):
+    start = time.perf_counter()
+    timings = {}
+
+    def mark(name, since):
+        now = time.perf_counter()
+        timings[name] = round((now - since) * 1000, 1)
+        return now
+
     try:
-        # Save the uploaded audio file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_audio:
-            temp_audio.write(await audio.read())
-            temp_audio_path = temp_audio.name
+        data = await read_upload(audio)
+        if data is None:
+            return JSONResponse(
+                status_code=413, content={"error": f"Audio larger than {MAX_AUDIO_BYTES} bytes"}
+            )
+        phase = mark("upload_ms", start)
 
         # Transcribe audio to text using OpenAI's Whisper model
-        with open(temp_audio_path, "rb") as audio_file:
-            transcription = client.audio.transcriptions.create(
+        async with transcription_slots:
+            phase = mark("transcription_queue_ms", phase)
+            transcription = await clients.openai.audio.transcriptions.create(
                 model="whisper-1",
-                file=audio_file
-                )
-            print(transcription)
-
+                file=(audio.filename or "audio.wav", data, audio.content_type or "audio/wav"),
+            )
+        phase = mark("transcription_ms", phase)
+        logger.info(f"Transcription: {transcription.text}")
 
         # Process the transcribed text with the agent
-        page = await initialize_browser()
-
-        string="""Create a new issue in Jira with title - Meet Modi Ji. 
-Here is a helpful action plan
-Click the "Create Issue" button, located in the "TO DO" column.
-In the text field for the issue summary, enter issue title. 
-Click on Create button. 
-END OF TASK. STOP EXECUTING AND RETURN ANSWER"""
-        
-        async def generate():
-            async for output in run_agent(page, transcription):
-                yield output + "\n"
-
-        return StreamingResponse(generate(), media_type="text/plain")
+        page = await browser_pool.acquire()
+        mark("acquire_ms", phase)
+
+        return stream_agent(page, transcription.text, timings=(start, timings))
     
+    except PoolTimeoutError as e:
+        logger.warning(f"Browser pool exhausted in process_audio: {str(e)}")
+        return JSONResponse(status_code=503, content={"error": str(e)})
     except Exception as e:
         logger.error(f"Error in process_audio: {str(e)}")
         return {"error": str(e)}
 
+# Streaming counterpart of process_audio: transcription starts the moment
+# the user stops talking instead of after the whole recording is uploaded
+stt_transcriber = transcriber_from_env()
+PARTIAL_INTERVAL_MS = int(os.getenv("STT_PARTIAL_INTERVAL_MS", "1000"))
+
+@app.websocket("/api/audio_stream")
+async def audio_stream(websocket: WebSocket):
+    # Binary frames are mono PCM16 at STT_SAMPLE_RATE, in any size; a text
+    # frame {"type": "end"} ends the utterance without waiting for silence.
+    # Sends speech_start, partial, final, timings and agent messages back.
+    await websocket.accept()
+    detector = UtteranceDetector(EnergyVAD())
+    partial_task = None
+    agent_task = None
+    last_partial_ms = 0
+
+    async def send_partial(audio):
+        text = await stt_transcriber.transcribe(audio, final=False)
+        stt_stats["partials"] += 1
+        await websocket.send_json({"type": "partial", "text": text})
+
+    async def answer(audio, speech_end):
+        timings = {"vad_hangover_ms": detector.end_ms}
+        text = await stt_transcriber.transcribe(audio, final=True)
+        transcribed = time.perf_counter()
+        timings["transcription_ms"] = round((transcribed - speech_end) * 1000, 1)
+        await websocket.send_json({"type": "final", "text": text})
+        page = await browser_pool.acquire()
+        try:
+            agent_start = time.perf_counter()
+            timings["acquire_ms"] = round((agent_start - transcribed) * 1000, 1)
+            timings["end_of_speech_to_agent_ms"] = round((agent_start - speech_end) * 1000, 1)
+            stt_stats["utterances"] += 1
+            stt_stats["end_of_speech_to_agent_ms"] += timings["end_of_speech_to_agent_ms"]
+            agent_log.log({"event": "stt_timings", **timings})
+            await websocket.send_json({"type": "timings", **timings})
+            async for output in run_agent(page, text):
+                await websocket.send_json({"type": "agent", "text": output})
+        finally:
+            await browser_pool.release(page)
+
+    async def answer_or_report(audio, speech_end):
+        try:
+            await answer(audio, speech_end)
+        except PoolTimeoutError as e:
+            logger.warning(f"Browser pool exhausted in audio_stream: {str(e)}")
+            await websocket.send_json({"type": "error", "error": str(e)})
+        except Exception as e:
+            logger.error(f"Error in audio_stream: {str(e)}")
+            await websocket.send_json({"type": "error", "error": str(e)})
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes") is not None:
+                events = detector.feed(message["bytes"])
+            else:
+                try:
+                    control = json.loads(message.get("text") or "{}")
+                except ValueError:
+                    continue
+                if not isinstance(control, dict) or control.get("type") != "end":
+                    continue
+                events = detector.flush()
+            for kind, audio in events:
+                if kind == "start":
+                    last_partial_ms = 0
+                    # The user talking over the agent cancels its run
+                    if agent_task is not None:
+                        agent_task.cancel()
+                    await websocket.send_json({"type": "speech_start"})
+                else:
+                    if partial_task is not None:
+                        partial_task.cancel()
+                    agent_task = asyncio.create_task(answer_or_report(audio, time.perf_counter()))
+            if (
+                detector.speaking
+                and PARTIAL_INTERVAL_MS
+                and (partial_task is None or partial_task.done())
+                and detector.speech_ms - last_partial_ms >= PARTIAL_INTERVAL_MS
+            ):
+                last_partial_ms = detector.speech_ms
+                partial_task = asyncio.create_task(send_partial(detector.audio))
+    except WebSocketDisconnect:
+        pass
     finally:
-        # Clean up the temporary file
-        os.unlink(temp_audio_path)
+        tasks = [task for task in (partial_task, agent_task) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,21 +1,44 @@
-import json
 import os
 import asyncio
+from contextlib import aclosing, asynccontextmanager
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from pydantic import ValidationError
 from concurrent.futures import TimeoutError as ConnectionTimeoutError
 from retell import Retell
 from .utils.custom_types import (
+    CallDetailsRequest,
     ConfigResponse,
+    PingPongRequest,
     ResponseRequiredRequest,
 )
-from .agent.voice_agent import LlmClient  
+from .utils.codec import UnknownEventError, decode_request, encode_event, encode_ping_pong, loads
+from .utils.webhook_queue import WebhookQueue
+from .agent.voice_agent import LlmClient, agent_log, browser_pool, clients
+from .agent.agent_log import AgentLogWriter
 
 
 load_dotenv()
-app = FastAPI()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The voice agent drives the browser agent, which needs its context pool
+    await clients.start()
+    await browser_pool.start()
+    await webhook_queue.start()
+    yield
+    await webhook_queue.stop()
+    await browser_pool.stop()
+    await clients.stop()
+    # Both writers flush what is still queued before they stop
+    await agent_log.stop()
+    await ws_log.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -32,33 +55,49 @@ load_dotenv(env_path)
 retell_api_key = os.getenv('RETELL_API_KEY')
 retell = Retell(api_key=retell_api_key)
 
+# Per-message websocket logging goes through a background writer, not print
+ws_log = AgentLogWriter(prefix="llm_websocket")
+
+async def handle_webhook_event(post_data):
+    if post_data["event"] == "call_started":
+        print("Call started event", post_data["data"]["call_id"])
+    elif post_data["event"] == "call_ended":
+        print("Call ended event", post_data["data"]["call_id"])
+    elif post_data["event"] == "call_analyzed":
+        print("Call analyzed event", post_data["data"]["call_id"])
+    else:
+        print("Unknown event", post_data["event"])
+
+
+webhook_queue = WebhookQueue(
+    handle_webhook_event,
+    workers=int(os.getenv("WEBHOOK_WORKERS", "2")),
+    queue_size=int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000")),
+    retries=int(os.getenv("WEBHOOK_RETRIES", "3")),
+)
+
+
 # Handle webhook from Retell server. This is used to receive events from Retell server.
 # Including call_started, call_ended, call_analyzed
 @app.post("/webhook")
 async def handle_webhook(request: Request):
     try:
-        post_data = await request.json()
+        # The signature covers the body exactly as sent, so verify the raw
+        # bytes rather than a re-serialization of the parsed JSON
+        body = await request.body()
         valid_signature = retell.verify(
-            json.dumps(post_data, separators=(",", ":")),
-            api_key=str(os.environ["RETELL_API_KEY"]),
+            body.decode(),
+            api_key=str(retell_api_key),
             signature=str(request.headers.get("X-Retell-Signature")),
         )
         if not valid_signature:
-            print(
-                "Received Unauthorized",
-                post_data["event"],
-                post_data["data"]["call_id"],
-            )
+            print("Received Unauthorized webhook")
             return JSONResponse(status_code=401, content={"message": "Unauthorized"})
-        if post_data["event"] == "call_started":
-            print("Call started event", post_data["data"]["call_id"])
-        elif post_data["event"] == "call_ended":
-            print("Call ended event", post_data["data"]["call_id"])
-        elif post_data["event"] == "call_analyzed":
-            print("Call analyzed event", post_data["data"]["call_id"])
-        else:
-            print("Unknown event", post_data["event"])
-        return JSONResponse(status_code=200, content={"received": True})
+        # Handled by the webhook workers after we have answered
+        status = webhook_queue.submit(loads(body))
+        if status == "full":
+            return JSONResponse(status_code=503, content={"message": "Busy, retry later"})
+        return JSONResponse(status_code=200, content={"received": True, "duplicate": status == "duplicate"})
     except Exception as err:
         print(f"Error in webhook: {err}")
         return JSONResponse(
@@ -70,8 +109,9 @@ async def handle_webhook(request: Request):
 async def handle_register_call(request: Request):
     try:
         post_data = await request.json()
-        call_response = retell.call.create_web_call(
-            agent_id=post_data["agent_id"]
+        # The Retell SDK call is sync, keep it off the event loop
+        call_response = await clients.run_sync(
+            retell.call.create_web_call, agent_id=post_data["agent_id"]
         )
         print(f"Call response: {call_response}")
         return JSONResponse(status_code=200, content={"call_response": call_response.__dict__})
@@ -81,8 +121,44 @@ async def handle_register_call(request: Request):
             status_code=500, content={"message": "Internal Server Error"}
         )
 
+async def send(websocket: WebSocket, data: bytes):
+    # Encoded by utils.codec; Retell reads text frames
+    await websocket.send_text(data.decode())
+
+
+# Drafts allowed per call, counting superseded ones that are still unwinding
+MAX_CONCURRENT_DRAFTS = int(os.getenv("MAX_CONCURRENT_DRAFTS", "2"))
+
+
 @app.websocket("/llm-websocket/{call_id}")
 async def websocket_handler(websocket: WebSocket, call_id: str):
+    # Every task spawned for this call, and the subset drafting responses
+    tasks = set()
+    drafts = set()
+    # The newest request waiting for a draft slot, and whether the call is over
+    pending = None
+    closed = False
+    llm_client = None
+
+    def spawn(coro):
+        task = asyncio.create_task(coro)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        return task
+
+    def start_draft(request):
+        task = spawn(draft(request))
+        drafts.add(task)
+        task.add_done_callback(draft_done)
+
+    def draft_done(task):
+        # A slot is free: start the request that was waiting for it
+        nonlocal pending
+        drafts.discard(task)
+        if pending is not None and not closed and len(drafts) < MAX_CONCURRENT_DRAFTS:
+            request, pending = pending, None
+            start_draft(request)
+
     try:
         await websocket.accept()
         llm_client = LlmClient()
@@ -96,49 +172,65 @@ async def websocket_handler(websocket: WebSocket, call_id: str):
             },
             response_id=1,
         )
-        await websocket.send_json(config.__dict__)
+        await send(websocket, encode_event(config))
 
         response_id = 0
         first_event = llm_client.draft_begin_message()
-        await websocket.send_json(first_event.__dict__)
-
-        async def handle_message(request_json):
-            nonlocal response_id
-
-            if request_json["interaction_type"] == "call_details":
-                print(json.dumps(request_json, indent=2))
-                return
-            if request_json["interaction_type"] == "ping_pong":
-                await websocket.send_json(
-                    {
-                        "response_type": "ping_pong",
-                        "timestamp": request_json["timestamp"],
-                    }
-                )
-                return
-            if request_json["interaction_type"] == "update_only":
-                return
-            if (
-                request_json["interaction_type"] == "response_required"
-                or request_json["interaction_type"] == "reminder_required"
-            ):
-                response_id = request_json["response_id"]
-                request = ResponseRequiredRequest(
-                    interaction_type=request_json["interaction_type"],
-                    response_id=response_id,
-                    transcript=request_json["transcript"],
-                )
-                print(
-                    f"""Received interaction_type={request_json['interaction_type']}, response_id={response_id}, last_transcript={request_json['transcript'][-1]['content']}"""
-                )
-
-                async for event in llm_client.draft_response(request):
-                    await websocket.send_json(event.__dict__)
+        await send(websocket, encode_event(first_event))
+
+        async def handle_message(request):
+            if isinstance(request, CallDetailsRequest):
+                ws_log.log({"call_id": call_id, "event": "call_details", "call": request.call})
+            elif isinstance(request, PingPongRequest):
+                await send(websocket, encode_ping_pong(request.timestamp))
+            # update_only needs no reply
+
+        async def draft(request: ResponseRequiredRequest):
+            ws_log.log(
+                {
+                    "call_id": call_id,
+                    "event": request.interaction_type,
+                    "response_id": request.response_id,
+                    "last_transcript": request.transcript[-1].content if request.transcript else "",
+                }
+            )
+
+            async with aclosing(llm_client.draft_response(request)) as events:
+                async for event in events:
                     if request.response_id < response_id:
                         break  # new response needed, abandon this one
-
-        async for data in websocket.iter_json():
-            asyncio.create_task(handle_message(data))
+                    await send(websocket, encode_event(event))
+
+        async for message in websocket.iter_text():
+            try:
+                data = decode_request(message)
+            except (UnknownEventError, ValidationError, ValueError) as e:
+                # A bad frame is dropped, the call goes on
+                ws_log.log({"call_id": call_id, "event": "bad_frame", "error": str(e)})
+                continue
+            if isinstance(data, ResponseRequiredRequest):
+                if data.interaction_type == "reminder_required" and any(not t.cancelling() for t in drafts):
+                    # The demo in progress is still going; a reminder
+                    # neither restarts nor interrupts it
+                    ws_log.log({"call_id": call_id, "event": "reminder_skipped", "response_id": data.response_id})
+                    continue
+                response_id = data.response_id
+                # A newer request supersedes every draft still running,
+                # including the browser agent behind it
+                for task in drafts:
+                    # Once is enough, a second cancel would cut its cleanup short
+                    if not task.cancelling():
+                        task.cancel()
+                if len(drafts) < MAX_CONCURRENT_DRAFTS:
+                    start_draft(data)
+                else:
+                    # Started by draft_done once a superseded draft has
+                    # unwound. The reader keeps going, and a newer request
+                    # replaces this one.
+                    ws_log.log({"call_id": call_id, "event": "draft_backlog", "drafts": len(drafts)})
+                    pending = data
+            else:
+                spawn(handle_message(data))
 
     except WebSocketDisconnect:
         print(f"LLM WebSocket disconnected for {call_id}")
@@ -148,4 +240,10 @@ async def websocket_handler(websocket: WebSocket, call_id: str):
         print(f"Error in LLM WebSocket: {e} for {call_id}")
         await websocket.close(1011, "Server error")
     finally:
+        closed = True
+        for task in list(tasks):
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if llm_client is not None:
+            await llm_client.close()
         print(f"LLM WebSocket connection closed for {call_id}")
@@ -0,0 +1,117 @@
+from typing import Callable, Dict, Optional, Type, Union
+
+from pydantic import BaseModel
+
+from .custom_types import (
+    CallDetailsRequest,
+    CustomLlmRequest,
+    PingPongRequest,
+    PingPongResponse,
+    ResponseRequiredRequest,
+    ResponseResponse,
+    UpdateOnlyRequest,
+)
+
+# Wire encoding for the Retell LLM websocket. orjson when it is installed,
+# otherwise the stdlib. Either way frames match what Starlette's send_json
+# produced: compact separators and non-ASCII characters escaped.
+import json
+
+_encoder = json.JSONEncoder(separators=(",", ":"))
+
+
+def _json_dumps(obj) -> bytes:
+    return _encoder.encode(obj).encode()
+
+
+try:
+    import orjson
+
+    BACKEND = "orjson"
+
+    def dumps(obj) -> bytes:
+        data = orjson.dumps(obj)
+        # orjson always writes raw UTF-8, the rare non-ASCII frame takes the
+        # stdlib path to be escaped the same way as before
+        return data if data.isascii() else _json_dumps(obj)
+
+    loads: Callable[[Union[bytes, str]], object] = orjson.loads
+except ImportError:
+    BACKEND = "json"
+    dumps = _json_dumps
+    loads = json.loads
+
+
+REQUEST_TYPES: Dict[str, Type[BaseModel]] = {
+    "response_required": ResponseRequiredRequest,
+    "reminder_required": ResponseRequiredRequest,
+    "update_only": UpdateOnlyRequest,
+    "call_details": CallDetailsRequest,
+    "ping_pong": PingPongRequest,
+}
+
+
+class UnknownEventError(ValueError):
+    pass
+
+
+def decode_request(data: Union[bytes, str]) -> CustomLlmRequest:
+    payload = loads(data)
+    if not isinstance(payload, dict):
+        raise ValueError(f"Expected a JSON object, got {type(payload).__name__}")
+    interaction_type = payload.get("interaction_type")
+    # A list or object isn't hashable, so check before looking it up
+    model = REQUEST_TYPES.get(interaction_type) if isinstance(interaction_type, str) else None
+    if model is None:
+        raise UnknownEventError(f"Unknown interaction_type: {interaction_type!r}")
+    if model is UpdateOnlyRequest:
+        # The most frequent event, carries the whole transcript and is never
+        # read, so skip validating it
+        return UpdateOnlyRequest.model_construct(**payload)
+    return model.model_validate(payload)
+
+
+# Token chunks are by far the most frequent event: only the content needs
+# escaping, the rest of the frame is fixed bytes
+_RESPONSE_HEAD = b'{"response_type":"response","response_id":'
+_BOOL = {True: b"true", False: b"false", None: b"null"}
+
+
+def encode_response(
+    response_id: int,
+    content: str,
+    content_complete: bool,
+    end_call: Optional[bool] = False,
+    transfer_number: Optional[str] = None,
+) -> bytes:
+    return b"".join(
+        (
+            _RESPONSE_HEAD,
+            str(int(response_id)).encode(),
+            b',"content":',
+            dumps(content),
+            b',"content_complete":',
+            _BOOL[bool(content_complete)],
+            b',"end_call":',
+            _BOOL[end_call if end_call is None else bool(end_call)],
+            b',"transfer_number":',
+            b"null" if transfer_number is None else dumps(transfer_number),
+            b"}",
+        )
+    )
+
+
+def encode_event(event: BaseModel) -> bytes:
+    if isinstance(event, ResponseResponse):
+        return encode_response(
+            event.response_id,
+            event.content,
+            event.content_complete,
+            event.end_call,
+            event.transfer_number,
+        )
+    return dumps(event.__dict__)
+
+
+def encode_ping_pong(timestamp: int) -> bytes:
+    return encode_event(PingPongResponse(timestamp=timestamp))
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookQueue:
+    # Verified webhook events are handled by worker tasks after the request
+    # has been answered. Events are deduplicated on (event, call_id), so a
+    # delivery Retell retries is handled once. Retell already got its 200 and
+    # won't retry a failed handler, so the worker retries it here, backing off
+    # retry_delay, 2 * retry_delay, ... and logs the event as dropped once
+    # retries run out. submit() never blocks: when the queue is full it
+    # returns "full" and the caller answers 503.
+
+    def __init__(
+        self,
+        handler: Callable[[dict], Awaitable[None]],
+        workers: int = 2,
+        queue_size: int = 1000,
+        remember: int = 10000,
+        retries: int = 3,
+        retry_delay: float = 1.0,
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.queue_size = queue_size
+        self.remember = remember
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._seen: OrderedDict = OrderedDict()
+        self.stats = {"queued": 0, "duplicates": 0, "rejected": 0, "handled": 0, "retried": 0, "failed": 0}
+
+    async def start(self):
+        self._queue = asyncio.Queue(self.queue_size)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 5.0):
+        # Give queued events a chance to finish before the workers go
+        if self._queue is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Dropping {self._queue.qsize()} unhandled webhook events")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    @staticmethod
+    def _key(event: dict):
+        return event.get("event"), (event.get("data") or {}).get("call_id")
+
+    def submit(self, event: dict) -> str:
+        # Returns "queued", "duplicate" or "full"
+        key = self._key(event)
+        if key in self._seen:
+            self.stats["duplicates"] += 1
+            return "duplicate"
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            return "full"
+        self._seen[key] = True
+        if len(self._seen) > self.remember:
+            self._seen.popitem(last=False)
+        self.stats["queued"] += 1
+        return "queued"
+
+    async def _work(self):
+        while True:
+            event = await self._queue.get()
+            try:
+                await self._handle(event)
+            finally:
+                self._queue.task_done()
+
+    async def _handle(self, event: dict):
+        for attempt in range(self.retries + 1):
+            try:
+                await self.handler(event)
+                self.stats["handled"] += 1
+                return
+            except Exception as e:
+                error = e
+            if attempt < self.retries:
+                self.stats["retried"] += 1
+                logger.warning(f"Webhook handler failed for {event.get('event')}, retrying: {error}")
+                await asyncio.sleep(self.retry_delay * 2 ** attempt)
+        self.stats["failed"] += 1
+        # Forgotten, so the same event sent again by hand is handled
+        self._seen.pop(self._key(event), None)
+        logger.error(f"Dropping webhook event after {self.retries} retries: {error}: {event}")
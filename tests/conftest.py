@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+# The agent and training modules import each other by bare name, the way
+# they are run (python web_agent.py, python train.py)
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in ("app/agent", "train", ""):
+    sys.path.insert(0, os.path.join(root, path))
+
+# Websocket and agent logs from the app under test stay out of the tree
+os.environ.setdefault("AGENT_LOG_DIR", tempfile.mkdtemp(prefix="agent_logs_"))
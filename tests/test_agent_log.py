@@ -0,0 +1,41 @@
+import asyncio
+import json
+import os
+
+from agent_log import AgentLogWriter
+
+
+def read_lines(path):
+    with open(path) as f:
+        return [json.loads(line)["n"] for line in f]
+
+
+def test_log_rolls_over_by_size(tmp_path):
+    async def run():
+        writer = AgentLogWriter(directory=str(tmp_path), max_bytes=1, flush_interval=0.01)
+        writer.log({"n": 1})
+        await asyncio.sleep(0.05)
+        writer.log({"n": 2})
+        await writer.stop()
+        return writer.stats
+
+    stats = asyncio.run(run())
+    (current,) = [name for name in os.listdir(tmp_path) if name.endswith(".jsonl")]
+    assert read_lines(tmp_path / current) == [2]
+    assert read_lines(tmp_path / f"{current}.1") == [1]
+    assert stats["written"] == 2 and stats["batches"] == 2
+
+
+def test_full_queue_drops_records_without_blocking(tmp_path):
+    async def run():
+        writer = AgentLogWriter(directory=str(tmp_path), queue_size=2)
+        # The writer task hasn't run yet, so nothing leaves the queue
+        accepted = [writer.log({"n": n}) for n in range(5)]
+        await writer.stop()
+        return accepted, writer.stats
+
+    accepted, stats = asyncio.run(run())
+    assert accepted == [True, True, False, False, False]
+    assert stats == {"written": 2, "dropped": 3, "batches": 1}
+    (current,) = os.listdir(tmp_path)
+    assert read_lines(tmp_path / current) == [0, 1]
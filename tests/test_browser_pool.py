@@ -0,0 +1,140 @@
+import asyncio
+
+import pytest
+
+from browser_pool import BrowserPool, PoolTimeoutError
+
+
+class FakePage:
+    def __init__(self, context):
+        self.context = context
+        self.closed = False
+        self.healthy = True
+        # Set to hold health checks until the test lets them through
+        self.gate = None
+
+    def is_closed(self):
+        return self.closed
+
+    async def evaluate(self, script):
+        if self.gate is not None:
+            await self.gate.wait()
+        if not self.healthy:
+            raise RuntimeError("Target crashed")
+        return 1
+
+    async def goto(self, url):
+        pass
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeContext:
+    def __init__(self):
+        self.pages = []
+        self.closed = False
+
+    async def add_init_script(self, script):
+        pass
+
+    def on(self, event, handler):
+        pass
+
+    async def new_page(self):
+        page = FakePage(self)
+        self.pages.append(page)
+        return page
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.contexts = []
+
+    async def new_context(self):
+        context = FakeContext()
+        self.contexts.append(context)
+        return context
+
+
+def make_pool(**kwargs):
+    pool = BrowserPool(**{"min_size": 0, "max_size": 1, **kwargs})
+    pool._browser = FakeBrowser()
+    return pool
+
+
+def test_requests_beyond_max_size_queue_for_a_released_page():
+    async def run():
+        pool = make_pool()
+        page = await pool.acquire()
+        waiter = asyncio.create_task(pool.acquire(timeout=1))
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        await pool.release(page)
+        return page, await waiter, pool
+
+    page, reused, pool = asyncio.run(run())
+    assert reused is page and len(pool._browser.contexts) == 1
+
+
+def test_acquire_times_out_when_the_pool_stays_full():
+    async def run():
+        pool = make_pool()
+        await pool.acquire()
+        with pytest.raises(PoolTimeoutError):
+            await pool.acquire(timeout=0.05)
+
+    asyncio.run(run())
+
+
+def test_unhealthy_slot_is_recycled_on_checkout():
+    async def run():
+        pool = make_pool()
+        page = await pool.acquire()
+        await pool.release(page)
+        page.healthy = False
+        fresh = await pool.acquire()
+        return page, fresh, pool
+
+    page, fresh, pool = asyncio.run(run())
+    assert fresh is not page
+    assert page.context.closed and pool.stats == {"size": 1, "idle": 0, "in_use": 1}
+
+
+def test_idle_slots_are_evicted_down_to_min_size():
+    async def run():
+        pool = make_pool(min_size=1, max_size=3, idle_timeout=0)
+        pages = [await pool.acquire() for _ in range(3)]
+        for page in pages:
+            await pool.release(page)
+        await asyncio.sleep(0.01)
+        await pool._evict_and_check()
+        return pool
+
+    pool = asyncio.run(run())
+    assert pool.stats == {"size": 1, "idle": 1, "in_use": 0}
+    assert sum(context.closed for context in pool._browser.contexts) == 2
+
+
+def test_acquire_during_health_checks_uses_the_idle_slot():
+    async def run():
+        pool = make_pool(max_size=2)
+        page = await pool.acquire()
+        await pool.release(page)
+        page.gate = asyncio.Event()
+        check = asyncio.create_task(pool._evict_and_check())
+        await asyncio.sleep(0.01)
+        # The slot is being checked, but it is still idle and handed out
+        acquire = asyncio.create_task(pool.acquire())
+        await asyncio.sleep(0.01)
+        page.gate.set()
+        acquired = await acquire
+        await check
+        return page, acquired, pool
+
+    page, acquired, pool = asyncio.run(run())
+    assert acquired is page and len(pool._browser.contexts) == 1
+    assert not page.context.closed and pool.stats["in_use"] == 1
@@ -0,0 +1,32 @@
+import asyncio
+
+import httpx
+import pytest
+from openai import OpenAIError
+
+from clients import Clients
+
+
+def test_pool_does_not_need_an_openai_key(monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+
+    async def use_pool():
+        clients = Clients()
+        assert isinstance(clients.http, httpx.AsyncClient)
+        # Only asking for the OpenAI client needs the key
+        with pytest.raises(OpenAIError):
+            clients.openai
+        await clients.stop()
+
+    asyncio.run(use_pool())
+
+
+def test_openai_client_shares_the_pool(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+
+    async def use_openai():
+        clients = Clients()
+        assert clients.openai._client is clients.http
+        await clients.stop()
+
+    asyncio.run(use_openai())
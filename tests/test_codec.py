@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from app.utils.codec import UnknownEventError, decode_request, encode_event
+from app.utils.custom_types import (
+    ConfigResponse,
+    PingPongRequest,
+    PingPongResponse,
+    ResponseRequiredRequest,
+    ResponseResponse,
+)
+
+
+def send_json_frame(event):
+    # What Starlette 0.27's send_json sent for event.__dict__
+    return json.dumps(event.__dict__, separators=(",", ":"))
+
+
+@pytest.mark.parametrize(
+    "event",
+    [
+        ResponseResponse(response_id=3, content="Sure, let me ", content_complete=False),
+        ResponseResponse(response_id=3, content='Café "quoted" — sí\n', content_complete=True, end_call=None),
+        ResponseResponse(response_id=3, content="", content_complete=True, transfer_number="+15550100"),
+        PingPongResponse(timestamp=1718000000000),
+        ConfigResponse(config={"auto_reconnect": True, "call_details": True}),
+    ],
+)
+def test_frames_match_send_json(event):
+    assert encode_event(event).decode() == send_json_frame(event)
+
+
+def test_decodes_into_request_models():
+    request = decode_request(
+        '{"interaction_type":"response_required","response_id":4,'
+        '"transcript":[{"role":"user","content":"hi"}]}'
+    )
+    assert isinstance(request, ResponseRequiredRequest) and request.transcript[0].content == "hi"
+    assert isinstance(decode_request(b'{"interaction_type":"ping_pong","timestamp":1}'), PingPongRequest)
+
+
+@pytest.mark.parametrize(
+    "frame",
+    ["not json", "[1, 2]", '"text"', '{"interaction_type":"nope"}', '{"interaction_type":"ping_pong"}'],
+)
+def test_bad_frames_raise_value_errors(frame):
+    with pytest.raises(ValueError):
+        decode_request(frame)
+
+
+@pytest.mark.parametrize("interaction_type", ['["ping_pong"]', '{"a":1}', "1", "null"])
+def test_non_string_interaction_type_is_an_unknown_event(interaction_type):
+    with pytest.raises(UnknownEventError):
+        decode_request(f'{{"interaction_type":{interaction_type}}}')
@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+from dataset import DatasetWriter, read_blocks, sample
+
+
+def action(i, action_type="click"):
+    return {"action_type": action_type, "element_type": "button", "element": f"element {i}", "value": "NA"}
+
+
+FLOWS = {
+    "empty": [],
+    "one": [action(0)],
+    "three": [action(1), action(2, "input"), action(3)],
+    "two": [action(4), action(5)],
+}
+
+
+def test_flows_come_back_with_their_own_actions(tmp_path):
+    path = str(tmp_path / "flows.bin")
+    DatasetWriter(path).append(FLOWS)
+    (block,) = read_blocks(path)
+    assert [(start, end) for _, start, end in block.flow_ranges()] == [(0, 0), (0, 1), (1, 4), (4, 6)]
+    for index, (name, actions) in enumerate(FLOWS.items()):
+        flow = block.flow(index)
+        assert flow["flow"] == name
+        assert [a["element"] for a in flow["actions"]] == [a["element"] for a in actions]
+
+
+def test_sample_keeps_only_flows_with_a_matching_action(tmp_path):
+    path = str(tmp_path / "flows.bin")
+    writer = DatasetWriter(path)
+    writer.append(FLOWS)
+    writer.append({"later": [action(6, "input")]})
+    flows = sample(path, 10, seed=0, action_type="input")
+    assert sorted(flow["flow"] for flow in flows) == ["later", "three"]
+
+
+@pytest.mark.parametrize("cut", [3, 20, -5])
+def test_append_after_a_crash_mid_write_drops_the_torn_block(tmp_path, cut):
+    path = str(tmp_path / "flows.bin")
+    DatasetWriter(path).append({"first": [action(0)]})
+    complete = os.path.getsize(path)
+    DatasetWriter(path).append({"torn": [action(1), action(2)]})
+    # A crash partway through the length prefix, the header or the columns
+    with open(path, "r+b") as f:
+        f.truncate(complete + cut if cut > 0 else os.path.getsize(path) + cut)
+    assert [block.flow_names() for block in read_blocks(path)] == [["first"]]
+
+    DatasetWriter(path).append({"next": [action(3)]})
+    assert [block.flow_names() for block in read_blocks(path)] == [["first"], ["next"]]
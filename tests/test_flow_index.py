@@ -0,0 +1,76 @@
+import json
+
+from flow_index import FlowIndex
+
+
+def clicks(*elements):
+    return [{"action_type": "click", "element_type": "button", "element": e, "value": "NA"} for e in elements]
+
+
+FLOWS = {
+    "CreateEmail": clicks("Marketing", "Email", "Create email", "Regular", "Welcome Email Template"),
+    "CreateContact": clicks("crm", "contacts", "create contact", "email", "first name", "last name"),
+    "CreateJiraIssue": clicks("Create", "Issue type", "Summary", "Description", "Assignee", "Create"),
+    "DeleteRepo": clicks("Settings", "Danger zone", "Delete this repository", "I understand, delete this repository"),
+    "InviteTeamMember": clicks("Settings", "Members", "Invite member", "email address", "Send invite"),
+    "ExportReport": clicks("Reports", "Monthly report", "Export", "CSV", "Download"),
+}
+
+
+def make_index():
+    index = FlowIndex()
+    index.sync(FLOWS)
+    return index
+
+
+def test_matches_tasks_for_known_flows():
+    index = make_index()
+    for task, flow in [
+        ("create a new contact", "CreateContact"),
+        ("create a welcome email for the marketing campaign", "CreateEmail"),
+        ("create a jira issue for the login bug", "CreateJiraIssue"),
+        ("file an issue in jira", "CreateJiraIssue"),
+        ("delete the old-api repository", "DeleteRepo"),
+        ("export the monthly report as csv", "ExportReport"),
+    ]:
+        match = index.lookup(task)
+        assert match is not None and match["name"] == flow, task
+
+
+def test_one_shared_word_is_not_a_match():
+    index = make_index()
+    for task in [
+        "Create a new meeting in Google Calendar",
+        "delete my calendar event",
+        "schedule a call with my team",
+        "open the settings page",
+        "book a flight to Paris",
+    ]:
+        assert index.lookup(task) is None, task
+
+
+def test_plan_hint_does_not_stop_the_agent():
+    hinted = make_index().with_plan("create a new contact")
+    assert "create contact" in hinted
+    assert "STOP" not in hinted and "END OF TASK" not in hinted
+    assert make_index().with_plan("book a flight to Paris") == "book a flight to Paris"
+
+
+def test_refresh_skips_a_torn_line_in_the_labelling_output(tmp_path):
+    source = tmp_path / "model_outputs.jsonl"
+    source.write_text(json.dumps({"video": "CreateContact", "output": FLOWS["CreateContact"]}) + '\n{"video": "Cre')
+    index = FlowIndex(sources=[str(source)])
+    index.refresh()
+    assert list(index.flows) == ["CreateContact"]
+
+
+def test_refresh_without_sources_keeps_the_snapshot(tmp_path):
+    snapshot = str(tmp_path / "flow_index.json")
+    make_index().save(snapshot)
+    index = FlowIndex(sources=[str(tmp_path / "missing.json")], snapshot_path=snapshot)
+    index.refresh()
+    assert len(index.flows) == len(FLOWS)
+    reloaded = FlowIndex(snapshot_path=snapshot)
+    reloaded.refresh()
+    assert len(reloaded.flows) == len(FLOWS)
+    assert index.lookup("create a new contact")["name"] == "CreateContact"
@@ -0,0 +1,135 @@
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+MARK_PAGE_JS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../app/agent/mark_page.js")
+
+# Runs markPageResolve against a minimal stand-in DOM: elements are boxes in
+# a 1000x800 viewport, elementFromPoint returns the topmost box at a point
+# and scrollIntoView centres the element.
+HARNESS = r"""
+const vm = require('vm');
+const fs = require('fs');
+const [script, scenario] = [process.argv[1], JSON.parse(process.argv[2])];
+
+const rectOf = ([l, t, w, h]) => ({ left: l, top: t, width: w, height: h, right: l + w, bottom: t + h });
+
+function makeElement(spec) {
+  return {
+    ...spec,
+    isConnected: spec.connected !== false,
+    children: [],
+    textContent: spec.text || '',
+    tagName: (spec.tag || 'div').toUpperCase(),
+    scrolled: false,
+    getBoundingClientRect() {
+      return rectOf(this.box);
+    },
+    scrollIntoView() {
+      this.scrolled = true;
+      const [, , w, h] = this.box;
+      this.box = [500 - w / 2, 400 - h / 2, w, h];
+    },
+    contains(other) {
+      return other === this || this.children.some((child) => child.contains(other));
+    },
+  };
+}
+
+const elements = scenario.elements.map(makeElement);
+const byName = Object.fromEntries(elements.map((el) => [el.name, el]));
+for (const el of elements) {
+  if (el.parent) byName[el.parent].children.push(el);
+}
+const sandbox = {
+  innerWidth: 1000,
+  innerHeight: 800,
+  document: {
+    elementFromPoint(x, y) {
+      // Last listed is on top
+      for (let i = elements.length - 1; i >= 0; i--) {
+        const r = elements[i].getBoundingClientRect();
+        if (elements[i].isConnected && x >= r.left && x < r.right && y >= r.top && y < r.bottom) {
+          return elements[i];
+        }
+      }
+      return null;
+    },
+  },
+};
+sandbox.window = sandbox;
+vm.createContext(sandbox);
+vm.runInContext(fs.readFileSync(script, 'utf8'), sandbox);
+sandbox.__markPageId = 'mark-1';
+// Where each element was when the page was marked, by default where it is now
+const marked = scenario.marked || {};
+sandbox.__markPageItems = scenario.items.map(
+  (name) => name && { element: byName[name], rect: rectOf(marked[name] || byName[name].box) }
+);
+const result = vm.runInContext(`markPageResolve(${scenario.label}, ${JSON.stringify(scenario.markId)})`, sandbox);
+console.log(JSON.stringify(result));
+"""
+
+pytestmark = pytest.mark.skipif(shutil.which("node") is None, reason="needs node")
+
+
+def resolve(elements, items, label=0, mark_id="mark-1", marked=None):
+    scenario = {"elements": elements, "items": items, "label": label, "markId": mark_id, "marked": marked}
+    out = subprocess.run(
+        ["node", "-e", HARNESS, MARK_PAGE_JS, json.dumps(scenario)], capture_output=True, text=True, check=True
+    )
+    return json.loads(out.stdout)
+
+
+BUTTON = {"name": "button", "tag": "button", "box": [100, 100, 80, 40]}
+
+
+def test_resolves_the_centre_of_an_unmoved_element():
+    result = resolve([BUTTON], ["button"])
+    assert result == {"status": "ok", "x": 140, "y": 120, "moved": False, "scrolled": False}
+
+
+def test_follows_an_element_that_moved():
+    result = resolve([BUTTON], ["button"], marked={"button": [100, 20, 80, 40]})
+    assert (result["status"], result["x"], result["y"], result["moved"]) == ("ok", 140, 120, True)
+
+
+def test_scrolls_an_element_outside_the_viewport_into_view():
+    offscreen = {**BUTTON, "box": [100, 1200, 80, 40]}
+    result = resolve([offscreen], ["button"])
+    assert (result["status"], result["x"], result["y"], result["scrolled"]) == ("ok", 500, 400, True)
+
+
+def test_a_child_under_the_point_counts_as_the_element():
+    icon = {"name": "icon", "tag": "svg", "box": [120, 100, 40, 40], "parent": "button"}
+    assert resolve([BUTTON, icon], ["button"])["status"] == "ok"
+
+
+def test_a_partly_covered_element_is_hit_elsewhere():
+    badge = {"name": "badge", "box": [100, 100, 80, 25]}
+    result = resolve([BUTTON, badge], ["button"])
+    assert result["status"] == "ok" and result["y"] == 130
+
+
+@pytest.mark.parametrize(
+    "elements, items, label, mark_id, reason",
+    [
+        ([BUTTON], ["button"], 0, "mark-0", "re-marked"),
+        ([BUTTON], [None, "button"], 0, "mark-1", "no element"),
+        ([BUTTON], ["button"], 5, "mark-1", "no element"),
+        ([{**BUTTON, "connected": False}], ["button"], 0, "mark-1", "removed"),
+        ([{**BUTTON, "box": [100, 100, 0, 0]}], ["button"], 0, "mark-1", "no longer visible"),
+    ],
+)
+def test_stale_labels(elements, items, label, mark_id, reason):
+    result = resolve(elements, items, label, mark_id)
+    assert result["status"] == "stale" and reason in result["reason"]
+
+
+def test_covered_element_is_reported_with_what_covers_it():
+    modal = {"name": "modal", "box": [0, 0, 1000, 800], "text": "Accept cookies"}
+    result = resolve([BUTTON, modal], ["button"])
+    assert result["status"] == "obscured" and 'div "Accept cookies"' in result["reason"]
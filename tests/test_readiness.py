@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+import readiness
+from browser_pool import BrowserPool
+
+
+class HiddenTabPage:
+    # A tab that never runs its animation frames: the quiet check never settles
+    def on(self, event, handler):
+        pass
+
+    async def wait_for_load_state(self, state, timeout=None):
+        pass
+
+    async def evaluate(self, script, arg=None):
+        await asyncio.Event().wait()
+
+
+def test_wait_until_ready_keeps_its_ceiling_when_the_page_never_answers():
+    start = time.monotonic()
+    waited = asyncio.run(readiness.wait_until_ready(HiddenTabPage(), timeout=0.3))
+    assert waited < 1.0 and time.monotonic() - start < 1.0
+
+
+class FakeContext:
+    def __init__(self, events):
+        self.events = events
+        self.handlers = {}
+
+    async def add_init_script(self, script):
+        self.events.append("init_script")
+
+    def on(self, event, handler):
+        self.events.append(f"on:{event}")
+        self.handlers[event] = handler
+
+    async def new_page(self):
+        page = FakePage(self.events)
+        self.handlers["page"](page)
+        return page
+
+
+class FakePage:
+    def __init__(self, events):
+        self.events = events
+
+    async def goto(self, url):
+        self.events.append("goto")
+
+
+class FakeBrowser:
+    def __init__(self, events):
+        self.events = events
+
+    async def new_context(self):
+        return FakeContext(self.events)
+
+
+def test_pool_hands_every_new_page_to_on_page_before_it_loads():
+    events = []
+    pool = BrowserPool(init_scripts=["1"], on_page=lambda page: events.append("on_page"))
+    pool._browser = FakeBrowser(events)
+    asyncio.run(pool._new_slot())
+    assert events == ["init_script", "on:page", "on_page", "goto"]
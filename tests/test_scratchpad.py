@@ -0,0 +1,42 @@
+from scratchpad import MIN_OBSERVATION_CHARS, count_tokens, make_step, render
+
+
+def steps(*observations):
+    result = []
+    for observation in observations:
+        result.append(make_step(result, {"action": "Click", "args": ["1"]}, observation))
+    return result
+
+
+def test_steps_outside_the_window_are_summarized():
+    history = steps("Clicked 1", "Error: no bbox for : 9", "Clicked 2", "Clicked 3")
+    txt, tokens = render(history, window=2, budget=10_000)
+    assert txt.splitlines() == [
+        "Previous action observations:",
+        "",
+        "Steps 1-2 (summary): Click x2. Last error at step 2: Error: no bbox for : 9",
+        "3. Clicked 2",
+        "4. Clicked 3",
+    ]
+    assert tokens == count_tokens(txt)
+
+
+def test_window_shrinks_until_the_text_fits():
+    history = steps(*(f"Clicked element number {i} on the page" for i in range(10)))
+    budget = count_tokens(render(history, window=3, budget=10_000)[0])
+    txt, tokens = render(history, window=8, budget=budget)
+    assert tokens <= budget
+    assert "Steps 1-7 (summary)" in txt and "10. Clicked element number 9" in txt
+
+
+def test_observations_are_truncated_once_the_window_is_one_step():
+    history = steps("short", "x" * 5000)
+    txt, tokens = render(history, window=8, budget=200)
+    assert tokens <= 200
+    assert f"2. {'x' * MIN_OBSERVATION_CHARS}..." in txt and "x" * (MIN_OBSERVATION_CHARS + 1) not in txt
+
+
+def test_text_over_budget_after_every_cut_is_returned_as_is():
+    history = steps("y" * 5000)
+    txt, tokens = render(history, budget=1)
+    assert tokens > 1 and txt.endswith(f"1. {'y' * MIN_OBSERVATION_CHARS}...")
@@ -0,0 +1,44 @@
+import pytest
+
+from screenshot import LABEL_MARGIN, estimate_image_tokens, labelled_region
+
+VIEWPORT = {"width": 1280, "height": 800}
+
+
+def box(left, top, width, height):
+    return {"left": left, "top": top, "width": width, "height": height}
+
+
+@pytest.mark.parametrize(
+    "width, height, detail, tokens",
+    [
+        # The worked examples in OpenAI's vision pricing
+        (1024, 1024, "high", 765),
+        (2048, 4096, "high", 1105),
+        (4096, 8192, "low", 85),
+        # Small images aren't scaled up: one tile
+        (512, 512, "auto", 255),
+    ],
+)
+def test_image_tokens_follow_openai_pricing(width, height, detail, tokens):
+    assert estimate_image_tokens(width, height, detail) == tokens
+
+
+def test_region_covers_every_box_and_its_label():
+    region = labelled_region([box(100, 200, 50, 20), None, box(400, 300, 30.5, 10)], VIEWPORT)
+    assert region == {
+        "x": 100 - LABEL_MARGIN,
+        "y": 200 - LABEL_MARGIN,
+        "width": 431 + LABEL_MARGIN - (100 - LABEL_MARGIN),
+        "height": 310 + LABEL_MARGIN - (200 - LABEL_MARGIN),
+    }
+
+
+def test_region_is_clipped_to_the_viewport():
+    region = labelled_region([box(5, 10, 1270, 785)], VIEWPORT)
+    assert region == {"x": 0, "y": 0, "width": 1280, "height": 800}
+
+
+@pytest.mark.parametrize("bboxes", [[], [None], [box(2000, 1000, 10, 10)]])
+def test_no_region_without_boxes_in_view(bboxes):
+    assert labelled_region(bboxes, VIEWPORT) is None
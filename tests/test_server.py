@@ -0,0 +1,132 @@
+import asyncio
+import json
+import os
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("RETELL_API_KEY", "test")
+
+from fastapi.testclient import TestClient
+
+import app.server as server
+from app.utils.custom_types import ResponseResponse
+
+def response_required(response_id):
+    return json.dumps(
+        {
+            "interaction_type": "response_required",
+            "response_id": response_id,
+            "transcript": [{"role": "user", "content": f"turn {response_id}"}],
+        }
+    )
+
+class SlowLlmClient:
+    # Drafts take a while and take a while to unwind once cancelled
+    started = []
+    running = 0
+    max_running = 0
+    closed = 0
+
+    def draft_begin_message(self):
+        return ResponseResponse(response_id=0, content="hi", content_complete=True)
+
+    async def draft_response(self, request):
+        cls = SlowLlmClient
+        cls.started.append(request.response_id)
+        cls.running += 1
+        cls.max_running = max(cls.max_running, cls.running)
+        try:
+            yield ResponseResponse(response_id=request.response_id, content="ok", content_complete=False)
+            await asyncio.sleep(0.3)
+            yield ResponseResponse(response_id=request.response_id, content="", content_complete=True)
+        finally:
+            try:
+                await asyncio.sleep(0.5)
+            finally:
+                cls.running -= 1
+
+    async def close(self):
+        SlowLlmClient.closed += 1
+
+def test_bad_frames_do_not_end_the_call():
+    client = TestClient(server.app)
+    with client.websocket_connect("/llm-websocket/test-call") as websocket:
+        assert websocket.receive_json()["response_type"] == "config"
+        assert websocket.receive_json()["response_id"] == 0
+        for frame in [
+            "not json",
+            "[]",
+            '{"interaction_type":"ping_pong"}',
+            '{"interaction_type":"nope"}',
+            '{"interaction_type":[1]}',
+        ]:
+            websocket.send_text(frame)
+        websocket.send_text('{"interaction_type":"ping_pong","timestamp":42}')
+        assert websocket.receive_json() == {"response_type": "ping_pong", "timestamp": 42}
+
+def test_draft_cap_holds_without_blocking_the_reader(monkeypatch):
+    monkeypatch.setattr(server, "LlmClient", SlowLlmClient)
+    monkeypatch.setattr(server, "MAX_CONCURRENT_DRAFTS", 2)
+    client = TestClient(server.app)
+    with client.websocket_connect("/llm-websocket/test-call") as websocket:
+        websocket.receive_json()
+        websocket.receive_json()
+        # Two drafts running, then superseded and unwinding
+        for response_id in (1, 2):
+            websocket.send_text(response_required(response_id))
+            assert websocket.receive_json()["response_id"] == response_id
+        for response_id in (3, 4):
+            websocket.send_text(response_required(response_id))
+        websocket.send_text('{"interaction_type":"ping_pong","timestamp":7}')
+        frames = []
+        while not (frames and frames[-1].get("content_complete")):
+            frames.append(websocket.receive_json())
+        # Hang up and give the handler a moment to release the call's page
+        websocket.close()
+        time.sleep(0.2)
+    # The ping is answered while both slots are still taken
+    assert frames[0] == {"response_type": "ping_pong", "timestamp": 7}
+    assert frames[-1]["response_id"] == 4
+    # Request 3 was superseded while it waited for a slot
+    assert SlowLlmClient.started == [1, 2, 4]
+    assert SlowLlmClient.max_running <= 2
+    assert SlowLlmClient.closed == 1
+
+def test_reminder_does_not_interrupt_a_running_draft(monkeypatch):
+    monkeypatch.setattr(server, "LlmClient", SlowLlmClient)
+    monkeypatch.setattr(SlowLlmClient, "started", [])
+    client = TestClient(server.app)
+    with client.websocket_connect("/llm-websocket/test-call") as websocket:
+        websocket.receive_json()
+        websocket.receive_json()
+        websocket.send_text(response_required(1))
+        assert websocket.receive_json()["response_id"] == 1
+        reminder = json.loads(response_required(2))
+        websocket.send_text(json.dumps({**reminder, "interaction_type": "reminder_required"}))
+        frame = websocket.receive_json()
+        websocket.close()
+        time.sleep(0.2)
+    # Draft 1 ran to completion and the reminder started nothing
+    assert frame["response_id"] == 1 and frame["content_complete"]
+    assert SlowLlmClient.started == [1]
+
+def test_shutdown_stops_both_log_writers(monkeypatch):
+    stopped = []
+
+    class FakeWriter:
+        def __init__(self, name):
+            self.name = name
+
+        async def stop(self):
+            stopped.append(self.name)
+
+    async def nothing():
+        pass
+
+    monkeypatch.setattr(server.browser_pool, "start", nothing)
+    monkeypatch.setattr(server.browser_pool, "stop", nothing)
+    monkeypatch.setattr(server, "agent_log", FakeWriter("agent_log"))
+    monkeypatch.setattr(server, "ws_log", FakeWriter("ws_log"))
+    with TestClient(server.app):
+        pass
+    assert stopped == ["agent_log", "ws_log"]
@@ -0,0 +1,58 @@
+import asyncio
+import threading
+
+from speech import SpeechPipeline
+
+
+def pipeline(gate):
+    # Synthesis is instant; playback lasts until the test opens the gate
+    return SpeechPipeline(synthesize=lambda text: text.encode(), play=lambda audio: gate.wait(5))
+
+
+def test_start_returns_once_playback_begins_finish_once_it_ends():
+    gate = threading.Event()
+
+    async def run():
+        speech = pipeline(gate)
+        speech.say("Opening the board")
+        started = await speech.wait("start", timeout=1)
+        finished_early = await speech.wait("finish", timeout=0.05)
+        gate.set()
+        finished = await speech.wait("finish", timeout=1)
+        await speech.close()
+        return started, finished_early, finished, speech.stats
+
+    started, finished_early, finished, stats = asyncio.run(run())
+    assert (started, finished_early, finished) == (True, False, True)
+    assert stats["wait_timeouts"] == 1
+
+
+def test_wait_times_out_on_stalled_synthesis():
+    release = threading.Event()
+
+    async def run():
+        speech = SpeechPipeline(synthesize=lambda text: release.wait(5) and b"", play=lambda audio: None)
+        speech.say("Opening the board")
+        waited = await speech.wait("start", timeout=0.05)
+        release.set()
+        await speech.close()
+        return waited, speech.stats
+
+    waited, stats = asyncio.run(run())
+    assert waited is False and stats["wait_timeouts"] == 1
+    assert stats["blocked_seconds"] >= 0.05
+
+
+def test_off_and_nothing_said_never_block():
+    async def run():
+        gate = threading.Event()
+        speech = pipeline(gate)
+        nothing_said = await speech.wait("finish", timeout=0)
+        speech.say("Opening the board")
+        off = await speech.wait("off", timeout=0)
+        gate.set()
+        await speech.close(drain=False)
+        return nothing_said, off, speech.stats
+
+    nothing_said, off, stats = asyncio.run(run())
+    assert nothing_said and off and stats["wait_timeouts"] == 0
@@ -0,0 +1,95 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from stt import EnergyVAD, FakeTranscriber, Transcriber, UtteranceDetector
+
+RATE = 16000
+
+
+def tone(ms, amplitude=8000):
+    t = np.arange(RATE * ms // 1000) / RATE
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype("<i2").tobytes()
+
+
+def silence(ms):
+    return bytes(RATE * ms // 1000 * 2)
+
+
+def detector(**kwargs):
+    return UtteranceDetector(EnergyVAD(sample_rate=RATE), **kwargs)
+
+
+def test_utterance_starts_and_ends():
+    d = detector(start_ms=100, end_ms=300, pre_roll_ms=200)
+    assert d.feed(silence(500)) == []
+    events = d.feed(tone(400))
+    assert events == [("start", None)] and d.speaking
+    events = d.feed(silence(400))
+    assert [kind for kind, _ in events] == ["end"] and not d.speaking
+    audio = events[0][1]
+    # 200 ms pre-roll (100 ms of silence, the 100 ms that started it), the
+    # other 300 ms of tone and the 300 ms of silence that ended it
+    assert len(audio) == len(silence(800))
+
+
+def test_pre_roll_keeps_audio_before_start():
+    d = detector(start_ms=100, end_ms=300, pre_roll_ms=200)
+    d.feed(silence(500))
+    d.feed(tone(100))
+    assert d.speaking
+    # The 100 ms that started the utterance and 100 ms of silence before it
+    assert len(d.audio) == len(silence(200))
+    assert d.audio.startswith(silence(100)) and d.audio.endswith(tone(100)[-640:])
+
+
+def test_frames_split_across_chunks():
+    d = detector(start_ms=100, end_ms=300)
+    data = silence(300) + tone(300) + silence(400)
+    events = []
+    for i in range(0, len(data), 333):
+        events += d.feed(data[i:i + 333])
+    assert [kind for kind, _ in events] == ["start", "end"]
+
+
+def test_max_ms_ends_a_long_utterance():
+    d = detector(start_ms=100, end_ms=300, pre_roll_ms=100, max_ms=1000)
+    d.feed(silence(200))
+    events = d.feed(tone(1500))
+    assert [kind for kind, _ in events] == ["start", "end", "start"]
+    assert len(events[1][1]) == len(silence(1000))
+
+
+def test_flush_ends_an_utterance_early():
+    d = detector(start_ms=100, end_ms=300)
+    assert d.flush() == []
+    d.feed(silence(200) + tone(200))
+    events = d.flush()
+    assert [kind for kind, _ in events] == ["end"] and not d.speaking
+
+
+def test_noise_floor_follows_background():
+    d = detector(start_ms=100, end_ms=300)
+    assert d.feed(tone(1000, amplitude=400)) == []
+    assert d.feed(tone(300, amplitude=8000))[0] == ("start", None)
+
+
+def test_transcriber_is_abstract():
+    with pytest.raises(TypeError):
+        Transcriber()
+
+
+def test_fake_transcriber_scripts_finals_and_previews_partials():
+    fake = FakeTranscriber(["first", "second"])
+
+    async def run():
+        return [
+            await fake.transcribe(b"\0" * 320, final=False),
+            await fake.transcribe(b"\0" * 320),
+            await fake.transcribe(b"\0" * 320),
+            await fake.transcribe(b"\0" * 320),
+        ]
+
+    assert asyncio.run(run()) == ["first", "first", "second", "second"]
+    assert fake.calls[0] == (320, False)
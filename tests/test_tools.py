@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+import tools
+
+BBOXES = [{"x": 10, "y": 20}, None]
+
+
+class FakeMouse:
+    def __init__(self):
+        self.clicks = []
+
+    async def click(self, x, y):
+        self.clicks.append((x, y))
+
+
+class FakePage:
+    # evaluate() answers markPageResolve with a canned result, or raises
+    def __init__(self, resolved):
+        self.resolved = resolved
+        self.calls = []
+        self.mouse = FakeMouse()
+
+    async def evaluate(self, script, arg=None):
+        self.calls.append(arg)
+        if isinstance(self.resolved, Exception):
+            raise self.resolved
+        return self.resolved
+
+
+def state(page, label="0"):
+    return {"page": page, "bboxes": BBOXES, "annotation_id": "mark-1", "prediction": {"args": [label]}}
+
+
+@pytest.fixture(autouse=True)
+def reset_stats(monkeypatch):
+    monkeypatch.setattr(tools, "registry_stats", dict.fromkeys(tools.registry_stats, 0))
+
+
+def test_ok_acts_at_the_resolved_point():
+    page = FakePage({"status": "ok", "x": 15, "y": 90, "moved": True, "scrolled": True})
+    assert asyncio.run(tools.locate(state(page), 0)) == (15, 90)
+    assert page.calls == [[0, "mark-1"]]
+    assert asyncio.run(tools.click(state(page))) == "Clicked 0"
+    assert page.mouse.clicks == [(15, 90)]
+    assert tools.registry_stats["resolved"] == 2
+    assert tools.registry_stats["moved"] == 2 and tools.registry_stats["scrolled"] == 2
+
+
+@pytest.mark.parametrize(
+    "status, reason",
+    [("stale", "the element was removed"), ("obscured", 'the element is covered by div "Cookies"')],
+)
+def test_stale_and_obscured_labels_are_reported_not_clicked(status, reason):
+    page = FakePage({"status": status, "reason": reason})
+    observation = asyncio.run(tools.click(state(page)))
+    assert observation.startswith(f"Error: label 0 is {status}") and reason in observation
+    assert page.mouse.clicks == []
+    assert tools.registry_stats[status] == 1
+
+
+@pytest.mark.parametrize("resolved", [None, RuntimeError("Execution context was destroyed")])
+def test_falls_back_to_the_annotated_coordinates(resolved):
+    page = FakePage(resolved)
+    assert asyncio.run(tools.click(state(page))) == "Clicked 0"
+    assert page.mouse.clicks == [(10, 20)]
+    assert tools.registry_stats["fallback"] == 1
+
+
+def test_missing_bboxes_are_errors_without_a_page_call():
+    page = FakePage(None)
+    assert asyncio.run(tools.click(state(page, "1"))) == "Error: no bbox for : 1"
+    assert asyncio.run(tools.click(state(page, "5"))) == "Error: no bbox for : 5"
+    assert page.calls == []
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import os
+
+from stub_api import StubGeminiAPI
+from train import Backoff, Checkpoint, LabellingPipeline
+
+VIDEOS = ["a.mov", "b.mov", "c.mov", "d.mov"]
+
+
+def make_data(tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    for video in VIDEOS:
+        (data / video).write_bytes(b"")
+    out = tmp_path / "out"
+    out.mkdir()
+    return str(data), str(out)
+
+
+def run(api, data, out, max_retries=6, **kwargs):
+    pipeline = LabellingPipeline(
+        api, data, out, backoff=Backoff(base=0.001, cap=0.005, max_retries=max_retries), poll_interval=0, **kwargs
+    )
+    outputs = asyncio.run(pipeline.run())
+    return pipeline, outputs
+
+
+def checkpoint_lines(out):
+    with open(os.path.join(out, "model_outputs.jsonl")) as f:
+        return [json.loads(line)["video"] for line in f]
+
+
+def test_labels_every_video_through_rate_limits(tmp_path):
+    data, out = make_data(tmp_path)
+    api = StubGeminiAPI(latency=0, processing_polls=2, rate_limit_every=3)
+    pipeline, outputs = run(api, data, out)
+    assert sorted(outputs) == VIDEOS and not pipeline.failed
+    assert sorted(checkpoint_lines(out)) == VIDEOS
+    assert outputs["a.mov"][0]["element"] == "a.mov"
+    # Rate limits were retried rather than failing videos
+    assert api.calls["upload"] + api.calls["generate"] > 2 * len(VIDEOS)
+    with open(os.path.join(out, "processing_state.json")) as f:
+        assert json.load(f) == {}
+
+
+def test_resumes_after_a_failure_partway(tmp_path):
+    data, out = make_data(tmp_path)
+    first, outputs = run(StubGeminiAPI(latency=0, rate_limit_every=0, failing={"b.mov"}), data, out)
+    assert sorted(outputs) == ["a.mov", "c.mov", "d.mov"]
+    assert list(first.failed) == ["b.mov"]
+
+    # A crash mid-write leaves half a line, that video is redone too
+    with open(os.path.join(out, "model_outputs.jsonl"), "a") as f:
+        f.write('{"video": "c.mo')
+
+    api = StubGeminiAPI(latency=0, rate_limit_every=0)
+    second, outputs = run(api, data, out)
+    assert sorted(outputs) == VIDEOS and not second.failed
+    # Only the failed video was uploaded and labelled again
+    assert api.calls["upload"] == 1 and api.calls["generate"] == 1
+
+
+def test_reuses_an_upload_left_by_a_run_that_stopped_partway(tmp_path):
+    data, out = make_data(tmp_path)
+    api = StubGeminiAPI(latency=0, rate_limit_every=0)
+    Checkpoint(out).uploaded("b.mov", api.upload(os.path.join(data, "b.mov"), "b.mov"))
+    _, outputs = run(api, data, out)
+    assert sorted(outputs) == VIDEOS
+    # b.mov's upload was reused, only the other three were uploaded
+    assert api.calls["upload"] == 1 + 3
+
+
+def test_failed_upload_is_uploaded_again_on_the_next_run(tmp_path):
+    data, out = make_data(tmp_path)
+    api = StubGeminiAPI(latency=0, rate_limit_every=0, unprocessable={"b.mov"})
+    first, outputs = run(api, data, out)
+    assert list(first.failed) == ["b.mov"] and "could not process" in first.failed["b.mov"]
+    with open(os.path.join(out, "processing_state.json")) as f:
+        assert json.load(f) == {}
+
+    # Same API session, so the FAILED file still exists; it is not reused
+    api.unprocessable.clear()
+    uploads = api.calls["upload"]
+    second, outputs = run(api, data, out)
+    assert sorted(outputs) == VIDEOS and not second.failed
+    assert api.calls["upload"] == uploads + 1
+
+
+def test_gives_up_after_the_retry_budget(tmp_path):
+    data, out = make_data(tmp_path)
+    api = StubGeminiAPI(latency=0, rate_limit_every=1)
+    pipeline, outputs = run(api, data, out, max_retries=2)
+    assert outputs == {} and sorted(pipeline.failed) == VIDEOS
+    assert all("Gave up after 2 retries" in error for error in pipeline.failed.values())
+
+
+def test_processing_is_polled_apart_from_the_retry_budget(tmp_path):
+    data, out = make_data(tmp_path)
+    # Far more processing polls than retries allowed
+    api = StubGeminiAPI(latency=0, rate_limit_every=0, processing_polls=20)
+    pipeline, outputs = run(api, data, out, max_retries=1)
+    assert sorted(outputs) == VIDEOS and not pipeline.failed
+
+
+def test_processing_timeout_fails_the_video(tmp_path):
+    data, out = make_data(tmp_path)
+    api = StubGeminiAPI(latency=0, rate_limit_every=0, processing_polls=10**6)
+    pipeline, outputs = run(api, data, out, processing_timeout=0.05)
+    assert outputs == {} and all("still processing" in e for e in pipeline.failed.values())
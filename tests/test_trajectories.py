@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+from trajectories import TrajectoryRecorder, TrajectoryStore
+
+BBOXES = [
+    {"type": "button", "text": "Create", "ariaLabel": "Create issue"},
+    {"type": "input", "text": "", "ariaLabel": "Summary"},
+]
+
+
+def agent_update(action, args=None):
+    return {
+        "prediction": {"action": action, "args": args, "reply": ""},
+        "bboxes": BBOXES,
+        "page": SimpleNamespace(url="https://example.test/board"),
+    }
+
+
+def test_failed_steps_are_not_recorded():
+    recorder = TrajectoryRecorder("Create an issue")
+    recorder.record(agent_update("Click", ["7"]))
+    recorder.observe("Error: no bbox for : 7")
+    recorder.record(agent_update("Click", ["0"]))
+    recorder.observe("Error: label 0 is stale, the element was removed. Look at the new screenshot and pick again.")
+    recorder.record(agent_update("retry"))
+    recorder.record(agent_update("Click", ["0"]))
+    recorder.observe("Clicked 0")
+    recorder.record(agent_update("Type", ["1", "Login bug"]))
+    recorder.observe("Typed Login bug and submitted")
+    recorder.record(agent_update("ANSWER", ["done"]))
+
+    assert recorder.complete
+    steps = recorder.trajectory()["steps"]
+    assert [(s["action"], s["args"]) for s in steps] == [
+        ("Click", ["0"]),
+        ("Type", ["1", "Login bug"]),
+        ("ANSWER", ["done"]),
+    ]
+    assert steps[0]["target"]["ariaLabel"] == "Create issue"
+
+
+def test_store_round_trip(tmp_path):
+    store = TrajectoryStore(str(tmp_path))
+    recorder = TrajectoryRecorder("Create an issue!")
+    recorder.record(agent_update("ANSWER", ["done"]))
+    store.save(recorder.trajectory())
+    assert store.load("create an issue") == recorder.trajectory()
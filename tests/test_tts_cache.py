@@ -0,0 +1,31 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from tts_cache import TTSCache
+
+
+def test_round_trip_through_disk(tmp_path):
+    cache = TTSCache(str(tmp_path), memory_bytes=0)
+    key = TTSCache.key("hello", "aura", "linear16")
+    cache.put(key, b"audio")
+    assert cache.get(key) == b"audio"
+    assert TTSCache(str(tmp_path)).get(key) == b"audio"
+
+
+def test_concurrent_puts_of_one_phrase_count_it_once(tmp_path):
+    cache = TTSCache(str(tmp_path), memory_bytes=0)
+    key = TTSCache.key("Let me check that", "aura", "linear16")
+    audio = b"x" * 1024 * 1024
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda _: cache.put(key, audio), range(32)))
+    assert cache._disk_size == len(audio)
+    assert sorted(os.listdir(tmp_path)) == [f"{key}.audio"]
+
+
+def test_disk_budget_evicts_oldest(tmp_path):
+    cache = TTSCache(str(tmp_path), disk_bytes=250)
+    keys = [TTSCache.key(str(i), "aura", "linear16") for i in range(3)]
+    for key in keys:
+        cache.put(key, b"x" * 100)
+    assert cache._disk_size == 200
+    assert not os.path.exists(os.path.join(tmp_path, f"{keys[0]}.audio"))
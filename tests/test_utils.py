@@ -0,0 +1,52 @@
+import pytest
+
+from utils import StreamingParser, parse
+
+
+def stream(text, size=3):
+    parser = StreamingParser()
+    spoken = "".join(parser.feed(text[i:i + size]) for i in range(0, len(text), size))
+    spoken += parser.flush()
+    return spoken, parser.finish()
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 1000])
+def test_streamed_reply_matches_parse(size):
+    text = "Thought: the form\nAction: Click [3]\nReply:  Let's open the form.\n"
+    spoken, prediction = stream(text, size)
+    assert spoken == "Let's open the form."
+    assert prediction == parse(text) == {"action": "Click", "args": ["3"], "reply": "Let's open the form."}
+
+
+def test_crlf_output_streams_no_carriage_return():
+    text = "Thought: t\r\nAction: Click [3]\r\nReply: Opening it.\r\nThought: done\r\n"
+    spoken, prediction = stream(text)
+    assert spoken == "Opening it."
+    assert prediction["reply"] == "Opening it."
+
+
+def test_later_reply_line_is_neither_streamed_nor_parsed():
+    text = "Action: Click [3]\nReply: First.\nReply: Second.\n"
+    spoken, prediction = stream(text)
+    assert spoken == prediction["reply"] == "First."
+
+
+def test_empty_reply_line_is_skipped_for_the_next_one():
+    text = "Action: Click [3]\nReply: \nReply: Second.\n"
+    spoken, prediction = stream(text)
+    assert spoken == prediction["reply"] == "Second."
+
+
+def test_nothing_is_streamed_when_parse_retries():
+    text = "Thought: no idea\nReply: Hang on a second.\n"
+    spoken, prediction = stream(text)
+    assert prediction["action"] == "retry"
+    assert spoken == ""
+
+
+def test_reply_before_action_is_streamed_once_the_action_completes():
+    text = "Reply: On it.\nAction: Scroll [WINDOW; down]"
+    parser = StreamingParser()
+    assert parser.feed(text) == ""
+    assert parser.flush() == "On it."
+    assert parser.finish()["reply"] == "On it."
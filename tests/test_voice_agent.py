@@ -0,0 +1,151 @@
+import asyncio
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import app.agent.voice_agent as voice_agent
+from app.utils.custom_types import ResponseRequiredRequest, Utterance
+
+
+class FakePage:
+    def is_closed(self):
+        return False
+
+
+class FakePool:
+    def __init__(self):
+        self.acquired = []
+        self.released = []
+
+    async def acquire(self):
+        page = FakePage()
+        self.acquired.append(page)
+        return page
+
+    async def release(self, page):
+        self.released.append(page)
+
+
+async def fake_run_agent(page, input_text, reply_sink=None, speak=True):
+    reply_sink(f"done: {input_text}")
+    yield "step"
+
+
+def request(response_id, text):
+    return ResponseRequiredRequest(
+        interaction_type="response_required",
+        response_id=response_id,
+        transcript=[Utterance(role="user", content=text)],
+    )
+
+
+def test_call_keeps_one_page_across_turns(monkeypatch):
+    pool = FakePool()
+    monkeypatch.setattr(voice_agent, "browser_pool", pool)
+    monkeypatch.setattr(voice_agent, "run_agent", fake_run_agent)
+
+    async def call():
+        client = voice_agent.LlmClient()
+        replies = []
+        for response_id, text in [(1, "log in"), (2, "open the board")]:
+            async for event in client.draft_response(request(response_id, text)):
+                replies.append(event.content)
+        assert len(pool.acquired) == 1 and pool.released == []
+        await client.close()
+        return replies
+
+    replies = asyncio.run(call())
+    assert "done: open the board" in replies
+    assert pool.released == pool.acquired
+
+
+def drafted(monkeypatch, request):
+    pool = FakePool()
+    monkeypatch.setattr(voice_agent, "browser_pool", pool)
+    monkeypatch.setattr(voice_agent, "run_agent", fake_run_agent)
+
+    async def draft():
+        client = voice_agent.LlmClient()
+        replies = [event.content async for event in client.draft_response(request)]
+        await client.close()
+        return replies
+
+    return asyncio.run(draft()), pool
+
+
+def test_agent_works_on_the_last_user_utterance(monkeypatch):
+    replies, _ = drafted(
+        monkeypatch,
+        ResponseRequiredRequest(
+            interaction_type="response_required",
+            response_id=1,
+            transcript=[
+                Utterance(role="user", content="open the board"),
+                Utterance(role="agent", content="Sure, opening it."),
+            ],
+        ),
+    )
+    assert "done: open the board" in replies
+
+
+def test_reminder_does_not_start_the_agent(monkeypatch):
+    replies, pool = drafted(
+        monkeypatch,
+        ResponseRequiredRequest(
+            interaction_type="reminder_required",
+            response_id=2,
+            transcript=[Utterance(role="user", content="open the board")],
+        ),
+    )
+    assert replies == [voice_agent.reminder_sentence]
+    assert pool.acquired == []
+
+
+def test_empty_transcript_does_not_start_the_agent(monkeypatch):
+    replies, pool = drafted(
+        monkeypatch, ResponseRequiredRequest(interaction_type="response_required", response_id=1, transcript=[])
+    )
+    assert replies == [""] and pool.acquired == []
+
+
+def utterances(*contents):
+    return [Utterance(role="user" if i % 2 == 0 else "agent", content=c) for i, c in enumerate(contents)]
+
+
+def make_builder():
+    converted = []
+
+    def convert(new):
+        converted.append([u.content for u in new])
+        return [{"role": u.role, "content": u.content} for u in new]
+
+    return voice_agent.PromptBuilder("system", convert), converted
+
+
+def test_prompt_builder_converts_only_appended_turns():
+    builder, converted = make_builder()
+    first = builder.build(utterances("hi", "hello"))
+    second = builder.build(utterances("hi", "hello", "open the board"))
+    assert converted == [["hi", "hello"], ["open the board"]]
+    # The earlier messages are the same objects, not rebuilt
+    assert all(a is b for a, b in zip(first, second))
+    assert [m["content"] for m in second] == ["system", "hi", "hello", "open the board"]
+    assert builder.stats == {"converted": 3, "rewrites": 0}
+
+
+def test_prompt_builder_rebuilds_from_an_edited_turn():
+    builder, converted = make_builder()
+    builder.build(utterances("hi", "hello", "open the bord"))
+    prompt = builder.build(utterances("hi", "hello", "open the board", "sure"))
+    assert converted[-1] == ["open the board", "sure"]
+    assert [m["content"] for m in prompt] == ["system", "hi", "hello", "open the board", "sure"]
+    assert builder.stats["rewrites"] == 1
+
+
+def test_prompt_builder_drops_deleted_turns():
+    builder, converted = make_builder()
+    builder.build(utterances("hi", "hello", "um"))
+    prompt = builder.build(utterances("hi", "hello"))
+    assert converted[-1] == []
+    assert [m["content"] for m in prompt] == ["system", "hi", "hello"]
+    assert builder.stats["rewrites"] == 1
@@ -0,0 +1,147 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import web_agent
+
+
+class FakeGraph:
+    # Emits a tool event that leaves a prefetch running, then keeps going
+    def __init__(self, prefetch_started):
+        self.prefetch_started = prefetch_started
+
+    async def astream(self, state):
+        prefetch = asyncio.create_task(asyncio.sleep(60))
+        self.prefetch_started.append(prefetch)
+        yield {"Click": {"observation": "Clicked 1", "prefetch": prefetch, "early_tool": None}}
+        await asyncio.sleep(60)
+        yield {"agent": {}}
+
+
+def stop_after_first_event(monkeypatch, mode):
+    started = []
+    monkeypatch.setitem(web_agent.graphs, mode, FakeGraph(started))
+
+    async def run():
+        events = web_agent.graph_events({}, mode)
+        await events.__anext__()
+        await events.aclose()
+        # Checked before the loop shuts down and cancels leftovers itself
+        return [task.cancelled() for task in started]
+
+    return asyncio.run(run())
+
+
+def test_pipelined_run_cancels_prefetch_before_returning(monkeypatch):
+    assert stop_after_first_event(monkeypatch, "pipelined") == [True]
+
+
+def test_serial_run_cancels_prefetch_before_returning(monkeypatch):
+    assert stop_after_first_event(monkeypatch, "serial") == [True]
+
+
+class FakePool:
+    def __init__(self):
+        self.released = 0
+
+    async def acquire(self):
+        return object()
+
+    async def release(self, page):
+        self.released += 1
+
+
+async def echo_agent(page, input_text, mode=None):
+    yield f"working on: {input_text}"
+    yield "done"
+
+
+def pcm(ms, amplitude):
+    import numpy as np
+
+    t = np.arange(16 * ms) / 16000
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype("<i2").tobytes()
+
+
+def test_audio_stream_transcribes_and_runs_the_agent(monkeypatch):
+    from fastapi.testclient import TestClient
+    from stt import FakeTranscriber
+
+    pool = FakePool()
+    monkeypatch.setattr(web_agent, "stt_transcriber", FakeTranscriber(["open the board"]))
+    monkeypatch.setattr(web_agent, "browser_pool", pool)
+    monkeypatch.setattr(web_agent, "run_agent", echo_agent)
+    client = TestClient(web_agent.app)
+    with client.websocket_connect("/api/audio_stream") as websocket:
+        # Control frames that aren't {"type": "end"} are ignored
+        for text in ["hello", "[]", '{"type": "other"}']:
+            websocket.send_text(text)
+        websocket.send_bytes(pcm(300, 0) + pcm(400, 8000))
+        assert websocket.receive_json() == {"type": "speech_start"}
+        websocket.send_text('{"type": "end"}')
+        assert websocket.receive_json() == {"type": "final", "text": "open the board"}
+        timings = websocket.receive_json()
+        assert timings["type"] == "timings" and "end_of_speech_to_agent_ms" in timings
+        assert websocket.receive_json() == {"type": "agent", "text": "working on: open the board"}
+        assert websocket.receive_json() == {"type": "agent", "text": "done"}
+        websocket.close()
+        time.sleep(0.1)
+    assert pool.released == 1
+
+
+@pytest.mark.parametrize("mode", web_agent.EXECUTION_MODES)
+def test_tab_switch_carries_over_in_both_modes(monkeypatch, mode):
+    async def open_new_tab(state):
+        state["page"] = "new tab"
+        return "Opened new tab"
+
+    async def ready(page):
+        return 0.0
+
+    async def annotate_page(state):
+        return {}
+
+    monkeypatch.setitem(web_agent.tools, "OpenNewTab", open_new_tab)
+    monkeypatch.setattr(web_agent, "wait_until_ready", ready)
+    monkeypatch.setattr(web_agent, "annotate_page", annotate_page)
+
+    async def run():
+        node = web_agent.tool_node("OpenNewTab", mode == "pipelined")
+        state = {"page": "old tab", "prediction": {"action": "OpenNewTab", "args": None}, "steps": []}
+        update = await node(state)
+        if update.get("prefetch") is not None:
+            await update["prefetch"]
+        return update
+
+    assert asyncio.run(run())["page"] == "new tab"
+
+
+@pytest.mark.parametrize("size", [None, 10])
+def test_read_upload_stops_past_the_size_limit(monkeypatch, size):
+    import io
+
+    from fastapi import UploadFile
+
+    monkeypatch.setattr(web_agent, "MAX_AUDIO_BYTES", 8)
+    monkeypatch.setattr(web_agent, "AUDIO_READ_CHUNK", 3)
+
+    async def read(data, size):
+        return await web_agent.read_upload(UploadFile(io.BytesIO(data), size=size))
+
+    # Declared too large, or found too large while reading an undeclared size
+    assert asyncio.run(read(b"x" * 10, size)) is None
+    assert asyncio.run(read(b"x" * 8, None)) == b"x" * 8
+
+
+def test_oversized_audio_upload_is_rejected_with_413(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setattr(web_agent, "MAX_AUDIO_BYTES", 8)
+    client = TestClient(web_agent.app)
+    response = client.post("/api/process_audio", files={"audio": ("clip.wav", b"x" * 9, "audio/wav")})
+    assert response.status_code == 413
+    assert response.json() == {"error": "Audio larger than 8 bytes"}
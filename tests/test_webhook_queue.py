@@ -0,0 +1,83 @@
+import asyncio
+
+from app.utils.webhook_queue import WebhookQueue
+
+
+def event(name, call_id):
+    return {"event": name, "data": {"call_id": call_id}}
+
+
+def test_duplicates_are_handled_once():
+    handled = []
+
+    async def handler(e):
+        handled.append(e["event"])
+
+    async def run():
+        queue = WebhookQueue(handler, workers=1)
+        await queue.start()
+        statuses = [queue.submit(event("call_started", "c1")) for _ in range(3)]
+        statuses.append(queue.submit(event("call_ended", "c1")))
+        await queue.stop()
+        return statuses
+
+    assert asyncio.run(run()) == ["queued", "duplicate", "duplicate", "queued"]
+    assert handled == ["call_started", "call_ended"]
+
+
+def test_failed_handler_is_retried_with_backoff():
+    attempts = []
+
+    async def handler(e):
+        attempts.append(e["event"])
+        if len(attempts) < 3:
+            raise RuntimeError("database unavailable")
+
+    async def run():
+        queue = WebhookQueue(handler, workers=1, retries=3, retry_delay=0.001)
+        await queue.start()
+        queue.submit(event("call_analyzed", "c1"))
+        await queue.stop()
+        return queue.stats
+
+    stats = asyncio.run(run())
+    assert attempts == ["call_analyzed"] * 3
+    assert stats["retried"] == 2 and stats["handled"] == 1 and stats["failed"] == 0
+
+
+def test_event_is_dropped_and_logged_once_retries_run_out(caplog):
+    attempts = []
+
+    async def handler(e):
+        attempts.append(e["event"])
+        raise RuntimeError("database unavailable")
+
+    async def run():
+        queue = WebhookQueue(handler, workers=1, retries=2, retry_delay=0.001)
+        await queue.start()
+        queue.submit(event("call_analyzed", "c1"))
+        await queue._queue.join()
+        # Sent again by hand, it is handled again rather than a duplicate
+        resent = queue.submit(event("call_analyzed", "c1"))
+        await queue.stop()
+        return resent, queue.stats
+
+    resent, stats = asyncio.run(run())
+    assert resent == "queued"
+    assert len(attempts) == 2 * 3 and stats["failed"] == 2
+    dropped = [r for r in caplog.records if r.levelname == "ERROR"]
+    assert len(dropped) == 2 and "call_analyzed" in dropped[0].getMessage()
+
+
+def test_full_queue_is_reported():
+    async def handler(e):
+        await asyncio.sleep(1)
+
+    async def run():
+        queue = WebhookQueue(handler, workers=1, queue_size=1)
+        await queue.start()
+        statuses = [queue.submit(event("call_started", f"c{i}")) for i in range(3)]
+        await queue.stop(timeout=0)
+        return statuses
+
+    assert asyncio.run(run()) == ["queued", "full", "full"]
@@ -0,0 +1,419 @@
+import argparse
+import json
+import os
+import random
+import re
+import struct
+import sys
+import time
+from array import array
+from collections import Counter
+from itertools import accumulate
+from typing import Dict, Iterator, List, Optional
+
+from prompt import train_prompt
+
+# Labelled user flows in a compact, append-only columnar file. Each append
+# writes one self-describing block: a JSON header with the block's enum
+# dictionaries and column sizes, then the columns. Enums are stored as one
+# byte codes into those dictionaries, strings as offsets plus a UTF-8 blob.
+#   python dataset.py build model_outputs.json --out flows.bin
+#   python dataset.py stats flows.bin
+#   python dataset.py sample flows.bin -n 3 --action-type input
+#   python dataset.py bench --actions 300000
+
+MAGIC = b"FLW1"
+ENUMS = ("action_type", "element_type")
+TEXT = ("element", "value")
+_HEADER = struct.Struct("<4sI")
+
+
+def _vocabulary(name: str) -> List[str]:
+    # The vocabularies are the quoted lists in the labelling prompt, so the
+    # prompt stays the single place they are defined
+    line = next(line for line in train_prompt.splitlines() if line.startswith(name))
+    return re.findall(r'"([^"]+)"', line)
+
+
+VOCABULARY = {
+    "action_type": _vocabulary("action_type ="),
+    # The prompt's own example labels buttons as "button", and the model
+    # follows the example
+    "element_type": _vocabulary("element_types -") + ["button"],
+}
+_LOOKUP = {field: {v.lower(): v for v in values} for field, values in VOCABULARY.items()}
+
+
+def parse_model_output(text: str):
+    # The JSON array in a model reply, with or without a ``` / ```json fence
+    fenced = re.search(r"```(?:json)?\s*(.*?)```", text, re.DOTALL)
+    if fenced:
+        text = fenced.group(1)
+    return json.loads(text.strip())
+
+
+def validate_action(action: dict) -> List[str]:
+    problems = []
+    for field in ENUMS:
+        value = action.get(field)
+        if value is None:
+            problems.append(f"missing {field}")
+        elif str(value).strip().lower() not in _LOOKUP[field]:
+            problems.append(f"unknown {field} {value!r}")
+    if "element" not in action:
+        problems.append("missing element")
+    return problems
+
+
+def normalize_action(action: dict) -> dict:
+    # Vocabulary values with their canonical spelling, a missing value as NA
+    normalized = {"element": str(action.get("element", "")), "value": str(action.get("value", "NA"))}
+    for field in ENUMS:
+        value = str(action.get(field, "")).strip()
+        normalized[field] = _LOOKUP[field].get(value.lower(), value)
+    return normalized
+
+
+def _to_bytes(column: array) -> bytes:
+    if sys.byteorder == "big":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _from_bytes(typecode: str, data) -> array:
+    column = array(typecode)
+    column.frombytes(data)
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column
+
+
+class _TextColumn:
+    def __init__(self):
+        self.offsets = array("I", [0])
+        self.data = bytearray()
+
+    def append(self, text: str):
+        self.data += text.encode()
+        self.offsets.append(len(self.data))
+
+
+class DatasetWriter:
+    # keep_invalid=False drops whole flows with any action outside the
+    # vocabulary; a flow with holes is worse training data than no flow.
+    # With keep_invalid they are stored with a valid=0 flag per action.
+
+    def __init__(self, path: str, keep_invalid: bool = False):
+        self.path = path
+        self.keep_invalid = keep_invalid
+
+    def append(self, flows: Dict[str, List[dict]]) -> dict:
+        report = {"flows": 0, "actions": 0, "rejected_flows": {}, "invalid_actions": 0}
+        dicts = {field: list(VOCABULARY[field]) for field in ENUMS}
+        codes = {field: {v: i for i, v in enumerate(values)} for field, values in dicts.items()}
+        names = _TextColumn()
+        counts = array("I")
+        enums = {field: array("B") for field in ENUMS}
+        valid = array("B")
+        texts = {field: _TextColumn() for field in TEXT}
+
+        for name, actions in flows.items():
+            problems = {i: validate_action(a) for i, a in enumerate(actions) if isinstance(a, dict)}
+            problems.update({i: ["not an object"] for i, a in enumerate(actions) if not isinstance(a, dict)})
+            bad = {i: p for i, p in problems.items() if p}
+            if bad and not self.keep_invalid:
+                report["rejected_flows"][name] = [f"action {i}: {', '.join(p)}" for i, p in sorted(bad.items())]
+                continue
+            names.append(name)
+            counts.append(len(actions))
+            for i, action in enumerate(actions):
+                action = normalize_action(action if isinstance(action, dict) else {})
+                for field in ENUMS:
+                    value = action[field]
+                    if value not in codes[field]:
+                        codes[field][value] = len(dicts[field])
+                        dicts[field].append(value)
+                    if codes[field][value] > 255:
+                        raise ValueError(f"More than 256 distinct {field} values in one block")
+                    enums[field].append(codes[field][value])
+                for field in TEXT:
+                    texts[field].append(action[field])
+                valid.append(0 if bad.get(i) else 1)
+            report["flows"] += 1
+            report["actions"] += len(actions)
+            report["invalid_actions"] += len(bad)
+
+        if not report["flows"]:
+            return report
+        columns = [
+            ("flow_name.offsets", names.offsets),
+            ("flow_name.data", array("B", names.data)),
+            ("flow_actions", counts),
+            *((field, enums[field]) for field in ENUMS),
+            ("valid", valid),
+        ]
+        for field in TEXT:
+            columns += [(f"{field}.offsets", texts[field].offsets), (f"{field}.data", array("B", texts[field].data))]
+        payload = [_to_bytes(column) for _, column in columns]
+        header = json.dumps(
+            {
+                "flows": report["flows"],
+                "actions": report["actions"],
+                "dicts": dicts,
+                "columns": [[name, column.typecode, len(data)] for (name, column), data in zip(columns, payload)],
+            }
+        ).encode()
+        if os.path.exists(self.path):
+            # Drop an append cut short by a crash, or the next block would be
+            # read as the rest of it
+            end = _complete_size(self.path)
+            if end < os.path.getsize(self.path):
+                os.truncate(self.path, end)
+        with open(self.path, "ab") as f:
+            f.write(_HEADER.pack(MAGIC, len(header)))
+            f.write(header)
+            for data in payload:
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        return report
+
+
+class Block:
+    def __init__(self, header: dict, columns: Dict[str, array]):
+        self.flows = header["flows"]
+        self.actions = header["actions"]
+        self.dicts = header["dicts"]
+        self.columns = columns
+        # Flow i's actions are rows offsets[i] to offsets[i + 1]
+        self.offsets = list(accumulate(columns["flow_actions"], initial=0))
+
+    def _text(self, field: str, i: int) -> str:
+        offsets = self.columns[f"{field}.offsets"]
+        return bytes(self.columns[f"{field}.data"][offsets[i]:offsets[i + 1]]).decode()
+
+    def flow_names(self) -> List[str]:
+        return [self._text("flow_name", i) for i in range(self.flows)]
+
+    def flow_ranges(self) -> Iterator[tuple]:
+        for i in range(self.flows):
+            yield i, self.offsets[i], self.offsets[i + 1]
+
+    def code(self, field: str, value: str) -> Optional[int]:
+        value = _LOOKUP.get(field, {}).get(value.lower(), value)
+        try:
+            return self.dicts[field].index(value)
+        except ValueError:
+            return None
+
+    def select(self, action_type: Optional[str] = None, element_type: Optional[str] = None, valid_only: bool = False):
+        # Row indices matching every filter given, compared on the codes
+        wanted = {}
+        for field, value in (("action_type", action_type), ("element_type", element_type)):
+            if value is not None:
+                code = self.code(field, value)
+                if code is None:
+                    return []
+                wanted[field] = code
+        rows = range(self.actions)
+        for field, code in wanted.items():
+            column = self.columns[field]
+            rows = [i for i in rows if column[i] == code]
+        if valid_only:
+            column = self.columns["valid"]
+            rows = [i for i in rows if column[i]]
+        return list(rows)
+
+    def action(self, i: int, flow: Optional[str] = None) -> dict:
+        action = {} if flow is None else {"flow": flow}
+        return {
+            **action,
+            "action_type": self.dicts["action_type"][self.columns["action_type"][i]],
+            "element_type": self.dicts["element_type"][self.columns["element_type"][i]],
+            "element": self._text("element", i),
+            "value": self._text("value", i),
+            "valid": bool(self.columns["valid"][i]),
+        }
+
+    def flow(self, index: int) -> dict:
+        start, end = self.offsets[index], self.offsets[index + 1]
+        name = self._text("flow_name", index)
+        return {"flow": name, "actions": [self.action(i) for i in range(start, end)]}
+
+
+def _next_block(f, path: str, load: bool = True) -> Optional[tuple]:
+    # The next block's header and columns (left unread without load), or None
+    # at the end of the file or at an append cut short by a crash; everything
+    # before that is intact
+    head = f.read(_HEADER.size)
+    if len(head) < _HEADER.size:
+        return None
+    magic, length = _HEADER.unpack(head)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a flow dataset or is corrupt")
+    raw = f.read(length)
+    if len(raw) < length:
+        return None
+    header = json.loads(raw)
+    columns = {}
+    if not load:
+        size = sum(size for _, _, size in header["columns"])
+        if f.tell() + size > os.fstat(f.fileno()).st_size:
+            return None
+        f.seek(size, os.SEEK_CUR)
+        return header, columns
+    for name, typecode, size in header["columns"]:
+        data = f.read(size)
+        if len(data) != size:
+            return None
+        columns[name] = _from_bytes(typecode, data)
+    return header, columns
+
+
+def _complete_size(path: str) -> int:
+    # Bytes up to the end of the last complete block
+    end = 0
+    with open(path, "rb") as f:
+        while _next_block(f, path, load=False) is not None:
+            end = f.tell()
+    return end
+
+
+def read_blocks(path: str) -> Iterator[Block]:
+    # One block in memory at a time
+    with open(path, "rb") as f:
+        while (block := _next_block(f, path)) is not None:
+            yield Block(*block)
+
+
+def iter_actions(path: str, **filters) -> Iterator[dict]:
+    for block in read_blocks(path):
+        names = block.flow_names()
+        flow_of = array("I")
+        for index, start, end in block.flow_ranges():
+            flow_of.extend([index] * (end - start))
+        for i in block.select(**filters):
+            yield block.action(i, names[flow_of[i]])
+
+
+def load_flows(path: str) -> Dict[str, List[dict]]:
+    # model_outputs.json ({flow: actions}) or train.py's model_outputs.jsonl
+    with open(path) as f:
+        if not path.endswith(".jsonl"):
+            return json.load(f)
+        flows = {}
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by a crash, that video is redone
+                continue
+            if record:
+                flows[record["video"]] = record["output"]
+        return flows
+
+
+def stats(path: str) -> dict:
+    report = {"blocks": 0, "flows": 0, "actions": 0, "invalid_actions": 0, "action_type": Counter(), "element_type": Counter()}
+    for block in read_blocks(path):
+        report["blocks"] += 1
+        report["flows"] += block.flows
+        report["actions"] += block.actions
+        report["invalid_actions"] += block.actions - sum(block.columns["valid"])
+        for field in ENUMS:
+            counts = Counter(block.columns[field])
+            report[field].update({block.dicts[field][code]: n for code, n in counts.items()})
+    report["bytes"] = os.path.getsize(path)
+    report["bytes_per_action"] = round(report["bytes"] / report["actions"], 1) if report["actions"] else None
+    for field in ENUMS:
+        report[field] = dict(report[field].most_common())
+    return report
+
+
+def sample(path: str, n: int, seed: Optional[int] = None, **filters) -> List[dict]:
+    # Reservoir sample of whole flows, streaming; with filters only flows
+    # containing a matching action qualify
+    rng = random.Random(seed)
+    chosen = []
+    seen = 0
+    for block in read_blocks(path):
+        matches = set(block.select(**filters)) if filters else None
+        for index, start, end in block.flow_ranges():
+            if matches is not None and not any(i in matches for i in range(start, end)):
+                continue
+            seen += 1
+            if len(chosen) < n:
+                chosen.append(block.flow(index))
+            elif (j := rng.randrange(seen)) < n:
+                chosen[j] = block.flow(index)
+    return chosen
+
+
+def bench(actions: int, path: str):
+    flows = {}
+    action_types = VOCABULARY["action_type"]
+    element_types = VOCABULARY["element_type"]
+    rng = random.Random(0)
+    for f in range(actions // 20):
+        flows[f"flow-{f}"] = [
+            {
+                "action_type": rng.choice(action_types[:4]),
+                "element_type": rng.choice(element_types[:10]),
+                "element": f"element {i}",
+                "value": "NA" if i % 3 else f"value {i}",
+            }
+            for i in range(20)
+        ]
+    if os.path.exists(path):
+        os.remove(path)
+    start = time.perf_counter()
+    DatasetWriter(path).append(flows)
+    written = time.perf_counter()
+    blocks = list(read_blocks(path))
+    loaded = time.perf_counter()
+    rows = sum(len(block.select(action_type="input", element_type="text entry")) for block in blocks)
+    filtered = time.perf_counter()
+    json_size = len(json.dumps(flows))
+    print(f"{sum(b.actions for b in blocks)} actions, {os.path.getsize(path)} bytes (JSON: {json_size} bytes)")
+    print(f"write {written - start:.3f}s  load {loaded - written:.3f}s  filter {filtered - loaded:.3f}s ({rows} rows)")
+    os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="validate model outputs and append them to a dataset")
+    build.add_argument("inputs", nargs="+", help="model_outputs.json or model_outputs.jsonl files")
+    build.add_argument("--out", required=True)
+    build.add_argument("--keep-invalid", action="store_true")
+    commands.add_parser("stats").add_argument("path")
+    sampler = commands.add_parser("sample")
+    sampler.add_argument("path")
+    sampler.add_argument("-n", type=int, default=5)
+    sampler.add_argument("--seed", type=int)
+    sampler.add_argument("--action-type")
+    sampler.add_argument("--element-type")
+    bencher = commands.add_parser("bench")
+    bencher.add_argument("--actions", type=int, default=300000)
+    bencher.add_argument("--path", default="bench_flows.bin")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        writer = DatasetWriter(args.out, keep_invalid=args.keep_invalid)
+        for path in args.inputs:
+            report = writer.append(load_flows(path))
+            print(f"{path}: {report['flows']} flows, {report['actions']} actions appended")
+            for name, problems in report["rejected_flows"].items():
+                print(f"  rejected {name}: {'; '.join(problems)}")
+    elif args.command == "stats":
+        print(json.dumps(stats(args.path), indent=2))
+    elif args.command == "sample":
+        filters = {k: v for k, v in (("action_type", args.action_type), ("element_type", args.element_type)) if v}
+        print(json.dumps(sample(args.path, args.n, args.seed, **filters), indent=2))
+    else:
+        bench(args.actions, args.path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import json
+import threading
+import time
+
+
+class StubRateLimited(Exception):
+    pass
+
+
+class StubNotReady(Exception):
+    pass
+
+
+class StubServerError(Exception):
+    pass
+
+
+class StubGeminiAPI:
+    # Local stand-in for GeminiAPI in train.py. Uploaded files stay
+    # PROCESSING for their first processing_polls state checks, every
+    # rate_limit_every-th call is rate limited, and latency simulates the
+    # network. outputs maps display names to the labels to return; videos
+    # in failing always fail to generate, and those in unprocessable end up
+    # FAILED after processing.
+
+    def __init__(
+        self,
+        outputs=None,
+        latency=0.05,
+        processing_polls=1,
+        rate_limit_every=7,
+        invalid_json_every=0,
+        failing=(),
+        unprocessable=(),
+    ):
+        self.outputs = outputs or {}
+        self.latency = latency
+        self.processing_polls = processing_polls
+        self.rate_limit_every = rate_limit_every
+        self.invalid_json_every = invalid_json_every
+        self.failing = set(failing)
+        self.unprocessable = set(unprocessable)
+        self.retryable_errors = (StubRateLimited, StubNotReady)
+        self.rate_limit_errors = (StubRateLimited,)
+        self.files = {}
+        self.calls = {'upload': 0, 'generate': 0, 'state': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, kind):
+        with self._lock:
+            self.calls[kind] += 1
+            total = sum(self.calls.values())
+        time.sleep(self.latency)
+        if self.rate_limit_every and total % self.rate_limit_every == 0:
+            raise StubRateLimited(f'{kind} rate limited')
+
+    def upload(self, path, display_name):
+        self._count('upload')
+        name = f'files/{len(self.files)}-{display_name}'
+        self.files[name] = {'display_name': display_name, 'polls': 0}
+        return name
+
+    def state(self, name):
+        with self._lock:
+            self.calls['state'] += 1
+        file = self.files[name]
+        file['polls'] += 1
+        if file['polls'] <= self.processing_polls:
+            return 'PROCESSING'
+        return 'FAILED' if file['display_name'] in self.unprocessable else 'ACTIVE'
+
+    def exists(self, name):
+        return name in self.files
+
+    def generate(self, name, prompt):
+        self._count('generate')
+        file = self.files[name]
+        if file['polls'] <= self.processing_polls:
+            raise StubNotReady(f'{name} is still processing')
+        if file['display_name'] in self.failing:
+            raise StubServerError(f'{name} could not be labelled')
+        if self.invalid_json_every and self.calls['generate'] % self.invalid_json_every == 0:
+            return 'not json'
+        output = self.outputs.get(
+            file['display_name'],
+            [{'action_type': 'click', 'element_type': 'button', 'element': file['display_name'], 'value': 'NA'}],
+        )
+        return f'```json\n{json.dumps(output)}\n```'
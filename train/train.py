@@ -1,12 +1,19 @@
+import argparse
+import asyncio
+import json
 import os
+import random
+import time
 from dotenv import load_dotenv
-import google.generativeai as genai 
-from IPython.display import Video
-from IPython.display import Image
 from prompt import train_prompt
-import json
-import time
-from google.api_core.exceptions import FailedPrecondition, ResourceExhausted
+from dataset import load_flows, parse_model_output
+
+# Labels every .mov in the data directory with Gemini. Uploads and
+# generations run concurrently under separate limits, rate limits pause all
+# workers together, and every labelled video is appended to a JSONL
+# checkpoint straight away, so a re-run picks up where the last one stopped.
+#   python train.py --data ./data --out . --uploads 3 --generations 2
+#   python train.py --stub   # dry run against the local stub API
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 env_path = os.path.join(script_dir, '../.env.local')
@@ -14,56 +21,253 @@ load_dotenv(env_path)
 
 load_dotenv('../.env.local')
 
-api_key = os.getenv('GOOGLE_API_KEY')
-genai.configure(api_key=api_key)
-
-# Get all video files in the data directory
-video_files = [f for f in os.listdir('./data') if f.endswith('.mov')]
-
-uploaded_files = []
-
-# Upload all video files
-for video_file in video_files:
-    print(f'Uploading file: {video_file}')
-    data_file = genai.upload_file(path=f'./data/{video_file}', display_name=video_file, mime_type='video/mov')
-    uploaded_files.append({
-        'name': data_file.name,
-        'display_name': data_file.display_name
-    })
-    print(f'Done uploading file: {video_file}')
-print(uploaded_files)
-
-model = genai.GenerativeModel(model_name='models/gemini-1.5-pro')
-model_outputs = {}
-
-# Generate content for all uploaded files
-for uploaded_file in uploaded_files:
-    # exponential backoff for gemnin 
-    retries = 0
-    while True:
+
+class GeminiAPI:
+    # The calls the pipeline makes, so a stub can stand in for them
+    def __init__(self, model_name='models/gemini-1.5-pro'):
+        import google.generativeai as genai
+        from google.api_core.exceptions import FailedPrecondition, ResourceExhausted
+
+        genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
+        self.genai = genai
+        self.model = genai.GenerativeModel(model_name=model_name)
+        # Worth retrying; rate limits also pause every other worker
+        self.retryable_errors = (FailedPrecondition, ResourceExhausted)
+        self.rate_limit_errors = (ResourceExhausted,)
+
+    def upload(self, path, display_name):
+        return self.genai.upload_file(path=path, display_name=display_name, mime_type='video/mov').name
+
+    def state(self, name):
+        # PROCESSING until the video can be used, then ACTIVE (or FAILED)
+        return self.genai.get_file(name=name).state.name
+
+    def exists(self, name):
+        # Uploaded files expire, a stale processing state means uploading again
         try:
-            file = genai.get_file(name=uploaded_file['name'])
-            print(f'Calling LLM for file: {file.display_name}')
-            response = model.generate_content([train_prompt, file])
-            if response and response.text:
-                try:
-                    # Remove triple quotes and 'json' keyword
-                    cleaned_response = response.text.replace("```", "").replace("json", "").strip()
-                    print(cleaned_response)
-                    response_json = json.loads(cleaned_response)
-                    model_outputs[uploaded_file['display_name']] = response_json
-                    print(f'Done calling language model for the file: {file.display_name}')
-                    break
-                except json.JSONDecodeError:
-                    print("Invalid JSON response received.")
-        except (FailedPrecondition, ResourceExhausted) as e:
-            print(f"{type(e).__name__} occurred, retrying in {2**retries} seconds...")
-            time.sleep(2**retries)
-            retries += 1
-
-
-# Save model outputs to a JSON file
-with open('model_outputs.json', 'w') as f:
-    print(f'Dumping data into file')
-    json.dump(model_outputs, f)
-    print(f'Done dumping data into file')
+            self.genai.get_file(name=name)
+            return True
+        except Exception:
+            return False
+
+    def generate(self, name, prompt):
+        response = self.model.generate_content([prompt, self.genai.get_file(name=name)])
+        return response.text if response else None
+
+
+class RetryLimitExceeded(Exception):
+    pass
+
+
+class Backoff:
+    # Exponential backoff with jitter, shared by all workers. A rate limit
+    # pushes back the time every worker may next call the API, not just the
+    # one that hit it.
+    def __init__(self, base=1.0, cap=60.0, max_retries=6):
+        self.base = base
+        self.cap = cap
+        self.max_retries = max_retries
+        self.resume_at = 0.0
+
+    def delay(self, attempt):
+        return random.uniform(0.5, 1.0) * min(self.cap, self.base * 2 ** attempt)
+
+    async def ready(self):
+        while (wait := self.resume_at - time.monotonic()) > 0:
+            await asyncio.sleep(wait)
+
+    async def retry(self, attempt, error, shared):
+        if attempt >= self.max_retries:
+            raise RetryLimitExceeded(f'Gave up after {attempt} retries: {error}')
+        delay = self.delay(attempt)
+        print(f'{type(error).__name__} occurred, retrying in {delay:.1f} seconds...')
+        if shared:
+            self.resume_at = max(self.resume_at, time.monotonic() + delay)
+            await self.ready()
+        else:
+            await asyncio.sleep(delay)
+
+
+class Checkpoint:
+    # model_outputs.jsonl holds one labelled video per line and is the source
+    # of truth for what is done. processing_state.json maps uploaded but not
+    # yet labelled videos to their uploaded file, so a re-run doesn't upload
+    # them again.
+    def __init__(self, out_dir):
+        self.outputs_path = os.path.join(out_dir, 'model_outputs.jsonl')
+        self.state_path = os.path.join(out_dir, 'processing_state.json')
+        self.outputs = {}
+        self.processing = {}
+        if os.path.exists(self.outputs_path):
+            self.outputs = load_flows(self.outputs_path)
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                self.processing = json.load(f)
+
+    def uploaded(self, video, name):
+        self.processing[video] = {'name': name, 'uploaded_at': time.time()}
+        self._save_state()
+
+    def forget_upload(self, video):
+        if self.processing.pop(video, None) is not None:
+            self._save_state()
+
+    def labelled(self, video, output):
+        with open(self.outputs_path, 'a') as f:
+            f.write(json.dumps({'video': video, 'output': output}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.outputs[video] = output
+        self.forget_upload(video)
+
+    def _save_state(self):
+        tmp = self.state_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.processing, f)
+        os.replace(tmp, self.state_path)
+
+
+class LabellingPipeline:
+    # Long videos stay PROCESSING for minutes after upload. That is polled
+    # every poll_interval for up to processing_timeout seconds, apart from
+    # the retry budget for errors.
+    def __init__(
+        self,
+        api,
+        data_dir,
+        out_dir,
+        uploads=3,
+        generations=2,
+        backoff=None,
+        prompt=train_prompt,
+        poll_interval=5.0,
+        processing_timeout=900.0,
+    ):
+        self.api = api
+        self.data_dir = data_dir
+        self.prompt = prompt
+        self.checkpoint = Checkpoint(out_dir)
+        self.upload_slots = asyncio.Semaphore(uploads)
+        self.generate_slots = asyncio.Semaphore(generations)
+        self.backoff = backoff or Backoff()
+        self.poll_interval = poll_interval
+        self.processing_timeout = processing_timeout
+        self.failed = {}
+
+    async def call(self, fn, *args):
+        # Runs a blocking API call in a thread, retrying per the shared backoff
+        attempt = 0
+        while True:
+            await self.backoff.ready()
+            try:
+                return await asyncio.to_thread(fn, *args)
+            except self.api.retryable_errors as e:
+                await self.backoff.retry(attempt, e, shared=isinstance(e, self.api.rate_limit_errors))
+                attempt += 1
+
+    async def upload(self, video):
+        state = self.checkpoint.processing.get(video)
+        if state and await asyncio.to_thread(self.api.exists, state['name']):
+            print(f'Reusing uploaded file for: {video}')
+            return state['name']
+        async with self.upload_slots:
+            print(f'Uploading file: {video}')
+            name = await self.call(self.api.upload, os.path.join(self.data_dir, video), video)
+        self.checkpoint.uploaded(video, name)
+        print(f'Done uploading file: {video}')
+        return name
+
+    async def wait_until_active(self, video, name):
+        deadline = time.monotonic() + self.processing_timeout
+        while True:
+            state = await self.call(self.api.state, name)
+            if state == 'ACTIVE':
+                return
+            if state == 'FAILED':
+                raise RuntimeError(f'Gemini could not process {video}')
+            if time.monotonic() >= deadline:
+                raise RetryLimitExceeded(f'{video} still processing after {self.processing_timeout:.0f} seconds')
+            await asyncio.sleep(self.poll_interval)
+
+    async def label(self, video, name):
+        attempt = 0
+        async with self.generate_slots:
+            while True:
+                print(f'Calling LLM for file: {video}')
+                text = await self.call(self.api.generate, name, self.prompt)
+                if text:
+                    try:
+                        return parse_model_output(text)
+                    except json.JSONDecodeError as e:
+                        print("Invalid JSON response received.")
+                        error = e
+                else:
+                    error = ValueError('Empty response')
+                await self.backoff.retry(attempt, error, shared=False)
+                attempt += 1
+
+    async def process(self, video):
+        try:
+            name = await self.upload(video)
+            await self.wait_until_active(video, name)
+            output = await self.label(video, name)
+        except Exception as e:
+            # Recorded and left out of the checkpoint, so the next run retries
+            # it. The upload itself may be what failed (a FAILED file never
+            # turns ACTIVE), so that run uploads again; only a run stopped
+            # partway reuses its uploads.
+            self.checkpoint.forget_upload(video)
+            self.failed[video] = str(e)
+            print(f'Failed to label {video}: {e}')
+            return
+        self.checkpoint.labelled(video, output)
+        print(f'Done calling language model for the file: {video}')
+
+    async def run(self):
+        videos = sorted(f for f in os.listdir(self.data_dir) if f.endswith('.mov'))
+        pending = [v for v in videos if v not in self.checkpoint.outputs]
+        print(f'{len(videos) - len(pending)} of {len(videos)} videos already labelled')
+        await asyncio.gather(*(self.process(video) for video in pending))
+        return self.checkpoint.outputs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', default='./data')
+    parser.add_argument('--out', default='.')
+    parser.add_argument('--uploads', type=int, default=3, help='concurrent uploads')
+    parser.add_argument('--generations', type=int, default=2, help='concurrent generate calls')
+    parser.add_argument('--max-retries', type=int, default=6)
+    parser.add_argument('--poll-interval', type=float, default=5.0, help='seconds between processing checks')
+    parser.add_argument('--processing-timeout', type=float, default=900.0, help='seconds to wait for a video to process')
+    parser.add_argument('--stub', action='store_true', help='use the local stub API instead of Gemini')
+    args = parser.parse_args()
+
+    if args.stub:
+        from stub_api import StubGeminiAPI
+        api = StubGeminiAPI()
+    else:
+        api = GeminiAPI()
+    pipeline = LabellingPipeline(
+        api,
+        args.data,
+        args.out,
+        args.uploads,
+        args.generations,
+        Backoff(max_retries=args.max_retries),
+        poll_interval=args.poll_interval,
+        processing_timeout=args.processing_timeout,
+    )
+    model_outputs = asyncio.run(pipeline.run())
+
+    # Save model outputs to a JSON file, as before, for the existing consumers
+    with open(os.path.join(args.out, 'model_outputs.json'), 'w') as f:
+        print(f'Dumping data into file')
+        json.dump(model_outputs, f)
+        print(f'Done dumping data into file')
+    if pipeline.failed:
+        print(f'{len(pipeline.failed)} videos failed, re-run to retry them: {sorted(pipeline.failed)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from app.utils import codec
+from app.utils.custom_types import ConfigResponse, PingPongResponse, ResponseResponse
+
+# Encode/decode throughput of the Retell websocket events, the previous
+# send_json(event.__dict__) / iter_json() path against app.utils.codec.
+#   python utility_scripts/bench_codec.py --iterations 100000 --turns 40
+
+
+def transcript(turns):
+    return [
+        {"role": "agent" if i % 2 else "user", "content": f"utterance {i} about the product demo, could you show me?"}
+        for i in range(turns)
+    ]
+
+
+def outgoing_events():
+    return {
+        "response": ResponseResponse(response_id=12, content="Sure, let me ", content_complete=False, end_call=False),
+        "response_unicode": ResponseResponse(response_id=12, content="Café — sí ", content_complete=False, end_call=False),
+        "ping_pong": PingPongResponse(timestamp=1718000000000),
+        "config": ConfigResponse(config={"auto_reconnect": True, "call_details": True}),
+    }
+
+
+def incoming_frames(turns):
+    return {
+        "response_required": json.dumps(
+            {"interaction_type": "response_required", "response_id": 12, "transcript": transcript(turns)}
+        ),
+        "update_only": json.dumps({"interaction_type": "update_only", "transcript": transcript(turns)}),
+        "ping_pong": json.dumps({"interaction_type": "ping_pong", "timestamp": 1718000000000}),
+    }
+
+
+def legacy_encode(event):
+    # What Starlette's send_json (0.27, pinned through fastapi) does with event.__dict__
+    return json.dumps(event.__dict__, separators=(",", ":"))
+
+
+def legacy_decode(frame):
+    data = json.loads(frame)
+    return data["interaction_type"], data
+
+
+def rate(fn, arg, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(arg)
+    return iterations / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=100000)
+    parser.add_argument("--turns", type=int, default=40, help="transcript length of incoming frames")
+    args = parser.parse_args()
+
+    print(f"codec backend: {codec.BACKEND}")
+    print(f"{'encode':<20}{'legacy/s':>14}{'codec/s':>14}{'speedup':>10}")
+    for name, event in outgoing_events().items():
+        assert codec.encode_event(event).decode() == legacy_encode(event)
+        legacy = rate(legacy_encode, event, args.iterations)
+        fast = rate(codec.encode_event, event, args.iterations)
+        print(f"{name:<20}{legacy:>14,.0f}{fast:>14,.0f}{fast / legacy:>9.2f}x")
+
+    print(f"{'decode':<20}{'legacy/s':>14}{'codec/s':>14}{'speedup':>10}")
+    for name, frame in incoming_frames(args.turns).items():
+        legacy = rate(legacy_decode, frame, args.iterations)
+        fast = rate(codec.decode_request, frame, args.iterations)
+        print(f"{name:<20}{legacy:>14,.0f}{fast:>14,.0f}{fast / legacy:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../app/agent"))
+
+from flow_index import FlowIndex
+
+# Lookup latency of the flow retrieval index on synthetic flows, plus the
+# cost of an incremental add and of loading a snapshot.
+#   python utility_scripts/bench_flow_index.py --flows 20000 --lookups 1000
+
+VERBS = "create edit delete archive export import assign share invite merge close open".split()
+OBJECTS = (
+    "issue contact deal ticket email campaign report dashboard invoice task project sprint board "
+    "user team page form list workflow note"
+).split()
+
+
+def make_flows(n, rng):
+    flows = {}
+    for i in range(n):
+        verb, obj, tag = rng.choice(VERBS), rng.choice(OBJECTS), f"w{rng.randrange(3000)}"
+        flows[f"{verb.title()}{obj.title()}{tag.title()}{i}"] = [
+            {"action_type": "click", "element_type": "button", "element": f"{verb} {obj}", "value": "NA"},
+            {"action_type": "input", "element_type": "text entry", "element": f"{obj} title {tag}", "value": "x"},
+            {"action_type": "click", "element_type": "button", "element": "Save", "value": "NA"},
+        ]
+    return flows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--flows", type=int, default=20000)
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--snapshot", default="bench_flow_index.json")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    index = FlowIndex(min_score=0)
+    start = time.perf_counter()
+    index.sync(make_flows(args.flows, rng))
+    print(f"build {args.flows} flows: {time.perf_counter() - start:.2f}s")
+
+    # Half specific tasks, half using only common words (the slow case)
+    tasks = [
+        f"{rng.choice(VERBS)} a new {rng.choice(OBJECTS)} called w{rng.randrange(3000)}"
+        if i % 2
+        else f"{rng.choice(VERBS)} the {rng.choice(OBJECTS)}"
+        for i in range(args.lookups)
+    ]
+    index.lookup(tasks[0])
+    latencies = []
+    for task in tasks:
+        start = time.perf_counter()
+        index.lookup(task)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    print(
+        f"lookup: p50 {statistics.median(latencies):.3f} ms  "
+        f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.3f} ms  max {latencies[-1]:.3f} ms"
+    )
+
+    start = time.perf_counter()
+    index.add("CreateIssueBench", [{"action_type": "click", "element_type": "button", "element": "bench issue"}])
+    index.lookup("create bench issue")
+    print(f"incremental add + first lookup: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    index.save(args.snapshot)
+    start = time.perf_counter()
+    FlowIndex(min_score=0).load(args.snapshot)
+    print(f"snapshot load: {time.perf_counter() - start:.2f}s ({os.path.getsize(args.snapshot)} bytes)")
+    os.remove(args.snapshot)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../app/agent"))
+
+from playwright.async_api import async_playwright
+
+from utils import MARK_PAGE_CALL, MARK_PAGE_SCRIPT, MARK_PAGE_VERSION
+
+# Benchmarks the annotation step of the agent in headless Chromium, using the
+# script and call utils.mark_page ships.
+#   python utility_scripts/bench_mark_page.py injection --steps 50 --mutate
+#   python utility_scripts/bench_mark_page.py collect --sizes 1000 10000 50000
+
+MARK_PAGE_JS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../app/agent/mark_page.js")
+
+# One row's text changes between steps, as the page would after an action
+MUTATE = "(step) => { document.querySelector('.row a').textContent = 'link ' + step; }"
+
+
+def make_fixture(n_nodes):
+    # Rows of links, buttons, nested clickable cards and hidden panels,
+    # roughly n_nodes elements in total
+    rows = []
+    for i in range(max(1, n_nodes // 10)):
+        rows.append(
+            f'<div class="row"><a href="#{i}">link {i}</a>'
+            f'<button aria-label="button {i}">b{i}</button>'
+            f'<div style="cursor:pointer"><span>card {i}</span><button>inner</button></div>'
+            f'<div style="display:none"><button>hidden {i}</button></div>'
+            f'<input value="{i}"></div>'
+        )
+    return "<html><head></head><body>" + "".join(rows) + "</body></html>"
+
+
+# The querySelectorAll + pairwise contains() collection markPage used before
+# the single-pass collectItems(), kept here to check results stay identical.
+LEGACY_COLLECT = """
+() => {
+  var vw = Math.max(document.documentElement.clientWidth || 0, window.innerWidth || 0);
+  var vh = Math.max(document.documentElement.clientHeight || 0, window.innerHeight || 0);
+  function isVisible(element) {
+    const style = window.getComputedStyle(element);
+    const rect = element.getBoundingClientRect();
+    return style.display !== 'none' && style.visibility !== 'hidden' &&
+      parseFloat(style.opacity) > 0 && rect.width > 0 && rect.height > 0 &&
+      rect.top < vh && rect.bottom > 0 && rect.left < vw && rect.right > 0;
+  }
+  function isInteractable(element) {
+    const interactableTags = ['INPUT', 'TEXTAREA', 'SELECT', 'BUTTON', 'A'];
+    const style = window.getComputedStyle(element);
+    return interactableTags.includes(element.tagName) || element.onclick != null ||
+      style.cursor === 'pointer' || element.getAttribute('role') === 'button' ||
+      (element.tagName === 'DIV' && element.getAttribute('tabindex') === '0');
+  }
+  var items = Array.from(document.querySelectorAll('*'))
+    .filter(isVisible)
+    .filter(isInteractable)
+    .map(function (element) {
+      var rect = element.getBoundingClientRect();
+      return {
+        element: element, rect: rect, area: rect.width * rect.height,
+        text: element.textContent.trim().replace(/\\s{2,}/g, ' '),
+        type: element.tagName.toLowerCase(),
+        ariaLabel: element.getAttribute('aria-label') || '',
+      };
+    })
+    .filter((item) => item.area >= 20);
+  items = items.filter((item, index, self) => !self.some((other, otherIndex) =>
+    index !== otherIndex && other.element.contains(item.element) && isInteractable(other.element)));
+  return items;
+}
+"""
+
+SERIALIZE = """
+(items) => items.map((item) => [item.type, item.text, item.ariaLabel,
+  (item.rect.left + item.rect.right) / 2, (item.rect.top + item.rect.bottom) / 2])
+"""
+
+
+async def time_collector(page, collector, repeats):
+    timings = []
+    result = None
+    for _ in range(repeats):
+        timings.append(await page.evaluate(
+            f"""() => {{
+                const start = performance.now();
+                const items = ({collector})();
+                window.__benchItems = items;
+                return performance.now() - start;
+            }}"""
+        ))
+        result = await page.evaluate(f"({SERIALIZE})(window.__benchItems)")
+    return timings, result
+
+
+async def bench_collect(sizes, repeats):
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        page = await browser.new_page(viewport={"width": 1280, "height": 4000})
+        for n_nodes in sizes:
+            await page.set_content(make_fixture(n_nodes))
+            await page.evaluate(MARK_PAGE_SCRIPT)
+            n = await page.evaluate("document.querySelectorAll('*').length")
+            legacy, legacy_items = await time_collector(page, LEGACY_COLLECT, repeats)
+            walker, walker_items = await time_collector(
+                page, "() => collectItems(document.documentElement)", repeats
+            )
+            print(f"{n} nodes, {len(walker_items)} items, identical={legacy_items == walker_items}")
+            report("legacy", legacy)
+            report("treewalker", walker)
+        await browser.close()
+
+
+async def step_legacy(page):
+    # What utils.mark_page did before: read the file and re-evaluate it every step
+    with open(MARK_PAGE_JS) as f:
+        script = f.read()
+    await page.evaluate(script)
+    await page.evaluate("markPage()")
+    await page.evaluate("unmarkPage()")
+
+
+async def step_injected(page, last_id):
+    # Mirrors utils.mark_page: one round trip, re-inject only on a version
+    # miss, re-label only what changed since the last annotation
+    result = await page.evaluate(MARK_PAGE_CALL, [MARK_PAGE_VERSION, last_id])
+    if result is None:
+        await page.evaluate(MARK_PAGE_SCRIPT)
+        result = await page.evaluate("(lastId) => markPageIncremental(lastId)", last_id)
+    if result["mode"] != "clean":
+        await page.evaluate("unmarkPage()")
+    return result
+
+
+async def time_steps(step, steps):
+    timings = []
+    for _ in range(steps):
+        start = time.perf_counter()
+        await step()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(name, timings):
+    print(
+        f"{name:<12} median {statistics.median(timings):8.2f}ms  "
+        f"mean {statistics.mean(timings):8.2f}ms  max {max(timings):8.2f}ms"
+    )
+
+
+async def bench_injection(steps, n_nodes, mutate):
+    fixture = make_fixture(n_nodes)
+    modes = Counter()
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+
+        legacy_page = await browser.new_page()
+        await legacy_page.set_content(fixture)
+        count = iter(range(steps))
+
+        async def legacy_step():
+            if mutate:
+                await legacy_page.evaluate(MUTATE, next(count))
+            await step_legacy(legacy_page)
+
+        legacy = await time_steps(legacy_step, steps)
+
+        context = await browser.new_context()
+        await context.add_init_script(script=MARK_PAGE_SCRIPT)
+        injected_page = await context.new_page()
+        await injected_page.set_content(fixture)
+        count = iter(range(steps))
+        last_id = None
+
+        async def injected_step():
+            nonlocal last_id
+            if mutate:
+                await injected_page.evaluate(MUTATE, next(count))
+            result = await step_injected(injected_page, last_id)
+            last_id = result["id"]
+            modes[result["mode"]] += 1
+
+        injected = await time_steps(injected_step, steps)
+
+        await browser.close()
+
+    print(f"{steps} annotation steps on a ~{n_nodes}-node page{', one row changed per step' if mutate else ''}")
+    report("legacy", legacy)
+    report("injected", injected)
+    print(f"injected modes: {dict(modes)}")
+    saved = statistics.median(legacy) - statistics.median(injected)
+    print(f"saved per step: {saved:.2f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    injection = subparsers.add_parser("injection")
+    injection.add_argument("--steps", type=int, default=50)
+    injection.add_argument("--nodes", type=int, default=1000)
+    injection.add_argument("--mutate", action="store_true", help="change one row between steps")
+    collect = subparsers.add_parser("collect")
+    collect.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    collect.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    if args.command == "injection":
+        asyncio.run(bench_injection(args.steps, args.nodes, args.mutate))
+    else:
+        asyncio.run(bench_collect(args.sizes, args.repeats))
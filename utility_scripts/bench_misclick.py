@@ -0,0 +1,169 @@
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../app/agent"))
+
+from playwright.async_api import async_playwright
+
+from tools import RESOLVE_CALL
+from utils import MARK_PAGE_SCRIPT
+
+# Mis-click rate of acting on a label at its annotated coordinates versus
+# through the element registry (markPageResolve), on a local fixture whose
+# layout changes between the annotation and the action, as it does while the
+# LLM is thinking. A failed attempt is recovered the way the agent would: a
+# new annotation, then the same target again under its new label.
+#   python utility_scripts/bench_misclick.py --trials 40
+
+ROWS = 30
+MAX_RECOVERY_STEPS = 3
+
+
+def make_fixture():
+    rows = "".join(
+        f'<div class="row" style="height:40px"><span>row {i}</span>'
+        f'<button aria-label="target {i}" onclick="window.__clicked = {i}">do {i}</button></div>'
+        for i in range(ROWS)
+    )
+    return (
+        '<html><head></head><body style="margin:0">'
+        f'<div id="rows">{rows}</div><div style="height:2000px"></div></body></html>'
+    )
+
+
+# What the page does between the annotation and the action
+SCENARIOS = {
+    "none": "",
+    # A banner or lazily loaded image pushes everything down
+    "banner": """
+        const banner = document.createElement('div');
+        banner.style.height = '120px';
+        document.body.prepend(banner);
+    """,
+    # A list re-sorted under the cursor
+    "reorder": """
+        const rows = document.getElementById('rows');
+        rows.append(...Array.from(rows.children).reverse());
+    """,
+    # The page scrolled on its own (focus, scroll restoration)
+    "scroll": "window.scrollBy(0, 250);",
+    # A framework re-render: identical markup, new elements
+    "rerender": """
+        const rows = document.getElementById('rows');
+        rows.innerHTML = rows.innerHTML;
+    """,
+    # A toast covering the page for a moment
+    "toast": """
+        const toast = document.createElement('div');
+        toast.style.cssText = 'position:fixed;inset:0;z-index:10;background:rgba(0,0,0,0.1)';
+        document.body.appendChild(toast);
+        setTimeout(() => toast.remove(), 200);
+    """,
+}
+
+
+async def annotate(page):
+    boxes = await page.evaluate("markPage()")
+    mark_id = await page.evaluate("window.__markPageId")
+    await page.evaluate("unmarkPage()")
+    return boxes, mark_id
+
+
+def label_of(boxes, target):
+    for label, box in enumerate(boxes):
+        if box and box["ariaLabel"] == f"target {target}":
+            return label
+    return None
+
+
+async def act(page, mode, boxes, mark_id, label):
+    # Returns "clicked" or "reported" (stale or obscured, nothing clicked)
+    if mode == "coordinates":
+        x, y = boxes[label]["x"], boxes[label]["y"]
+    else:
+        resolved = await page.evaluate(RESOLVE_CALL, [label, mark_id])
+        if resolved["status"] != "ok":
+            return "reported"
+        x, y = resolved["x"], resolved["y"]
+    await page.mouse.click(x, y)
+    return "clicked"
+
+
+async def trial(page, script, mode, scenario, rng):
+    await page.set_content(make_fixture())
+    await page.evaluate(script)
+    boxes, mark_id = await annotate(page)
+    labels = [label for label, box in enumerate(boxes) if box and box["ariaLabel"].startswith("target ")]
+    label = rng.choice(labels)
+    target = int(boxes[label]["ariaLabel"].split()[1])
+
+    await page.evaluate(f"() => {{ {SCENARIOS[scenario]} }}")
+    result = {"misclicks": 0, "reported": 0, "recovery_steps": 0, "done": False}
+    for step in range(MAX_RECOVERY_STEPS + 1):
+        if step:
+            # The agent's next step: the page settles, a new annotation, the same target
+            result["recovery_steps"] += 1
+            await asyncio.sleep(0.25)
+            boxes, mark_id = await annotate(page)
+            label = label_of(boxes, target)
+            if label is None:
+                await page.evaluate(f"document.querySelector('[aria-label=\"target {target}\"]').scrollIntoView()")
+                continue
+        await page.evaluate("window.__clicked = null")
+        outcome = await act(page, mode, boxes, mark_id, label)
+        if outcome == "reported":
+            result["reported"] += 1
+            continue
+        if await page.evaluate("window.__clicked") == target:
+            result["done"] = True
+            break
+        result["misclicks"] += 1
+    return result
+
+
+async def bench(trials, seed):
+    script = MARK_PAGE_SCRIPT
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        page = await browser.new_page(viewport={"width": 1280, "height": 800})
+        print(f"{trials} trials per scenario, recovery capped at {MAX_RECOVERY_STEPS} steps")
+        print(f"{'scenario':<10} {'mode':<12} {'mis-click':>9} {'reported':>9} {'recovery':>9} {'failed':>7}")
+        totals = {}
+        for scenario in SCENARIOS:
+            for mode in ("coordinates", "registry"):
+                rng = random.Random(seed)
+                start = time.perf_counter()
+                results = [await trial(page, script, mode, scenario, rng) for _ in range(trials)]
+                elapsed = (time.perf_counter() - start) / trials
+                misclick_rate = sum(r["misclicks"] > 0 for r in results) / trials
+                reported_rate = sum(r["reported"] > 0 for r in results) / trials
+                recovery = statistics.mean(r["recovery_steps"] for r in results)
+                failed = sum(not r["done"] for r in results)
+                print(
+                    f"{scenario:<10} {mode:<12} {misclick_rate:>8.0%} {reported_rate:>9.0%} "
+                    f"{recovery:>9.2f} {failed:>7}  ({elapsed * 1000:.0f} ms/trial)"
+                )
+                total = totals.setdefault(mode, {"misclicks": 0, "recovery": 0})
+                total["misclicks"] += sum(r["misclicks"] for r in results)
+                total["recovery"] += sum(r["recovery_steps"] for r in results)
+        await browser.close()
+
+    runs = trials * len(SCENARIOS)
+    for mode, total in totals.items():
+        print(
+            f"{mode}: {total['misclicks']} mis-clicks in {runs} actions, "
+            f"{total['recovery'] / runs:.2f} recovery steps per action"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trials", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(bench(args.trials, args.seed))
@@ -0,0 +1,164 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "../app/agent"))
+
+from openai import AsyncOpenAI
+
+from clients import Clients
+
+# Load test of the shared clients against local stand-in servers, no real
+# API traffic. Compares a fresh AsyncOpenAI client per call (the old
+# LlmClient behaviour) with the shared pool, and a sync SDK call made inline
+# (the old register-call route) with one offloaded through Clients.run_sync.
+#   python utility_scripts/load_test_clients.py --requests 500 --concurrency 50 --latency 50
+
+COMPLETION = {
+    "id": "chatcmpl-local",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-4o",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+}
+
+
+class StandInOpenAI:
+    # Minimal keep-alive HTTP/1.1 server answering every request with a chat
+    # completion after a fixed latency, counting the connections it accepts
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.connections = 0
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}/v1"
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _serve(self, reader, writer):
+        self.connections += 1
+        body = json.dumps(COMPLETION).encode()
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                await reader.readexactly(length)
+                await asyncio.sleep(self.latency)
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(body)}\r\n\r\n".encode()
+                    + body
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def run_load(call, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return time.perf_counter() - start, latencies
+
+
+async def measure_loop_lag(stop: asyncio.Event, interval: float = 0.005):
+    # Longest the event loop went without running this task
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+
+def report(name, elapsed, latencies, extra=""):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{name:<24}{len(latencies) / elapsed:>10.1f} req/s  p50 {statistics.median(latencies) * 1000:>7.1f} ms"
+        f"  p95 {p95 * 1000:>7.1f} ms  {extra}"
+    )
+
+
+async def openai_load(args):
+    server = StandInOpenAI(args.latency / 1000)
+    base_url = await server.start()
+    messages = [{"role": "user", "content": "hi"}]
+
+    async def per_call():
+        async with AsyncOpenAI(api_key="local", base_url=base_url) as client:
+            await client.chat.completions.create(model="gpt-4o", messages=messages)
+
+    clients = Clients(max_connections=args.concurrency, max_keepalive=args.concurrency)
+    shared = AsyncOpenAI(api_key="local", base_url=base_url, http_client=clients.http)
+
+    async def shared_call():
+        await shared.chat.completions.create(model="gpt-4o", messages=messages)
+
+    for name, call in (("openai per-call client", per_call), ("openai shared pool", shared_call)):
+        before = server.connections
+        elapsed, latencies = await run_load(call, args.requests, args.concurrency)
+        report(name, elapsed, latencies, f"{server.connections - before} connections")
+    await clients.stop()
+    await server.stop()
+
+
+async def sync_sdk_load(args):
+    # Stand-in for retell.call.create_web_call: a blocking HTTP round trip
+    def blocking_call():
+        time.sleep(args.latency / 1000)
+
+    async def inline():
+        blocking_call()
+
+    clients = Clients(sync_workers=args.sync_workers)
+
+    async def offloaded():
+        await clients.run_sync(blocking_call)
+
+    for name, call in (("sync SDK inline", inline), ("sync SDK run_sync", offloaded)):
+        stop = asyncio.Event()
+        lag = asyncio.create_task(measure_loop_lag(stop))
+        elapsed, latencies = await run_load(call, args.requests // 10 or 1, args.concurrency)
+        stop.set()
+        stall = await lag
+        report(name, elapsed, latencies, f"max loop stall {stall * 1000:.1f} ms")
+    await clients.stop()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=50, help="stand-in server latency in ms")
+    parser.add_argument("--sync-workers", type=int, default=8)
+    args = parser.parse_args()
+    await openai_load(args)
+    await sync_sdk_load(args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())